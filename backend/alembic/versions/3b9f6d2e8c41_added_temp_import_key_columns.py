@@ -0,0 +1,73 @@
+"""added temp_import key columns and import join indexes
+
+Revision ID: 3b9f6d2e8c41
+Revises: 6e2c9b4d7a15
+Create Date: 2026-10-17 19:14:51.082631
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9f6d2e8c41'
+down_revision: Union[str, None] = '6e2c9b4d7a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# typed join keys of the staged lap pembelian import
+KEY_COLUMNS = [
+    ('product_name', sa.String()),
+    ('supplier_code', sa.String()),
+    ('no_bukti', sa.String()),
+    ('tanggal', sa.Date()),
+]
+
+
+def upgrade() -> None:
+    # temp_import was created outside the migrations so far (metadata.create_all):
+    # create it where it is missing, otherwise only add the key columns
+    if not sa.inspect(op.get_bind()).has_table('temp_import'):
+        op.create_table('temp_import',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('session_id', sa.UUID(), nullable=False),
+        sa.Column('sheet_name', sa.String(), nullable=True),
+        sa.Column('table_target', sa.String(), nullable=True),
+        sa.Column('row_number', sa.Integer(), nullable=True),
+        sa.Column('raw_data', sa.JSON(), nullable=True),
+        sa.Column('parsed_data', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('reason', sa.Text(), nullable=True),
+        *(sa.Column(name, type_, nullable=True) for name, type_ in KEY_COLUMNS),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('temp_import')}
+        for name, type_ in KEY_COLUMNS:
+            if name not in existing:
+                op.add_column('temp_import', sa.Column(name, type_, nullable=True))
+    op.create_index('ix_temp_import_session_id_table_target', 'temp_import', ['session_id', 'table_target'], unique=False,
+                    if_not_exists=True)
+
+    # CONCURRENTLY so products / purchasings stay writable while the indexes build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_products_upper_name', 'products', [sa.text('upper(name)')], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_purchasings_supplier_id_code', 'purchasings', ['supplier_id', 'code'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_purchasings_supplier_id_date', 'purchasings', ['supplier_id', 'date'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_purchasings_supplier_id_date', table_name='purchasings')
+    op.drop_index('ix_purchasings_supplier_id_code', table_name='purchasings')
+    op.drop_index('ix_products_upper_name', table_name='products')
+    op.drop_index('ix_temp_import_session_id_table_target', table_name='temp_import')
+    # temp_import itself is kept, it predates this migration
+    for name, _ in reversed(KEY_COLUMNS):
+        op.drop_column('temp_import', name)
@@ -0,0 +1,36 @@
+"""added unique index to product_avg_cost view
+
+Revision ID: c5a81f4e6d27
+Revises: 9b7d3e5f2a18
+Create Date: 2025-11-12 14:03:52.660127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a81f4e6d27'
+down_revision: Union[str, None] = '9b7d3e5f2a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # product_avg_cost is created from app/sql/product_avg_cost_view.sql, not by alembic,
+    # so only add the index when the view already exists.
+    # Needed for REFRESH MATERIALIZED VIEW CONCURRENTLY.
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'product_avg_cost') THEN
+                CREATE UNIQUE INDEX IF NOT EXISTS ux_product_avg_cost_product_id ON product_avg_cost (product_id);
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ux_product_avg_cost_product_id")
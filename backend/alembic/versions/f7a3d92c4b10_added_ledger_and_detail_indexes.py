@@ -0,0 +1,63 @@
+"""added ledger and detail indexes
+
+Revision ID: f7a3d92c4b10
+Revises: e1f4c8a2b963
+Create Date: 2025-11-14 11:37:45.502871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a3d92c4b10'
+down_revision: Union[str, None] = 'e1f4c8a2b963'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns)
+BTREE_INDEXES = [
+    # detail -> header / product joins
+    ('ix_purchasing_details_purchasing_id', 'purchasing_details', ['purchasing_id']),
+    ('ix_purchasing_details_product_id', 'purchasing_details', ['product_id']),
+    ('ix_stock_movement_details_stock_movement_id', 'stock_movement_details', ['stock_movement_id']),
+    ('ix_stock_movement_details_product_id', 'stock_movement_details', ['product_id']),
+    ('ix_color_kitchen_batch_details_batch_id', 'color_kitchen_batch_details', ['batch_id']),
+    ('ix_color_kitchen_batch_details_product_id', 'color_kitchen_batch_details', ['product_id']),
+    ('ix_color_kitchen_entries_batch_id', 'color_kitchen_entries', ['batch_id']),
+    ('ix_color_kitchen_entries_design_id', 'color_kitchen_entries', ['design_id']),
+    ('ix_color_kitchen_entry_details_color_kitchen_entry_id', 'color_kitchen_entry_details', ['color_kitchen_entry_id']),
+    ('ix_color_kitchen_entry_details_product_id', 'color_kitchen_entry_details', ['product_id']),
+    ('ix_stock_opname_details_stock_opname_id', 'stock_opname_details', ['stock_opname_id']),
+    ('ix_stock_opname_details_product_id', 'stock_opname_details', ['product_id']),
+    # header date range filters
+    ('ix_purchasings_date', 'purchasings', ['date']),
+    ('ix_stock_movements_date', 'stock_movements', ['date']),
+    ('ix_color_kitchen_batches_date', 'color_kitchen_batches', ['date']),
+    ('ix_color_kitchen_entries_date', 'color_kitchen_entries', ['date']),
+    ('ix_stock_opnames_date', 'stock_opnames', ['date']),
+    # ledger sync predicate
+    ('ix_ledgers_ref_ref_code_product_id_location', 'ledgers', ['ref', 'ref_code', 'product_id', 'location']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY so existing tables stay writable while the indexes build;
+    # it cannot run inside a transaction, hence the autocommit block.
+    with op.get_context().autocommit_block():
+        for name, table, columns in BTREE_INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+        op.create_index('ix_ledgers_product_id_location', 'ledgers', ['product_id', 'location'], unique=False,
+                        postgresql_include=['quantity_in', 'quantity_out'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_ledgers_date_brin', 'ledgers', ['date'], unique=False,
+                        postgresql_using='brin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ledgers_date_brin', table_name='ledgers')
+    op.drop_index('ix_ledgers_product_id_location', table_name='ledgers')
+    for name, table, _ in reversed(BTREE_INDEXES):
+        op.drop_index(name, table_name=table)
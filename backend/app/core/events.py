@@ -1,318 +1,536 @@
-from sqlalchemy import event
-from app.models import (PurchasingDetail, Purchasing, 
+from sqlalchemy import event, select, tuple_, values, column, case, cast, literal, Integer, String, DateTime, Numeric, Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy import inspect as sa_inspect
+from app.models import (PurchasingDetail, Purchasing,
                        StockMovement, StockMovementDetail,
                        ColorKitchenEntry, ColorKitchenEntryDetail,
                        ColorKitchenBatch, ColorKitchenBatchDetail,
-                       Ledger)
+                       StockOpnameDetail, Ledger)
 from app.models.enum.ledger_enum import LedgerRef, LedgerLocation
 from app.utils.event_flags import should_skip_cost_cache_updates
-from app.utils.cost_helper import update_avg_cost_for_products
-
-#region Purchasing
-def _get_purchasing(connection, purchasing_id):
-    return connection.execute(
-        Purchasing.__table__.select().where(Purchasing.id == purchasing_id)
-    ).fetchone()
-
-
-@event.listens_for(PurchasingDetail, "after_insert")
-def create_ledger_entry(mapper, connection, target):
-    # if not should_skip_cost_cache_updates():
-    update_avg_cost_for_products(connection, [target.product_id])
-    
-    purchasing = _get_purchasing(connection, target.purchasing_id)
-    if not purchasing:
-        return
-    
-
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=purchasing.date,
-            ref=LedgerRef.Purchasing.value,
-            ref_code=purchasing.code or "",
-            location=LedgerLocation.Gudang.value,
-            quantity_in=target.quantity or 0.0,
-            quantity_out=0.0,
-            product_id=target.product_id,
+from app.utils.cost_helper import (add_avg_cost_delta, flush_avg_cost_updates, defer_avg_cost_updates,
+                                   discard_avg_cost_updates)
+from app.core.scheduler import product_avg_cost_refresher
+from app.utils.stock_helper import add_stock_delta, apply_stock_deltas, STOCK_DELTA_KEY
+from app.utils.rollup_helper import mark_rollup_day, mark_rollup_header, flush_daily_rollups, ROLLUP_DIRTY_KEY
+from app.utils.datatable.count import list_count_cache, note_written_tables, WRITTEN_TABLES_KEY
+
+# Ledger rows are derived from detail rows. Instead of writing one ledger row per
+# detail inside every mapper event, the mapper events only *collect* the affected
+# details into session.info and the whole batch is written once per flush:
+#   - headers (date/code) are read once per flush
+#   - one DELETE / UPDATE / INSERT per document type
+LEDGER_SYNC_KEY = "ledger_sync"
+# (header class, id) -> (date, code) of headers deleted in the current flush
+LEDGER_DELETED_HEADERS_KEY = "ledger_deleted_headers"
+
+#region Ledger specs
+# legs: (location, direction) — every detail produces one ledger row per leg
+LEDGER_SPECS = {
+    PurchasingDetail: {
+        "header": Purchasing,
+        "header_fk": "purchasing_id",
+        "ref": LedgerRef.Purchasing,
+        "legs": ((LedgerLocation.Gudang, "in"),),
+        "updates_cost_cache": True,
+    },
+    StockMovementDetail: {
+        "header": StockMovement,
+        "header_fk": "stock_movement_id",
+        "ref": LedgerRef.StockMovement,
+        # OUT from Gudang, IN into Kitchen
+        "legs": ((LedgerLocation.Gudang, "out"), (LedgerLocation.Kitchen, "in")),
+        "updates_cost_cache": False,
+    },
+    ColorKitchenEntryDetail: {
+        "header": ColorKitchenEntry,
+        "header_fk": "color_kitchen_entry_id",
+        "ref": LedgerRef.Ck,
+        # Kitchen OUT, Usage IN
+        "legs": ((LedgerLocation.Kitchen, "out"), (LedgerLocation.Usage, "in")),
+        "updates_cost_cache": False,
+    },
+    ColorKitchenBatchDetail: {
+        "header": ColorKitchenBatch,
+        "header_fk": "batch_id",
+        "ref": LedgerRef.Ck,
+        # Kitchen OUT, Usage IN
+        "legs": ((LedgerLocation.Kitchen, "out"), (LedgerLocation.Usage, "in")),
+        "updates_cost_cache": False,
+    },
+}
+#endregion Ledger specs
+
+#region Collector
+def _pending(session):
+    return session.info.setdefault(LEDGER_SYNC_KEY, {})
+
+
+def _snapshot_header(session, spec, header_id):
+    """
+    Read date/code of a header already present in the identity map (no SQL).
+    Deleted headers are still there while their details are being deleted,
+    so this is what keeps cascade deletes working after the header row is gone.
+    """
+    header = session.identity_map.get(identity_key(spec["header"], header_id))
+    if header is None:
+        return None
+
+    loaded = sa_inspect(header).dict
+    if "date" not in loaded or "code" not in loaded:
+        return None
+    return (loaded["date"], loaded["code"])
+
+
+def _old_value(state, attr):
+    """Value before the pending change (current value when unchanged)."""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.obj(), attr)
+
+
+def _cost_totals(product_id, quantity, price, ppn, pph):
+    qty = float(quantity or 0)
+    price = float(price or 0)
+    return product_id, qty, qty * price, qty * (price + float(ppn or 0) - float(pph or 0))
+
+
+def _purchasing_of(session, purchasing_id) -> dict:
+    """Purchase a cost delta belongs to: its date when the header is loaded, else its id."""
+    snapshot = _snapshot_header(session, LEDGER_SPECS[PurchasingDetail], purchasing_id)
+    if snapshot is not None:
+        return {"purchasing_date": snapshot[0]}
+    return {"purchasing_id": purchasing_id}
+
+
+def _collect_cost_delta(session, kind, target):
+    """
+    Queue the change of the avg cost running totals:
+    insert adds, delete subtracts, update subtracts the old row and adds the new one.
+    """
+    if kind in ("update", "delete"):
+        state = sa_inspect(target)
+        pid, qty, value, value_ppn = _cost_totals(
+            *(_old_value(state, attr) for attr in ("product_id", "quantity", "price", "ppn", "pph"))
         )
-    )
-
+        add_avg_cost_delta(session, pid, -qty, -value, -value_ppn,
+                           **_purchasing_of(session, _old_value(state, "purchasing_id")))
 
-@event.listens_for(PurchasingDetail, "after_update")
-def update_ledger_entry(mapper, connection, target):
-    # if not should_skip_cost_cache_updates():
-    update_avg_cost_for_products(connection, [target.product_id])
-    
-    purchasing = _get_purchasing(connection, target.purchasing_id)
-    if not purchasing:
-        return
-
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.Purchasing.value)
-        .where(Ledger.ref_code == (purchasing.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .values(
-            date=purchasing.date,
-            quantity_in=target.quantity or 0.0,
+    if kind in ("insert", "update"):
+        pid, qty, value, value_ppn = _cost_totals(
+            target.product_id, target.quantity, target.price, target.ppn, target.pph
         )
-    )
-
+        add_avg_cost_delta(session, pid, qty, value, value_ppn, **_purchasing_of(session, target.purchasing_id))
 
-@event.listens_for(PurchasingDetail, "after_delete")
-def delete_ledger_entry(mapper, connection, target):
-    # if not should_skip_cost_cache_updates():
-    update_avg_cost_for_products(connection, [target.product_id])
 
-    purchasing = _get_purchasing(connection, target.purchasing_id)
-    if not purchasing:
+def _collect(kind, target):
+    session = object_session(target)
+    if session is None:
         return
 
-    connection.execute(
-        Ledger.__table__.delete()
-        .where(Ledger.ref == LedgerRef.Purchasing.value)
-        .where(Ledger.ref_code == (purchasing.code or ""))
-        .where(Ledger.product_id == target.product_id)
+    spec = LEDGER_SPECS[type(target)]
+    header_id = getattr(target, spec["header_fk"])
+
+    old_product_id = target.product_id
+    if kind == "update":
+        history = sa_inspect(target).attrs.product_id.history
+        if history.deleted:
+            old_product_id = history.deleted[0]
+
+    bucket = _pending(session).setdefault(
+        type(target), {"insert": [], "update": [], "delete": [], "headers": {}}
     )
-#endregion Purchasing
-
-#region Stock Movement
-def _get_stock_movement(connection, stock_movement_id):
-    return connection.execute(
-        StockMovement.__table__.select().where(StockMovement.id == stock_movement_id)
-    ).fetchone()
-
-@event.listens_for(StockMovementDetail, "after_insert")
-def create_ledger_from_stock_movement(mapper, connection, target):
-    movement = _get_stock_movement(connection, target.stock_movement_id)
-    if not movement:
+    bucket[kind].append({
+        "header_id": header_id,
+        "product_id": target.product_id,
+        "old_product_id": old_product_id,
+        "quantity": target.quantity or 0.0,
+    })
+
+    if header_id not in bucket["headers"]:
+        bucket["headers"][header_id] = _snapshot_header(session, spec, header_id)
+
+    if spec["updates_cost_cache"]:
+        _collect_cost_delta(session, kind, target)
+
+
+def _register_collectors(detail_cls):
+    @event.listens_for(detail_cls, "after_insert")
+    def _after_insert(mapper, connection, target):
+        _collect("insert", target)
+
+    @event.listens_for(detail_cls, "after_update")
+    def _after_update(mapper, connection, target):
+        _collect("update", target)
+
+    @event.listens_for(detail_cls, "after_delete")
+    def _after_delete(mapper, connection, target):
+        _collect("delete", target)
+
+
+def _snapshot_deleted_header(mapper, connection, target):
+    """
+    Keep date/code of a header being deleted for the writer: after the flush
+    its row is gone, so _load_headers could not read them any more.
+    before_delete: the row is still there if they have to be loaded.
+    """
+    session = object_session(target)
+    if session is None:
+        return
+    deleted = session.info.setdefault(LEDGER_DELETED_HEADERS_KEY, {})
+    deleted[(mapper.class_, target.id)] = (target.date, target.code)
+
+
+for _detail_cls in LEDGER_SPECS:
+    _register_collectors(_detail_cls)
+
+for _header_cls in {spec["header"] for spec in LEDGER_SPECS.values()}:
+    event.listen(_header_cls, "before_delete", _snapshot_deleted_header)
+#endregion Collector
+
+#region Writer
+def _load_headers(connection, spec, headers, deleted_headers):
+    """
+    Fill in headers that were not in the identity map: from the snapshots of
+    headers deleted in this flush, the others with a single SELECT.
+    """
+    for hid, snap in headers.items():
+        if snap is None:
+            headers[hid] = deleted_headers.get((spec["header"], hid))
+
+    missing = [hid for hid, snap in headers.items() if snap is None]
+    if missing:
+        table = spec["header"].__table__
+        rows = connection.execute(
+            select(table.c.id, table.c.date, table.c.code).where(table.c.id.in_(missing))
+        ).fetchall()
+        for row in rows:
+            headers[row.id] = (row.date, row.code)
+
+    return {hid: snap for hid, snap in headers.items() if snap is not None}
+
+
+def _leg_quantities(quantity, direction):
+    if direction == "in":
+        return quantity, 0.0
+    return 0.0, quantity
+
+
+def _sync_deletes(connection, spec, headers, items, stock_deltas):
+    keys = {
+        ((headers[i["header_id"]][1] or ""), i["old_product_id"])
+        for i in items if i["header_id"] in headers
+    }
+    if not keys:
         return
 
-    # Row 1: OUT from Gudang
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=movement.date,
-            ref=LedgerRef.StockMovement.value,
-            ref_code=movement.code or "",
-            location=LedgerLocation.Gudang.value,
-            quantity_in=0.0,
-            quantity_out=target.quantity or 0.0,
-            product_id=target.product_id,
-        )
+    deleted = connection.execute(
+        Ledger.__table__.delete()
+        .where(Ledger.ref == spec["ref"].value)
+        .where(Ledger.location.in_([loc.value for loc, _ in spec["legs"]]))
+        .where(tuple_(Ledger.ref_code, Ledger.product_id).in_(list(keys)))
+        .returning(Ledger.product_id, Ledger.location, Ledger.quantity_in, Ledger.quantity_out)
     )
+    for product_id, location, quantity_in, quantity_out in deleted:
+        add_stock_delta(stock_deltas, product_id, location, -((quantity_in or 0) - (quantity_out or 0)))
 
-    # Row 2: IN into Kitchen
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=movement.date,
-            ref=LedgerRef.StockMovement.value,
-            ref_code=movement.code or "",
-            location=LedgerLocation.Kitchen.value,
-            quantity_in=target.quantity or 0.0,
-            quantity_out=0.0,
-            product_id=target.product_id,
-        )
-    )
 
-@event.listens_for(StockMovementDetail, "after_update")
-def update_ledger_from_stock_movement(mapper, connection, target):
-    movement = _get_stock_movement(connection, target.stock_movement_id)
-    if not movement:
+def _sync_updates(connection, spec, headers, items, stock_deltas):
+    rows = [
+        (headers[i["header_id"]][1] or "", i["old_product_id"], i["product_id"],
+         headers[i["header_id"]][0], i["quantity"])
+        for i in items if i["header_id"] in headers
+    ]
+    if not rows:
         return
 
-    # Update Gudang row
-    connection.execute(
+    v = values(
+        column("ref_code", String),
+        column("old_product_id", Integer),
+        column("product_id", Integer),
+        column("date", DateTime),
+        column("quantity", Numeric(18, 4)),
+        name="v",
+    ).data(rows)
+    # VALUES rows are sent as untyped binds: a column that is NULL on every row
+    # (headers without a date) would come out as text, so cast each one back
+    ref_code, old_product_id, product_id, date, quantity = (cast(c, c.type) for c in v.c)
+
+    in_locations = [loc.value for loc, direction in spec["legs"] if direction == "in"]
+    out_locations = [loc.value for loc, direction in spec["legs"] if direction == "out"]
+
+    quantity_in = case((Ledger.location.in_(in_locations), quantity), else_=0.0) if in_locations else literal(0.0)
+    quantity_out = case((Ledger.location.in_(out_locations), quantity), else_=0.0) if out_locations else literal(0.0)
+
+    # self-join: "old" still sees the row as it was before this UPDATE, for the stock balance delta
+    old = Ledger.__table__.alias("old")
+    updated = connection.execute(
         Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.StockMovement.value)
-        .where(Ledger.ref_code == (movement.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Gudang.value)
+        .where(old.c.id == Ledger.id)
+        .where(Ledger.ref == spec["ref"].value)
+        .where(Ledger.location.in_(in_locations + out_locations))
+        .where(Ledger.ref_code == ref_code)
+        .where(Ledger.product_id == old_product_id)
         .values(
-            date=movement.date,
-            quantity_in=0.0,
-            quantity_out=target.quantity or 0.0,
+            date=date,
+            product_id=product_id,
+            quantity_in=quantity_in,
+            quantity_out=quantity_out,
         )
-    )
-
-    # Update Kitchen row
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.StockMovement.value)
-        .where(Ledger.ref_code == (movement.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Kitchen.value)
-        .values(
-            date=movement.date,
-            quantity_in=target.quantity or 0.0,
-            quantity_out=0.0,
+        .returning(
+            old.c.product_id, old.c.location, old.c.quantity_in, old.c.quantity_out,
+            Ledger.product_id, Ledger.location, Ledger.quantity_in, Ledger.quantity_out,
         )
     )
-
-@event.listens_for(StockMovementDetail, "after_delete")
-def delete_ledger_from_stock_movement(mapper, connection, target):
-    movement = _get_stock_movement(connection, target.stock_movement_id)
-    if not movement:
+    for row in updated:
+        add_stock_delta(stock_deltas, row[0], row[1], -((row[2] or 0) - (row[3] or 0)))
+        add_stock_delta(stock_deltas, row[4], row[5], (row[6] or 0) - (row[7] or 0))
+
+
+def _sync_inserts(connection, spec, headers, items, stock_deltas):
+    rows = []
+    for i in items:
+        if i["header_id"] not in headers:
+            continue
+        date, code = headers[i["header_id"]]
+        for location, direction in spec["legs"]:
+            quantity_in, quantity_out = _leg_quantities(i["quantity"], direction)
+            rows.append({
+                "date": date,
+                "ref": spec["ref"].value,
+                "ref_code": code or "",
+                "location": location.value,
+                "quantity_in": quantity_in,
+                "quantity_out": quantity_out,
+                "product_id": i["product_id"],
+            })
+            add_stock_delta(stock_deltas, i["product_id"], location, quantity_in - quantity_out)
+
+    if rows:
+        connection.execute(Ledger.__table__.insert(), rows)
+
+
+def sync_ledgers(connection, pending, deleted_headers=None):
+    """
+    Write the ledger rows for every collected detail.
+    Order matters: deletes first, then updates, then inserts, so a detail
+    replaced within one flush (delete old + insert new) ends with the new row.
+
+    Returns the stock balance deltas of the written rows.
+    """
+    stock_deltas = {}
+    for detail_cls, bucket in pending.items():
+        spec = LEDGER_SPECS[detail_cls]
+        headers = _load_headers(connection, spec, bucket["headers"], deleted_headers or {})
+
+        _sync_deletes(connection, spec, headers, bucket["delete"], stock_deltas)
+        _sync_updates(connection, spec, headers, bucket["update"], stock_deltas)
+        _sync_inserts(connection, spec, headers, bucket["insert"], stock_deltas)
+
+    return stock_deltas
+
+
+@event.listens_for(Session, "before_flush")
+def _reset_ledger_sync(session, flush_context, instances):
+    # drop anything left behind by a flush that failed half-way
+    session.info.pop(LEDGER_SYNC_KEY, None)
+    session.info.pop(LEDGER_DELETED_HEADERS_KEY, None)
+    session.info.pop(STOCK_DELTA_KEY, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _write_ledger_sync(session, flush_context):
+    pending = session.info.pop(LEDGER_SYNC_KEY, None)
+    deleted_headers = session.info.pop(LEDGER_DELETED_HEADERS_KEY, None)
+    stock_deltas = session.info.pop(STOCK_DELTA_KEY, None) or {}
+
+    if pending:
+        for key, qty in sync_ledgers(session.connection(), pending, deleted_headers).items():
+            add_stock_delta(stock_deltas, *key, qty)
+
+    # stock_balances follows every ledger write of this flush
+    if stock_deltas:
+        apply_stock_deltas(session.connection(), stock_deltas)
+#endregion Writer
+
+#region Stock balance
+# Ledger rows written through the ORM (manual ledger CRUD, stock opname import)
+# are collected here; rows written by sync_ledgers report their own deltas.
+def _ledger_delta(kind, target):
+    session = object_session(target)
+    if session is None:
         return
 
-    connection.execute(
-        Ledger.__table__.delete()
-        .where(Ledger.ref == LedgerRef.StockMovement.value)
-        .where(Ledger.ref_code == (movement.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location.in_([LedgerLocation.Gudang.value, LedgerLocation.Kitchen.value]))
-    )
-#endregion Stock Movement
-
-#region Color Kitchen
-def _get_ck_entry(connection, entry_id):
-    return connection.execute(
-        ColorKitchenEntry.__table__.select().where(ColorKitchenEntry.id == entry_id)
-    ).fetchone()
-
-@event.listens_for(ColorKitchenEntryDetail, "after_insert")
-def create_ledger_from_ck(mapper, connection, target):
-    entry = _get_ck_entry(connection, target.color_kitchen_entry_id)
-    if not entry:
-        return
+    deltas = session.info.setdefault(STOCK_DELTA_KEY, {})
+    if kind in ("update", "delete"):
+        state = sa_inspect(target)
+        old_qty = (_old_value(state, "quantity_in") or 0) - (_old_value(state, "quantity_out") or 0)
+        add_stock_delta(deltas, _old_value(state, "product_id"), _old_value(state, "location"), -old_qty)
 
-    # Kitchen OUT
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=entry.date,
-            ref=LedgerRef.Ck.value,
-            ref_code=entry.code or "",
-            location=LedgerLocation.Kitchen.value,
-            quantity_in=0.0,
-            quantity_out=target.quantity or 0.0,
-            product_id=target.product_id,
-        )
-    )
+    if kind in ("insert", "update"):
+        qty = (target.quantity_in or 0) - (target.quantity_out or 0)
+        add_stock_delta(deltas, target.product_id, target.location, qty)
 
-    # Usage IN
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=entry.date,
-            ref=LedgerRef.Ck.value,
-            ref_code=entry.code or "",
-            location=LedgerLocation.Usage.value,
-            quantity_in=target.quantity or 0.0,
-            quantity_out=0.0,
-            product_id=target.product_id,
-        )
-    )
 
-@event.listens_for(ColorKitchenEntryDetail, "after_update")
-def update_ledger_from_ck(mapper, connection, target):
-    entry = _get_ck_entry(connection, target.color_kitchen_entry_id)
-    if not entry:
-        return
+@event.listens_for(Ledger, "after_insert")
+def _ledger_after_insert(mapper, connection, target):
+    _ledger_delta("insert", target)
 
-    # Kitchen OUT
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (entry.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Kitchen.value)
-        .values(date=entry.date, quantity_in=0.0, quantity_out=target.quantity or 0.0)
-    )
 
-    # Usage IN
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (entry.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Usage.value)
-        .values(date=entry.date, quantity_in=target.quantity or 0.0, quantity_out=0.0)
-    )
+@event.listens_for(Ledger, "after_update")
+def _ledger_after_update(mapper, connection, target):
+    _ledger_delta("update", target)
 
-@event.listens_for(ColorKitchenEntryDetail, "after_delete")
-def delete_ledger_from_ck(mapper, connection, target):
-    entry = _get_ck_entry(connection, target.color_kitchen_entry_id)
-    if not entry:
-        return
 
-    connection.execute(
-        Ledger.__table__.delete()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (entry.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location.in_([LedgerLocation.Kitchen.value, LedgerLocation.Usage.value]))
-    )
-    
-def _get_ck_batch(connection, batch_id):
-    return connection.execute(
-        ColorKitchenBatch.__table__.select().where(ColorKitchenBatch.id == batch_id)
-    ).fetchone()
-    
-@event.listens_for(ColorKitchenBatchDetail, "after_insert")
-def create_ledger_from_ck_batch(mapper, connection, target):
-    batch = _get_ck_batch(connection, target.batch_id)
-    if not batch:
-        return
-    
-    # Kitchen OUT
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=batch.date,
-            ref=LedgerRef.Ck.value,
-            ref_code=batch.code or "",
-            location=LedgerLocation.Kitchen.value,
-            quantity_in=0.0,
-            quantity_out=target.quantity or 0.0,
-            product_id=target.product_id,
-        )
-    )
+@event.listens_for(Ledger, "after_delete")
+def _ledger_after_delete(mapper, connection, target):
+    _ledger_delta("delete", target)
+#endregion Stock balance
 
-    # Usage IN
-    connection.execute(
-        Ledger.__table__.insert().values(
-            date=batch.date,
-            ref=LedgerRef.Ck.value,
-            ref_code=batch.code or "",
-            location=LedgerLocation.Usage.value,
-            quantity_in=target.quantity or 0.0,
-            quantity_out=0.0,
-            product_id=target.product_id,
-        )
-    )
+#region Avg cost cache
+# Purchasing details queue deltas of the running totals while flushing (see _collect_cost_delta),
+# they are applied to product_avg_cost_cache once per transaction. Deltas are kept
+# per transaction: a rollback drops only those of the transaction rolled back.
+@event.listens_for(Session, "before_commit")
+def _apply_avg_cost_updates(session):
+    if should_skip_cost_cache_updates():
+        return  # deferred by after_commit, until a commit outside skip_cost_cache_updates()
 
-@event.listens_for(ColorKitchenBatchDetail, "after_update")
-def update_ledger_from_ck_batch(mapper, connection, target):
-    batch = _get_ck_batch(connection, target.batch_id)
-    if not batch:
-        return
-    # Kitchen OUT
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (batch.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Kitchen.value)
-        .values(date=batch.date, quantity_in=0.0, quantity_out=target.quantity or 0.0)
-    )
+    # before_commit runs ahead of the final flush, so flush here to queue its products too
+    session.flush()
+    flush_avg_cost_updates(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _defer_avg_cost_updates(session):
+    defer_avg_cost_updates(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_avg_cost_updates(session):
+    discard_avg_cost_updates(session)
+#endregion Avg cost cache
+
+#region Avg cost view
+# Tables read by the product_avg_cost materialized view; a committed write to
+# any of them marks the view dirty for the background refresher.
+AVG_COST_VIEW_SOURCES = (PurchasingDetail, StockMovementDetail, StockOpnameDetail)
+AVG_COST_VIEW_DIRTY_KEY = "avg_cost_view_dirty"
+
+
+def _register_view_source(source_cls):
+    def _mark(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info[AVG_COST_VIEW_DIRTY_KEY] = True
+
+    for name in ("after_insert", "after_update", "after_delete"):
+        event.listen(source_cls, name, _mark)
+
+
+for _source_cls in AVG_COST_VIEW_SOURCES:
+    _register_view_source(_source_cls)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_avg_cost_view_dirty(session):
+    if session.info.pop(AVG_COST_VIEW_DIRTY_KEY, None):
+        product_avg_cost_refresher.mark_dirty()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_avg_cost_view_dirty(session):
+    session.info.pop(AVG_COST_VIEW_DIRTY_KEY, None)
+#endregion Avg cost view
+
+
+#region Daily rollups
+# Details queue their header, headers queue their day (old and new date);
+# the queued days of purchasing_daily_rollups / color_kitchen_daily_rollups
+# are recomputed once per transaction.
+ROLLUP_DETAIL_SOURCES = {
+    PurchasingDetail: "purchasing_id",
+    ColorKitchenBatchDetail: "batch_id",
+    ColorKitchenEntryDetail: "color_kitchen_entry_id",
+}
+ROLLUP_HEADER_SOURCES = {
+    Purchasing: "purchasing",
+    ColorKitchenBatch: "color_kitchen",
+    ColorKitchenEntry: "color_kitchen",
+}
 
-    # Usage IN
-    connection.execute(
-        Ledger.__table__.update()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (batch.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location == LedgerLocation.Usage.value)
-        .values(date=batch.date, quantity_in=target.quantity or 0.0, quantity_out=0.0)
-    )
 
-@event.listens_for(ColorKitchenBatchDetail, "after_delete")
-def delete_ledger_from_ck_batch(mapper, connection, target):
-    batch = _get_ck_batch(connection, target.batch_id)
-    if not batch:
+def _register_rollup_detail(detail_cls, header_fk):
+    header_table = LEDGER_SPECS[detail_cls]["header"].__tablename__
+
+    def _mark(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        mark_rollup_header(session, header_table, getattr(target, header_fk))
+        mark_rollup_header(session, header_table, _old_value(sa_inspect(target), header_fk))
+
+    for name in ("after_insert", "after_update", "after_delete"):
+        event.listen(detail_cls, name, _mark)
+
+
+def _register_rollup_header(header_cls, rollup):
+    def _mark(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        mark_rollup_day(session, rollup, _old_value(sa_inspect(target), "date"))
+        mark_rollup_day(session, rollup, target.date)
+
+    # before_delete: the row is still there if the date has to be loaded
+    event.listen(header_cls, "after_update", _mark)
+    event.listen(header_cls, "before_delete", _mark)
+
+
+for _detail_cls, _header_fk in ROLLUP_DETAIL_SOURCES.items():
+    _register_rollup_detail(_detail_cls, _header_fk)
+
+for _header_cls, _rollup in ROLLUP_HEADER_SOURCES.items():
+    _register_rollup_header(_header_cls, _rollup)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_daily_rollups(session):
+    session.flush()
+    flush_daily_rollups(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_daily_rollups(session):
+    session.info.pop(ROLLUP_DIRTY_KEY, None)
+#endregion Daily rollups
+
+
+#region List count cache
+# Tables written by a connection are collected per connection, from the target
+# table of its Core / ORM INSERT / UPDATE / DELETE statements (raw SQL writers
+# call note_written_tables themselves); their cached list totals are dropped when
+# it commits. Writes of other processes (import job workers) only show up after the cache TTL.
+@event.listens_for(Engine, "after_cursor_execute")
+def _collect_written_tables(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not (context.isinsert or context.isupdate or context.isdelete):
         return
-    connection.execute(
-        Ledger.__table__.delete()
-        .where(Ledger.ref == LedgerRef.Ck.value)
-        .where(Ledger.ref_code == (batch.code or ""))
-        .where(Ledger.product_id == target.product_id)
-        .where(Ledger.location.in_([LedgerLocation.Kitchen.value, LedgerLocation.Usage.value]))
-    )
-#endregion Color Kitchen
\ No newline at end of file
+    target = context.compiled.statement.table
+    note_written_tables(conn, {t.name for t in find_tables(target) if isinstance(t, Table)})
+
+
+@event.listens_for(Engine, "commit")
+def _invalidate_list_counts(conn):
+    tables = conn.info.pop(WRITTEN_TABLES_KEY, None)
+    if tables:
+        list_count_cache.invalidate(tables)
+
+
+@event.listens_for(Engine, "rollback")
+def _discard_written_tables(conn):
+    conn.info.pop(WRITTEN_TABLES_KEY, None)
+#endregion List count cache
@@ -0,0 +1,339 @@
+import asyncio
+import inspect
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from fastapi import HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from app.core import events  # noqa: F401 - worker processes need the ledger / cache listeners too
+from app.core.database import SessionLocal, engine
+from app.core.scheduler import product_avg_cost_refresher
+from app.core.sheet_parser import sheet_parser_pool
+from app.models.import_job import ImportJob
+from app.utils.response import ORJSONResponse
+from app.utils.upload_dir import get_upload_dir
+
+# Worker processes running background imports
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+
+# Minimum seconds between two progress writes of a running job
+IMPORT_PROGRESS_INTERVAL = float(os.getenv("IMPORT_PROGRESS_INTERVAL", "1"))
+
+# Seconds between two heartbeats of unfinished jobs, and without one after which a job is failed
+IMPORT_HEARTBEAT_INTERVAL = float(os.getenv("IMPORT_HEARTBEAT_INTERVAL", "30"))
+IMPORT_JOB_STALE_AFTER = float(os.getenv("IMPORT_JOB_STALE_AFTER", "120"))
+
+JOB_COUNTERS = ("rows_total", "rows_parsed", "rows_inserted", "rows_skipped")
+
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+def _save_job(job_id, **values):
+    """Update the job row in its own transaction, independent of the import's session."""
+    values["updated_at"] = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+
+
+def fail_stale_jobs():
+    """
+    Mark queued / running jobs without a heartbeat for IMPORT_JOB_STALE_AFTER
+    seconds as failed: the process that held them (API process for queued jobs,
+    worker for running ones) is gone, nothing would ever finish them. Jobs of
+    live processes, in this server or any other, keep their heartbeat fresh.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=IMPORT_JOB_STALE_AFTER)
+    with engine.begin() as conn:
+        stale = conn.execute(
+            update(ImportJob)
+            .where(ImportJob.status.in_(UNFINISHED_STATUSES))
+            .where(or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < cutoff))
+            .values(status="failed", phase="failed", error="Interrupted: its worker stopped (server restarted or crashed)",
+                    updated_at=now, finished_at=now)
+            .returning(ImportJob.id, ImportJob.file_path)
+        ).fetchall()
+
+    for job_id, file_path in stale:
+        print(f"✗ Import job {job_id} lost its worker")
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+
+class JobHeartbeat:
+    """
+    Background thread renewing heartbeat_at of the unfinished jobs job_ids() returns,
+    every `interval` seconds. With `sweep`, each tick also fails stale jobs.
+    """
+
+    def __init__(self, name, job_ids, sweep=False, interval=IMPORT_HEARTBEAT_INTERVAL):
+        self.name = name
+        self.job_ids = job_ids
+        self.sweep = sweep
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def beat(self):
+        try:
+            job_ids = list(self.job_ids())
+            if job_ids:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(ImportJob)
+                        .where(ImportJob.id.in_(job_ids))
+                        .where(ImportJob.status.in_(UNFINISHED_STATUSES))
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            if self.sweep:
+                fail_stale_jobs()
+        except Exception as e:
+            print(f"✗ Import job heartbeat {self.name} failed: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+
+class JobProgress:
+    """
+    Progress callback of a job (BaseImportService.progress_callback).
+    Counters are kept in memory and written at most every `interval` seconds,
+    or right away when the phase changes.
+    """
+
+    def __init__(self, job_id, interval=IMPORT_PROGRESS_INTERVAL):
+        self.job_id = job_id
+        self.interval = interval
+        self.values = {}
+        self._written_phase = None
+        self._written_at = 0.0
+
+    def __call__(self, phase=None, **counts):
+        if phase:
+            self.values["phase"] = phase
+        self.values.update((k, v) for k, v in counts.items() if k in JOB_COUNTERS)
+
+        if phase and phase != self._written_phase or time.monotonic() - self._written_at >= self.interval:
+            self.write()
+
+    def write(self, **values):
+        _save_job(self.job_id, **{**self.values, **values})
+        self._written_phase = values.get("phase", self.values.get("phase"))
+        self._written_at = time.monotonic()
+
+
+def _result_json(result):
+    """What _run returned (APIResponse / dict / list) as JSON for ImportJob.result."""
+    if not isinstance(result, Response):
+        result = ORJSONResponse(jsonable_encoder(result))  # same rendering as the /import route (NaN as null, ...)
+    return json.loads(result.body)
+
+
+def _init_worker():
+    # jobs already run side by side: their sheets are parsed inline, a pool nested in
+    # this one would also keep the worker from exiting (it joins its child processes)
+    sheet_parser_pool.workers = 1
+
+
+def run_import_job(job_id: str, service_cls, file_path: str, filename: str, force: bool = False,
+                   chunk_size: int = None):
+    """
+    Worker process entry point: run service_cls._run on the saved upload with
+    a fresh session, the same way the synchronous /import routes do, and record
+    progress and outcome on the job row. Returns the final status.
+    """
+    job_id = uuid.UUID(job_id)
+    progress = JobProgress(job_id)
+    progress.write(status="running", phase="reading", started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+
+    # the worker keeps its job alive itself: it may outlive the API process that queued it
+    heartbeat = JobHeartbeat(f"job-{job_id}", lambda: [job_id])
+    heartbeat.start()
+    db = SessionLocal()
+    try:
+        with open(file_path, "rb") as f:
+            service = service_cls(db)
+            service.progress_callback = progress
+            service.force = force
+            service.chunk_size = chunk_size
+
+            result = service._run(UploadFile(f, filename=filename))
+            if inspect.isawaitable(result):
+                result = asyncio.run(result)
+        db.commit()
+        result = _result_json(result)
+    except Exception as e:
+        db.rollback()
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"✗ Import job {job_id} failed: {error}")
+        progress.write(status="failed", phase="failed", error=str(error), finished_at=datetime.utcnow())
+        return "failed"
+    finally:
+        heartbeat.stop()
+        db.close()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    progress.write(status="done", phase="done", result=result, finished_at=datetime.utcnow())
+    return "done"
+
+
+class ImportJobQueue:
+    """
+    Pool of worker processes running Excel imports in the background.
+    Jobs live in the import_jobs table: the API process creates the row and saves
+    the upload, the worker updates it while it runs, so status can be read from
+    any process. Needs no broker, the pool starts with the app (see main.py).
+    Jobs submitted here get a heartbeat from this process until they end, so
+    API processes can tell jobs of a dead process (fail_stale_jobs) from their own.
+    """
+
+    def __init__(self, workers=IMPORT_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = set()  # ids of the jobs submitted here and not done yet
+        self._heartbeat = JobHeartbeat("queue", self._job_ids, sweep=True)
+
+    def _job_ids(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def start(self):
+        self._heartbeat.start()
+        with self._lock:
+            if self._executor is None:
+                # spawn: workers start from a clean interpreter instead of forking the
+                # server with its open connections and threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+
+    def stop(self):
+        """Cancel queued jobs; jobs already running finish before the process exits."""
+        self._heartbeat.stop()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def submit(self, db: Session, import_type: str, service_cls, file: UploadFile, force: bool = False,
+               chunk_size: int = None) -> ImportJob:
+        job_id = uuid.uuid4()
+        folder = get_upload_dir() / "import_jobs"
+        folder.mkdir(parents=True, exist_ok=True)
+        file_path = folder / f"{job_id}.xlsx"
+
+        file.file.seek(0)
+        with open(file_path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+        job = ImportJob(
+            id=job_id,
+            import_type=import_type,
+            filename=file.filename,
+            file_path=str(file_path),
+            status="queued",
+            phase="queued",
+            heartbeat_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.commit()  # the worker updates this row, it must exist before the job starts
+
+        self.start()
+        with self._lock:
+            self._jobs.add(job_id)
+        future = self._executor.submit(run_import_job, str(job_id), service_cls, str(file_path), file.filename, force,
+                                       chunk_size)
+        future.add_done_callback(partial(self._on_done, job_id, str(file_path)))
+        return job
+
+    def _on_done(self, job_id, file_path, future):
+        with self._lock:
+            self._jobs.discard(job_id)
+
+        if future.cancelled() or future.exception() is not None:
+            # the worker did not get to remove the upload
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        if future.cancelled():
+            _save_job(job_id, status="failed", phase="failed", error="Cancelled: server shutting down",
+                      finished_at=datetime.utcnow())
+            return
+
+        error = future.exception()
+        if error is not None:
+            # the worker died before it could record the failure itself (BrokenProcessPool, ...)
+            print(f"✗ Import job {job_id} crashed: {error}")
+            _save_job(job_id, status="failed", phase="failed", error=str(error), finished_at=datetime.utcnow())
+            with self._lock:
+                self._executor = None  # a broken pool accepts no more jobs, the next submit starts a new one
+
+        # imports write purchasings / movements in the worker process, refresh the view here
+        product_avg_cost_refresher.mark_dirty()
+
+
+def job_status(job: ImportJob) -> dict:
+    """Job row as returned by the status endpoint, with an ETA while it runs."""
+    eta_seconds = None
+    if job.status == "running" and job.started_at and job.rows_total:
+        # rows parsed while parsing, then rows inserted / skipped when the service parses everything up front
+        done = job.rows_parsed
+        if done >= job.rows_total:
+            done = job.rows_inserted + job.rows_skipped
+        if 0 < done < job.rows_total:
+            elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+            eta_seconds = round(elapsed / done * (job.rows_total - done), 1)
+
+    return {
+        "id": str(job.id),
+        "import_type": job.import_type,
+        "filename": job.filename,
+        "status": job.status,
+        "phase": job.phase,
+        "rows_total": job.rows_total,
+        "rows_parsed": job.rows_parsed,
+        "rows_inserted": job.rows_inserted,
+        "rows_skipped": job.rows_skipped,
+        "eta_seconds": eta_seconds,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+import_job_queue = ImportJobQueue()
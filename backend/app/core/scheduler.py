@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.core.database import SessionLocal
+from app.utils.cost_helper import refresh_product_avg_cost
+
+# Seconds between dirty checks of the background refresher
+AVG_COST_REFRESH_INTERVAL = int(os.getenv("AVG_COST_REFRESH_INTERVAL", "60"))
+
+
+class MaterializedViewRefresher:
+    """
+    Background thread refreshing a materialized view, only when it was marked dirty.
+    Writes that feed the view call mark_dirty() after commit (see app.core.events),
+    so many writes between two ticks cost a single refresh.
+    """
+
+    def __init__(self, name, refresh_fn, interval=AVG_COST_REFRESH_INTERVAL):
+        self.name = name
+        self.refresh_fn = refresh_fn
+        self.interval = interval
+
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # one refresh at a time
+        self._thread = None
+
+        self.last_refreshed_at = None
+        self.last_duration_ms = None
+        self.last_error = None
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def refresh(self):
+        with self._lock:
+            # cleared before refreshing so writes committed meanwhile trigger the next one
+            self._dirty.clear()
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                self.refresh_fn(db)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                self._dirty.set()
+                print(f"✗ Refresh {self.name} failed: {e}")
+                return
+            finally:
+                db.close()
+
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.last_refreshed_at = datetime.now(timezone.utc)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._dirty.is_set():
+                self.refresh()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"refresh-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def status(self):
+        return {
+            "view": self.name,
+            "dirty": self._dirty.is_set(),
+            "running": bool(self._thread and self._thread.is_alive()),
+            "interval_seconds": self.interval,
+            "last_refreshed_at": self.last_refreshed_at.isoformat() if self.last_refreshed_at else None,
+            "last_duration_ms": self.last_duration_ms,
+            "last_error": self.last_error,
+        }
+
+
+product_avg_cost_refresher = MaterializedViewRefresher("product_avg_cost", refresh_product_avg_cost)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes parsing the sheets of one workbook in parallel (1 = parse in the request)
+SHEET_PARSE_WORKERS = int(os.getenv("SHEET_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+
+class SheetParserPool:
+    """
+    Pool of worker processes parsing workbook sheets side by side. Each task reads
+    one sheet of the upload (saved to a temp file once) and returns plain data;
+    merging the results and every DB write stays in the calling process.
+    Started on first use, stopped with the app (see main.py).
+    """
+
+    def __init__(self, workers=SHEET_PARSE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, same as the import job workers: no forked server state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def stop(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def map_sheets(self, fileobj, sheets: list, parse_sheet):
+        """
+        Yield (sheet, parse_sheet(source, sheet)) for every sheet, in order.
+        parse_sheet must be a module level function (tasks are pickled by name)
+        taking the workbook as a path or file object. With a single sheet or
+        worker the sheets are parsed here, one after the other.
+        """
+        if len(sheets) < 2 or self.workers < 2:
+            for sheet in sheets:
+                fileobj.seek(0)
+                yield sheet, parse_sheet(fileobj, sheet)
+            return
+
+        fileobj.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as out:
+            shutil.copyfileobj(fileobj, out)
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(parse_sheet, out.name, sheet) for sheet in sheets]
+            try:
+                for sheet, future in zip(sheets, futures):
+                    yield sheet, future.result()
+            except BrokenProcessPool:
+                with self._lock:
+                    self._executor = None  # a broken pool runs no more tasks, the next call starts a new one
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
+        finally:
+            os.remove(out.name)
+
+
+sheet_parser_pool = SheetParserPool()
@@ -11,7 +11,14 @@ from .stock_opname import *
 from .types import *
 from .analytics.product_avg_cost import *
 from .cache.product_avg_cost_cache import ProductAvgCostCache
+from .cache.product_cost_history import ProductCostHistory
+from .cache.stock_balance import StockBalance, StockBalanceSnapshot
+from .cache.daily_rollup import PurchasingDailyRollup, ColorKitchenDailyRollup
 from .audit import *
+from .import_job import ImportJob
+from .import_checkpoint import ImportCheckpoint
+from .import_registry import ImportRegistry
+from .temp_import import TempImport
 
 __all__ = [
     "Base",
@@ -36,4 +43,18 @@ __all__ = [
     "ProductAvgCost",
     # product_avg_cost_cache.py
     "ProductAvgCostCache",
+    # product_cost_history.py
+    "ProductCostHistory",
+    # stock_balance.py
+    "StockBalance", "StockBalanceSnapshot",
+    # daily_rollup.py
+    "PurchasingDailyRollup", "ColorKitchenDailyRollup",
+    # import_job.py
+    "ImportJob",
+    # import_checkpoint.py
+    "ImportCheckpoint",
+    # import_registry.py
+    "ImportRegistry",
+    # temp_import.py
+    "TempImport",
 ]
\ No newline at end of file
@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, Date, Numeric, ForeignKey, Index
+
+from app.models import Base
+
+class PurchasingDailyRollup(Base):
+    """
+    Purchased quantity/value per day, product and supplier.
+    Maintained from purchasing writes (days touched by a transaction are recomputed at commit),
+    reporting reads it instead of scanning purchasing_details.
+    """
+    __tablename__ = "purchasing_daily_rollups"
+
+    date = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    quantity = Column(Numeric(18, 4), nullable=False)
+    total_value = Column(Numeric(20, 4), nullable=False) # quantity * price
+    total_value_ppn = Column(Numeric(20, 4), nullable=False) # quantity * (price + ppn - pph)
+
+class ColorKitchenDailyRollup(Base):
+    """
+    Color kitchen consumption per day and product, split by chemical type:
+    DYE from batch details (no design), AUX from entry details (per design).
+    """
+    __tablename__ = "color_kitchen_daily_rollups"
+    __table_args__ = (
+        Index("ix_color_kitchen_daily_rollups_date_chemical_type", "date", "chemical_type"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    design_id = Column(Integer, ForeignKey("designs.id", ondelete="CASCADE"), nullable=True)
+    chemical_type = Column(String(3), nullable=False) # "DYE" / "AUX"
+
+    quantity = Column(Numeric(18, 4), nullable=False)
+    total_cost = Column(Numeric(20, 6), nullable=False) # quantity * unit_cost_used
@@ -10,6 +10,7 @@ class ProductAvgCostCache(Base):
     avg_cost_ppn = Column(Float, nullable=True) # Includes ppn and pph per unit
     total_qty_in = Column(Float, nullable=True)
     total_value_in = Column(Float, nullable=True)
+    total_value_ppn_in = Column(Float, nullable=True) # SUM(quantity * (price + ppn - pph)), running total for avg_cost_ppn
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
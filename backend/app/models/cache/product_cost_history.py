@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, Float, Date, ForeignKey
+
+from app.models import Base
+
+class ProductCostHistory(Base):
+    """
+    Weighted average purchase cost per product as of each purchasing date.
+    One row per (product, date with purchases); the cost as of any date D is the
+    latest row with effective_date <= D (primary key doubles as the lookup index).
+    """
+    __tablename__ = "product_cost_history"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    effective_date = Column(Date, primary_key=True)
+
+    total_qty = Column(Float, nullable=False) # running totals up to and including effective_date
+    total_value = Column(Float, nullable=False)
+    avg_cost = Column(Float, nullable=False)
+    avg_cost_ppn = Column(Float, nullable=False) # Includes ppn and pph per unit
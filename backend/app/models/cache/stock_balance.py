@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Date, DateTime, Numeric, ForeignKey, func, text
+
+from app.models import Base
+from app.models.enum.ledger_enum import LedgerLocation
+from app.models.enum.registry import enum_column
+
+class StockBalance(Base):
+    """Current stock on hand per product and location, kept in sync with ledger writes."""
+    __tablename__ = "stock_balances"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    location = Column(enum_column(LedgerLocation), primary_key=True)
+    qty = Column(Numeric(18, 2), nullable=False, server_default=text("0.00"))
+    last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StockBalanceSnapshot(Base):
+    """Monthly closing balance: stock per product and location at the end of `period` (first day of the month)."""
+    __tablename__ = "stock_balance_snapshots"
+
+    period = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    location = Column(enum_column(LedgerLocation), primary_key=True)
+    qty = Column(Numeric(18, 2), nullable=False, server_default=text("0.00"))
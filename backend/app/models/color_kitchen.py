@@ -9,7 +9,7 @@ class ColorKitchenBatch(Base):
     __tablename__ = "color_kitchen_batches"
 
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     code = Column(String, nullable=False)  # Generated group code
     
     entries = relationship("ColorKitchenEntry", back_populates="batch", lazy='selectin', cascade="all, delete-orphan")
@@ -28,26 +28,26 @@ class ColorKitchenBatchDetail(Base):
         Computed("quantity * unit_cost_used")
     )
 
-    product_id = Column(Integer, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False, index=True)
     product = relationship("Product")
 
-    batch_id = Column(Integer, ForeignKey("color_kitchen_batches.id", ondelete="CASCADE"), nullable=False)
+    batch_id = Column(Integer, ForeignKey("color_kitchen_batches.id", ondelete="CASCADE"), nullable=False, index=True)
     batch = relationship("ColorKitchenBatch", back_populates="details", lazy='selectin')
     
 class ColorKitchenEntry(Base):
     __tablename__ = "color_kitchen_entries"
 
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     code = Column(String, nullable=False)  # OPJ
     rolls = Column(Integer)
     paste_quantity = Column(Numeric(18, 2), nullable=False)
 
-    design_id = Column(Integer, ForeignKey("designs.id", ondelete="RESTRICT"), nullable=False)
+    design_id = Column(Integer, ForeignKey("designs.id", ondelete="RESTRICT"), nullable=False, index=True)
     design = relationship("Design", back_populates="color_kitchen_entries", lazy='selectin')
 
     # link to batch (shared dyestuff)
-    batch_id = Column(Integer, ForeignKey("color_kitchen_batches.id", ondelete="CASCADE"))
+    batch_id = Column(Integer, ForeignKey("color_kitchen_batches.id", ondelete="CASCADE"), index=True)
     batch = relationship("ColorKitchenBatch", back_populates="entries", lazy='selectin')
 
     # auxiliaries (per OPJ)
@@ -65,8 +65,8 @@ class ColorKitchenEntryDetail(Base):
         Computed("quantity * unit_cost_used")
     )
 
-    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False, index=True)
     product = relationship("Product", back_populates="color_kitchen_entry_details", lazy='selectin')
 
-    color_kitchen_entry_id = Column(Integer, ForeignKey('color_kitchen_entries.id', ondelete="CASCADE"), nullable=False)
+    color_kitchen_entry_id = Column(Integer, ForeignKey('color_kitchen_entries.id', ondelete="CASCADE"), nullable=False, index=True)
     color_kitchen_entry = relationship("ColorKitchenEntry", back_populates="details", lazy='selectin')
\ No newline at end of file
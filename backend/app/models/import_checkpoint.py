@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Index, func
+
+from app.models import Base
+
+class ImportCheckpoint(Base):
+    """
+    Progress of a chunked import (BaseImportService.chunk_size): saved with every
+    committed chunk, so an import that failed or was interrupted resumes after
+    the last committed record when the same file is imported again.
+    """
+    __tablename__ = "import_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    import_type = Column(String, nullable=False) # import registry key, e.g. "lap-pembelian"
+    content_hash = Column(String(64), nullable=False) # sha256 hex of the upload
+    filename = Column(String)
+
+    status = Column(String, nullable=False, default="running") # running / failed / done
+    records_done = Column(Integer, nullable=False, default=0) # parsed records committed, in parse order
+    sheet_name = Column(String) # sheet and Excel row of the last committed record, when known
+    row_number = Column(Integer)
+    state = Column(JSON) # importer totals carried over to the resumed run
+    error = Column(Text)
+
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_import_checkpoints_type_hash", "import_type", "content_hash"),
+    )
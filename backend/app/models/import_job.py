@@ -0,0 +1,38 @@
+import uuid
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Text, UUID, Index, func
+
+from app.models import Base
+
+class ImportJob(Base):
+    """
+    Excel import running in the background worker pool (see app.core.import_jobs).
+    The worker updates phase and row counters while it runs, so the status
+    endpoint can report progress from any API process.
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    import_type = Column(String, nullable=False) # route path of the importer, e.g. "/lap-pembelian"
+    filename = Column(String)
+    file_path = Column(Text, nullable=False) # saved upload, removed when the job ends
+
+    status = Column(String, nullable=False, default="queued") # queued / running / done / failed
+    phase = Column(String)
+
+    rows_total = Column(Integer) # estimated from the sheet dimensions, None when unknown
+    rows_parsed = Column(Integer, nullable=False, default=0)
+    rows_inserted = Column(Integer, nullable=False, default=0)
+    rows_skipped = Column(Integer, nullable=False, default=0)
+
+    result = Column(JSON)
+    error = Column(Text)
+
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    heartbeat_at = Column(DateTime) # renewed while the job is queued / running, see fail_stale_jobs
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_import_jobs_created_at", "created_at"),
+    )
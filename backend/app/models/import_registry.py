@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, UUID, Index, func
+
+from app.models import Base
+
+class ImportRegistry(Base):
+    """
+    Fingerprints of imported workbooks: one row for the whole file (sheet_name NULL)
+    and one per imported sheet. An upload, or a sheet, whose hash was already
+    committed for the same import type is skipped instead of parsed again.
+    Staged imports (temp_import) register at upload with their session_id and are
+    marked committed by commit_data.
+    """
+    __tablename__ = "import_registry"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    import_type = Column(String, nullable=False) # e.g. "lap-pembelian", "lap-ck"
+    sheet_name = Column(String) # NULL for the whole file
+    content_hash = Column(String(64), nullable=False) # sha256 hex
+    filename = Column(String)
+    row_count = Column(Integer)
+    session_id = Column(UUID(as_uuid=True)) # temp_import session of staged imports
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    committed_at = Column(DateTime) # NULL while a staged import is not committed
+
+    __table_args__ = (
+        Index("ix_import_registry_type_hash", "import_type", "content_hash"),
+        Index("ix_import_registry_session_id", "session_id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed, text
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed, Index, text
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -9,6 +9,14 @@ from app.models.enum.registry import enum_column
 
 class Ledger(Base):
     __tablename__ = 'ledgers'
+    __table_args__ = (
+        # ledger sync in app.core.events: delete / update by (ref, ref_code, product_id, location)
+        Index("ix_ledgers_ref_ref_code_product_id_location", "ref", "ref_code", "product_id", "location"),
+        # stock per product / location aggregates, covering (no heap access for the quantities)
+        Index("ix_ledgers_product_id_location", "product_id", "location", postgresql_include=["quantity_in", "quantity_out"]),
+        # date range reports; BRIN stays tiny on this append-mostly table
+        Index("ix_ledgers_date_brin", "date", postgresql_using="brin"),
+    )
     
     id = Column(Integer, primary_key=True)
     date = Column(DateTime, default=datetime.utcnow)
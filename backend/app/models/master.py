@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed, Index, func
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -33,6 +33,11 @@ class Product(Base):
     stock_opname_details = relationship("StockOpnameDetail", back_populates="product", lazy='select')
     avg_cost_cache = relationship("ProductAvgCostCache", uselist=False, back_populates="product", lazy='select')
 
+    __table_args__ = (
+        # case-insensitive name lookups (staged import commit: UPPER(name) = normalized name)
+        Index("ix_products_upper_name", func.upper(name)),
+    )
+
 class Design(Base):
     __tablename__ = 'designs'
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed, text
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Numeric, Computed, Index, text
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -9,7 +9,7 @@ class Purchasing(Base):
     __tablename__ = 'purchasings'
     
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     code = Column(String, nullable=True) # No Bukti
     purchase_order = Column(String, nullable=True) # PO Number
 
@@ -20,6 +20,12 @@ class Purchasing(Base):
 
     details = relationship("PurchasingDetail", back_populates="purchasing", lazy='selectin', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # staged import commit: header of a row by supplier + no bukti, or supplier + date without one
+        Index("ix_purchasings_supplier_id_code", "supplier_id", "code"),
+        Index("ix_purchasings_supplier_id_date", "supplier_id", "date"),
+    )
+
 class PurchasingDetail(Base):
     __tablename__ = 'purchasing_details'
     
@@ -33,8 +39,8 @@ class PurchasingDetail(Base):
     tax_no = Column(String, nullable=True) # No Faktur Pajak
     exchange_rate = Column(Numeric(18, 2), server_default=text("0.00"))
 
-    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False, index=True)
     product = relationship("Product", back_populates="purchasing_details", lazy='selectin')
 
-    purchasing_id = Column(Integer, ForeignKey('purchasings.id', ondelete="CASCADE"), nullable=False)
+    purchasing_id = Column(Integer, ForeignKey('purchasings.id', ondelete="CASCADE"), nullable=False, index=True)
     purchasing = relationship("Purchasing", back_populates="details", lazy='selectin')
\ No newline at end of file
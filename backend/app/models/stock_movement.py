@@ -8,7 +8,7 @@ class StockMovement(Base):
     __tablename__ = 'stock_movements'
     
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     code = Column(String, nullable=False)
 
     details = relationship("StockMovementDetail", back_populates="stock_movement", lazy='selectin', cascade="all, delete-orphan")
@@ -25,8 +25,8 @@ class StockMovementDetail(Base):
         Computed("quantity * unit_cost_used")
     )
 
-    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False, index=True)
     product = relationship("Product", back_populates="stock_movement_details", lazy='selectin')
 
-    stock_movement_id = Column(Integer, ForeignKey('stock_movements.id', ondelete="CASCADE"), nullable=False)
+    stock_movement_id = Column(Integer, ForeignKey('stock_movements.id', ondelete="CASCADE"), nullable=False, index=True)
     stock_movement = relationship("StockMovement", back_populates="details", lazy='selectin')
\ No newline at end of file
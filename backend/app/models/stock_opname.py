@@ -9,7 +9,7 @@ class StockOpname(Base):
     __tablename__ = 'stock_opnames'
     
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     code = Column(String, nullable=False)
 
     details = relationship("StockOpnameDetail", back_populates="stock_opname", lazy='selectin', cascade="all, delete-orphan")
@@ -25,8 +25,8 @@ class StockOpnameDetail(Base):
         Computed("system_quantity - physical_quantity")
     )
 
-    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="RESTRICT"), nullable=False, index=True)
     product = relationship("Product", back_populates="stock_opname_details", lazy='selectin')
 
-    stock_opname_id = Column(Integer, ForeignKey('stock_opnames.id', ondelete="CASCADE"), nullable=False)
+    stock_opname_id = Column(Integer, ForeignKey('stock_opnames.id', ondelete="CASCADE"), nullable=False, index=True)
     stock_opname = relationship("StockOpname", back_populates="details", lazy='selectin')
\ No newline at end of file
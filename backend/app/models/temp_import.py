@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import String, Column, JSON, UUID, BigInteger, DateTime, Integer, Text, func
+from sqlalchemy import String, Column, JSON, UUID, BigInteger, Date, DateTime, Index, Integer, Text, func
 
 from app.models import Base
 
@@ -15,5 +15,15 @@ class TempImport(Base):
     parsed_data = Column(JSON)
     status = Column(String, default="pending")
     reason = Column(Text, nullable=True)
+
+    # keys commit_data joins on, typed and normalized at staging instead of read from parsed_data
+    product_name = Column(String, nullable=True) # UPPER, product and purchasing rows
+    supplier_code = Column(String, nullable=True) # supplier and purchasing rows
+    no_bukti = Column(String, nullable=True)
+    tanggal = Column(Date, nullable=True)
     # created_by = Column(Text, nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_temp_import_session_id_table_target", "session_id", "table_target"),
+    )
@@ -9,8 +9,12 @@ from app.services.import_lap_pembelian_service import ImportLapPembelianService
 import_lap_pembelian_router = APIRouter(prefix="/import-lap-pembelian", tags=["Import Laporan Pembelian"])
 
 @import_lap_pembelian_router.post("/upload")
-def upload_excel(file: UploadFile, service: ImportLapPembelianService = Depends()):
-    return service.upload_excel(file)
+def upload_excel(
+    file: UploadFile,
+    force: bool = Query(False, description="Stage sheets already imported by an earlier session too"),
+    service: ImportLapPembelianService = Depends()
+):
+    return service.upload_excel(file, force)
 
 @import_lap_pembelian_router.post("/commit/{session_id}")
 def commit_data(session_id: str, service: ImportLapPembelianService = Depends()):
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, UploadFile, HTTPException, Depends, File
+from fastapi import APIRouter, UploadFile, HTTPException, Depends, File, Query
 from typing import Type, Any
 import inspect
+import uuid
 
+from app.core.import_jobs import import_job_queue, job_status
+from app.models.import_job import ImportJob
 from app.utils.deps import DB
+from app.utils.response import APIResponse
 from app.services.imports import (
     ColorKitchenImportService,
     LapPembelianImportService,
@@ -16,18 +20,28 @@ from app.services.imports import (
 
 excel_import_router = APIRouter(prefix="/import", tags=["import"])
 
+# Files / sheets already imported (see app.utils.import_registry) are skipped unless forced
+FORCE_QUERY = Query(False, description="Import files and sheets already imported before too")
+
+# Chunked imports (lap-pembelian, lap-ck) commit as they go and resume an interrupted import of the same file
+CHUNK_SIZE_QUERY = Query(None, ge=1, description="Commit every N records, resuming from the last commit of an interrupted import; one transaction when unset")
+
 # Excel import route factory
 def make_import_routes(path: str, service_cls: Type[Any]):
     # --- Actual import route ---
     @excel_import_router.post(path)
     async def import_file(
         file: UploadFile = File(...),
+        force: bool = FORCE_QUERY,
+        chunk_size: int | None = CHUNK_SIZE_QUERY,
         service: Any = Depends(service_cls),
     ):
         name = (file.filename or "").lower()
         if not name.endswith(".xlsx"):
             raise HTTPException(status_code=400, detail="Please upload an .xlsx file")
 
+        service.force = force
+        service.chunk_size = chunk_size
         try:
             if inspect.iscoroutinefunction(service._run):
                 return await service._run(file)
@@ -42,6 +56,7 @@ def make_import_routes(path: str, service_cls: Type[Any]):
     @excel_import_router.post(f"{path}/preview")
     async def preview_file(
         file: UploadFile = File(...),
+        force: bool = FORCE_QUERY,
         service: Any = Depends(service_cls),
     ):
         name = (file.filename or "").lower()
@@ -51,6 +66,7 @@ def make_import_routes(path: str, service_cls: Type[Any]):
         if not hasattr(service, "preview"):
             raise HTTPException(status_code=404, detail="Preview not supported for this import type")
 
+        service.force = force
         try:
             if inspect.iscoroutinefunction(service.preview):
                 return await service.preview(file)
@@ -61,7 +77,36 @@ def make_import_routes(path: str, service_cls: Type[Any]):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to preview: {e}")
 
-    return import_file, preview_file
+    # --- Background import: returns a job id right away, see GET /import/jobs/{job_id} ---
+    @excel_import_router.post(f"{path}/jobs")
+    def enqueue_file(
+        db: DB,
+        file: UploadFile = File(...),
+        force: bool = FORCE_QUERY,
+        chunk_size: int | None = CHUNK_SIZE_QUERY,
+    ):
+        name = (file.filename or "").lower()
+        if not name.endswith(".xlsx"):
+            raise HTTPException(status_code=400, detail="Please upload an .xlsx file")
+
+        job = import_job_queue.submit(db, path, service_cls, file, force=force, chunk_size=chunk_size)
+        return APIResponse(status_code=202, message="Import queued", data=job_status(job))()
+
+    return import_file, preview_file, enqueue_file
+
+
+@excel_import_router.get("/jobs")
+def list_import_jobs(db: DB, limit: int = 20):
+    jobs = db.query(ImportJob).order_by(ImportJob.created_at.desc()).limit(min(limit, 100)).all()
+    return APIResponse.ok(data=[job_status(job) for job in jobs])
+
+
+@excel_import_router.get("/jobs/{job_id}")
+def get_import_job(job_id: uuid.UUID, db: DB):
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return APIResponse.ok(data=job_status(job))
 
 
 # Route registration map
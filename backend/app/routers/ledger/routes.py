@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 
 from app.schemas.input_models.ledger_input_models import LedgerCreate, LedgerUpdate
+from app.utils.datatable.export import ExportFormat
 from app.utils.datatable.request import ListRequest
 from app.services.ledger.ledger_service import LedgerService
 from app.utils.response import APIResponse
@@ -11,6 +12,12 @@ ledger_router = APIRouter(prefix="/ledger", tags=["ledger"])
 def search_ledgers(request: ListRequest = Depends(), service: LedgerService = Depends()):
     return service.list_ledger(request=request)
 
+@ledger_router.get("/export")
+def export_ledgers(request: ListRequest = Depends(), export_format: ExportFormat = Query("ndjson", alias="format"),
+                   service: LedgerService = Depends()):
+    """Every ledger row matching the search filter, as NDJSON or CSV (page / page_size are ignored)."""
+    return service.export_ledger(request=request, export_format=export_format)
+
 @ledger_router.get("/{ledger_id}")
 def get_ledger_by_id(ledger_id: int, service: LedgerService = Depends()):
     return service.get_ledger(ledger_id=ledger_id)
@@ -5,6 +5,7 @@ from app.schemas.input_models.master_input_models import ProductCreate, ProductU
 from app.utils.datatable.request import ListRequest
 from app.services.master.product_service import ProductService
 from app.utils.response import APIResponse
+from app.core.scheduler import product_avg_cost_refresher
 
 product_router = APIRouter(prefix="/product", tags=["product"])
 
@@ -12,6 +13,11 @@ product_router = APIRouter(prefix="/product", tags=["product"])
 def search_products(request: ListRequest = Depends(), service: ProductService = Depends()):
     return service.list_product(request=request)
 
+@product_router.get("/avg-cost/refresh-status")
+def get_avg_cost_refresh_status():
+    # last refresh time / duration of the product_avg_cost materialized view
+    return APIResponse.ok(data=product_avg_cost_refresher.status())
+
 @product_router.get("/{product_id}")
 def get_product_by_id(product_id: int, service: ProductService = Depends()):
     return service.get_product(product_id=product_id)
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 
 from app.schemas.input_models.purchasing_input_models import PurchasingCreate, PurchasingUpdate
+from app.utils.datatable.export import ExportFormat
 from app.utils.datatable.request import ListRequest
 from app.services.purchasing.purchasing_service import PurchasingService
 from app.utils.response import APIResponse
@@ -11,6 +12,12 @@ purchasing_router = APIRouter(prefix="/purchasing", tags=["purchasing"])
 def search_purchasings(request: ListRequest = Depends(), service: PurchasingService = Depends()):
     return service.list_purchasing(request=request)
 
+@purchasing_router.get("/export")
+def export_purchasing_details(request: ListRequest = Depends(), export_format: ExportFormat = Query("ndjson", alias="format"),
+                              service: PurchasingService = Depends()):
+    """Detail rows of every purchasing matching the search / date filter, as NDJSON or CSV (page / page_size are ignored)."""
+    return service.export_purchasing_details(request=request, export_format=export_format)
+
 @purchasing_router.get("/{purchasing_id}")
 def get_purchasing_by_id(purchasing_id: int, service: PurchasingService = Depends()):
     return service.get_purchasing(purchasing_id=purchasing_id)
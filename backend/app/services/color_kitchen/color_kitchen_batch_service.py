@@ -13,6 +13,10 @@ from app.utils.deps import DB
 from app.utils.response import APIResponse
 
 
+# Columns of the batch list
+BATCH_LIST_COLUMNS = (ColorKitchenBatch.id, ColorKitchenBatch.date, ColorKitchenBatch.code)
+
+
 class ColorKitchenBatchService:
     def __init__(self, db = Depends(get_db)):
         self.db = db
@@ -39,7 +43,7 @@ class ColorKitchenBatchService:
                 )
             )
 
-        return APIResponse.paginated(batch, request)
+        return APIResponse.paginated(batch, request, columns=BATCH_LIST_COLUMNS)
 
     def get_color_kitchen_batch(self, batch_id: int):
         batch = self.db.query(ColorKitchenBatch).filter(ColorKitchenBatch.id == batch_id).first()
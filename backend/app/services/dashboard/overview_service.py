@@ -4,7 +4,7 @@ from typing import Optional
 from dateutil.relativedelta import relativedelta
 import traceback
 
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select, and_, or_, true, union_all, literal_column
 from sqlalchemy.orm import Session
 
 from app.models import (
@@ -125,165 +125,110 @@ class DashboardService:
         prev_date_from: datetime,
         prev_date_to: datetime
     ) -> dict:
-        """Calculate dashboard metrics with trend comparison"""
-        
-        print("  → Calculating total_purchasing...")
-        # 1. Total Purchasing
-        try:
-            total_purchasing_current = self.db.query(
-                func.coalesce(func.sum(PurchasingDetail.total), 0)
-            ).join(Purchasing).filter(
-                Purchasing.date >= date_from,
-                Purchasing.date <= date_to
-            ).scalar()
-            
-            total_purchasing_prev = self.db.query(
-                func.coalesce(func.sum(PurchasingDetail.total), 0)
-            ).join(Purchasing).filter(
-                Purchasing.date >= prev_date_from,
-                Purchasing.date < prev_date_to
-            ).scalar()
-            
-            total_purchasing_trend = self._calculate_trend(
-                float(total_purchasing_current or 0), 
-                float(total_purchasing_prev or 0)
-            )
-            print(f"    ✓ total_purchasing: {total_purchasing_current}, trend: {total_purchasing_trend}%")
-        except Exception as e:
-            print(f"    ✗ Error in total_purchasing: {e}")
-            total_purchasing_current = 0
-            total_purchasing_trend = 0
-        
-        print("  → Calculating total_stock_terpakai...")
-        # 2. Total Stock Terpakai
-        try:
-            ck_entry_qty = self.db.query(
-                func.coalesce(func.sum(ColorKitchenEntryDetail.quantity), 0)
-            ).join(ColorKitchenEntry).filter(
-                ColorKitchenEntry.date >= date_from,
-                ColorKitchenEntry.date <= date_to
-            ).scalar()
-            
-            ck_batch_qty = self.db.query(
-                func.coalesce(func.sum(ColorKitchenBatchDetail.quantity), 0)
-            ).join(ColorKitchenBatch).filter(
-                ColorKitchenBatch.date >= date_from,
-                ColorKitchenBatch.date <= date_to
-            ).scalar()
-            
-            total_stock_terpakai_current = float(ck_entry_qty or 0) + float(ck_batch_qty or 0)
-            
-            # Previous period
-            ck_entry_qty_prev = self.db.query(
-                func.coalesce(func.sum(ColorKitchenEntryDetail.quantity), 0)
-            ).join(ColorKitchenEntry).filter(
-                ColorKitchenEntry.date >= prev_date_from,
-                ColorKitchenEntry.date < prev_date_to
-            ).scalar()
-            
-            ck_batch_qty_prev = self.db.query(
-                func.coalesce(func.sum(ColorKitchenBatchDetail.quantity), 0)
-            ).join(ColorKitchenBatch).filter(
-                ColorKitchenBatch.date >= prev_date_from,
-                ColorKitchenBatch.date < prev_date_to
-            ).scalar()
-            
-            total_stock_terpakai_prev = float(ck_entry_qty_prev or 0) + float(ck_batch_qty_prev or 0)
-            
-            total_stock_terpakai_trend = self._calculate_trend(
-                total_stock_terpakai_current, 
-                total_stock_terpakai_prev
+        """
+        Calculate dashboard metrics with trend comparison.
+        All current / previous period KPIs come from one statement: one aggregate
+        per source table using SUM(...) FILTER (WHERE <period>), cross joined.
+        """
+        def periods(date_col):
+            current = and_(date_col >= date_from, date_col <= date_to)
+            previous = and_(date_col >= prev_date_from, date_col < prev_date_to)
+            return current, previous
+
+        def cur_prev(value, current, previous, name):
+            return (
+                func.coalesce(func.sum(value).filter(current), 0).label(f"{name}_current"),
+                func.coalesce(func.sum(value).filter(previous), 0).label(f"{name}_prev"),
             )
-            print(f"    ✓ total_stock_terpakai: {total_stock_terpakai_current}, trend: {total_stock_terpakai_trend}%")
-        except Exception as e:
-            print(f"    ✗ Error in total_stock_terpakai: {e}")
-            total_stock_terpakai_current = 0
-            total_stock_terpakai_trend = 0
-        
-        print("  → Calculating total_cost_produksi...")
-        # 3. Total Cost Produksi
+
+        print("  → Calculating metrics (single query)...")
         try:
-            ck_entry_cost = self.db.query(
-                func.coalesce(func.sum(ColorKitchenEntryDetail.total_cost), 0)
-            ).join(ColorKitchenEntry).filter(
-                ColorKitchenEntry.date >= date_from,
-                ColorKitchenEntry.date <= date_to
-            ).scalar()
-            
-            ck_batch_cost = self.db.query(
-                func.coalesce(func.sum(ColorKitchenBatchDetail.total_cost), 0)
-            ).join(ColorKitchenBatch).filter(
-                ColorKitchenBatch.date >= date_from,
-                ColorKitchenBatch.date <= date_to
-            ).scalar()
-            
-            total_cost_produksi_current = float(ck_entry_cost or 0) + float(ck_batch_cost or 0)
-            
-            # Previous period
-            ck_entry_cost_prev = self.db.query(
-                func.coalesce(func.sum(ColorKitchenEntryDetail.total_cost), 0)
-            ).join(ColorKitchenEntry).filter(
-                ColorKitchenEntry.date >= prev_date_from,
-                ColorKitchenEntry.date < prev_date_to
-            ).scalar()
-            
-            ck_batch_cost_prev = self.db.query(
-                func.coalesce(func.sum(ColorKitchenBatchDetail.total_cost), 0)
-            ).join(ColorKitchenBatch).filter(
-                ColorKitchenBatch.date >= prev_date_from,
-                ColorKitchenBatch.date < prev_date_to
-            ).scalar()
-            
-            total_cost_produksi_prev = float(ck_entry_cost_prev or 0) + float(ck_batch_cost_prev or 0)
-            
-            total_cost_produksi_trend = self._calculate_trend(
-                total_cost_produksi_current, 
-                total_cost_produksi_prev
+            # 1. Total Purchasing
+            current, previous = periods(Purchasing.date)
+            purchasing = (
+                select(*cur_prev(PurchasingDetail.quantity * PurchasingDetail.price, current, previous, "purchasing"))
+                .select_from(PurchasingDetail)
+                .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
+                .where(or_(current, previous))
+                .cte("purchasing")
             )
-            print(f"    ✓ total_cost_produksi: {total_cost_produksi_current}, trend: {total_cost_produksi_trend}%")
-        except Exception as e:
-            print(f"    ✗ Error in total_cost_produksi: {e}")
-            total_cost_produksi_current = 0
-            total_cost_produksi_trend = 0
-        
-        print("  → Calculating avg_cost_per_job...")
-        # 4. Average Cost per Job
-        try:
-            total_jobs = self.db.query(
-                func.count(ColorKitchenEntry.id)
-            ).filter(
-                ColorKitchenEntry.date >= date_from,
-                ColorKitchenEntry.date <= date_to
-            ).scalar()
-            
-            avg_cost_per_job_current = (
-                total_cost_produksi_current / total_jobs if total_jobs > 0 else 0
+
+            # 2 + 3. Stock terpakai / cost produksi: CK entry + CK batch
+            current, previous = periods(ColorKitchenEntry.date)
+            entry = (
+                select(
+                    *cur_prev(ColorKitchenEntryDetail.quantity, current, previous, "entry_qty"),
+                    *cur_prev(ColorKitchenEntryDetail.total_cost, current, previous, "entry_cost"),
+                )
+                .select_from(ColorKitchenEntryDetail)
+                .join(ColorKitchenEntry, ColorKitchenEntry.id == ColorKitchenEntryDetail.color_kitchen_entry_id)
+                .where(or_(current, previous))
+                .cte("entry")
             )
-            
-            total_jobs_prev = self.db.query(
-                func.count(ColorKitchenEntry.id)
-            ).filter(
-                ColorKitchenEntry.date >= prev_date_from,
-                ColorKitchenEntry.date < prev_date_to
-            ).scalar()
-            
-            avg_cost_per_job_prev = (
-                total_cost_produksi_prev / total_jobs_prev if total_jobs_prev > 0 else 0
+
+            current, previous = periods(ColorKitchenBatch.date)
+            batch = (
+                select(
+                    *cur_prev(ColorKitchenBatchDetail.quantity, current, previous, "batch_qty"),
+                    *cur_prev(ColorKitchenBatchDetail.total_cost, current, previous, "batch_cost"),
+                )
+                .select_from(ColorKitchenBatchDetail)
+                .join(ColorKitchenBatch, ColorKitchenBatch.id == ColorKitchenBatchDetail.batch_id)
+                .where(or_(current, previous))
+                .cte("batch")
             )
-            
-            avg_cost_per_job_trend = self._calculate_trend(
-                avg_cost_per_job_current,
-                avg_cost_per_job_prev
+
+            # 4. Jobs (CK entries) for avg cost per job
+            current, previous = periods(ColorKitchenEntry.date)
+            jobs = (
+                select(
+                    func.count(ColorKitchenEntry.id).filter(current).label("jobs_current"),
+                    func.count(ColorKitchenEntry.id).filter(previous).label("jobs_prev"),
+                )
+                .where(or_(current, previous))
+                .cte("jobs")
             )
-            print(f"    ✓ avg_cost_per_job: {avg_cost_per_job_current}, trend: {avg_cost_per_job_trend}%")
+
+            # every CTE is a single aggregate row, so the cross join is one row
+            row = self.db.execute(
+                select(purchasing, entry, batch, jobs).select_from(
+                    purchasing.join(entry, true()).join(batch, true()).join(jobs, true())
+                )
+            ).one()
+
+            total_purchasing_current = float(row.purchasing_current)
+            total_purchasing_prev = float(row.purchasing_prev)
+            total_stock_terpakai_current = float(row.entry_qty_current) + float(row.batch_qty_current)
+            total_stock_terpakai_prev = float(row.entry_qty_prev) + float(row.batch_qty_prev)
+            total_cost_produksi_current = float(row.entry_cost_current) + float(row.batch_cost_current)
+            total_cost_produksi_prev = float(row.entry_cost_prev) + float(row.batch_cost_prev)
+            total_jobs, total_jobs_prev = row.jobs_current, row.jobs_prev
         except Exception as e:
-            print(f"    ✗ Error in avg_cost_per_job: {e}")
-            avg_cost_per_job_current = 0
-            avg_cost_per_job_trend = 0
+            print(f"    ✗ Error in metrics: {e}")
+            total_purchasing_current = total_purchasing_prev = 0
+            total_stock_terpakai_current = total_stock_terpakai_prev = 0
+            total_cost_produksi_current = total_cost_produksi_prev = 0
+            total_jobs = total_jobs_prev = 0
+
+        avg_cost_per_job_current = (
+            total_cost_produksi_current / total_jobs if total_jobs > 0 else 0
+        )
+        avg_cost_per_job_prev = (
+            total_cost_produksi_prev / total_jobs_prev if total_jobs_prev > 0 else 0
+        )
+
+        total_purchasing_trend = self._calculate_trend(total_purchasing_current, total_purchasing_prev)
+        total_stock_terpakai_trend = self._calculate_trend(total_stock_terpakai_current, total_stock_terpakai_prev)
+        total_cost_produksi_trend = self._calculate_trend(total_cost_produksi_current, total_cost_produksi_prev)
+        avg_cost_per_job_trend = self._calculate_trend(avg_cost_per_job_current, avg_cost_per_job_prev)
+        print(f"    ✓ total_purchasing: {total_purchasing_current}, trend: {total_purchasing_trend}%")
+        print(f"    ✓ total_stock_terpakai: {total_stock_terpakai_current}, trend: {total_stock_terpakai_trend}%")
+        print(f"    ✓ total_cost_produksi: {total_cost_produksi_current}, trend: {total_cost_produksi_trend}%")
+        print(f"    ✓ avg_cost_per_job: {avg_cost_per_job_current}, trend: {avg_cost_per_job_trend}%")
         
         return {
             "total_purchasing": {
-                "value": float(total_purchasing_current or 0),
+                "value": total_purchasing_current,
                 "trend": total_purchasing_trend
             },
             "total_stock_terpakai": {
@@ -313,39 +258,25 @@ class DashboardService:
         granularity: str
     ) -> list:
         """Get production cost trend based on granularity"""
-        periods = self._generate_periods(date_from, date_to, granularity)
-        cost_data = []
-        
-        for period_start, period_end, label in periods:
-            try:
-                entry_cost = self.db.query(
-                    func.coalesce(func.sum(ColorKitchenEntryDetail.total_cost), 0)
-                ).join(ColorKitchenEntry).filter(
-                    ColorKitchenEntry.date >= period_start,
-                    ColorKitchenEntry.date < period_end
-                ).scalar()
-                
-                batch_cost = self.db.query(
-                    func.coalesce(func.sum(ColorKitchenBatchDetail.total_cost), 0)
-                ).join(ColorKitchenBatch).filter(
-                    ColorKitchenBatch.date >= period_start,
-                    ColorKitchenBatch.date < period_end
-                ).scalar()
-                
-                total_cost = float(entry_cost or 0) + float(batch_cost or 0)
-                
-                cost_data.append({
-                    "period": label,
-                    "total_cost": total_cost
-                })
-            except Exception as e:
-                print(f"    ✗ Error in period {label}: {e}")
-                cost_data.append({
-                    "period": label,
-                    "total_cost": 0
-                })
-        
-        return cost_data
+        if granularity not in self.PERIOD_STEPS:
+            return []
+
+        entry_cost = (
+            select(ColorKitchenEntry.date.label("date"), ColorKitchenEntryDetail.total_cost.label("total_cost"))
+            .join(ColorKitchenEntry, ColorKitchenEntry.id == ColorKitchenEntryDetail.color_kitchen_entry_id)
+        )
+        batch_cost = (
+            select(ColorKitchenBatch.date.label("date"), ColorKitchenBatchDetail.total_cost.label("total_cost"))
+            .join(ColorKitchenBatch, ColorKitchenBatch.id == ColorKitchenBatchDetail.batch_id)
+        )
+
+        return [
+            {
+                "period": label,
+                "total_cost": float(row.total_cost)
+            }
+            for label, row in self._sum_per_period(date_from, date_to, granularity, [entry_cost, batch_cost])
+        ]
 
     def _get_stock_flow(
         self, 
@@ -354,48 +285,89 @@ class DashboardService:
         granularity: str
     ) -> list:
         """Get stock in vs out flow per period"""
-        periods = self._generate_periods(date_from, date_to, granularity)
-        flow_data = []
-        
-        for period_start, period_end, label in periods:
-            try:
-                stock_masuk = self.db.query(
-                    func.coalesce(func.sum(PurchasingDetail.quantity), 0)
-                ).join(Purchasing).filter(
-                    Purchasing.date >= period_start,
-                    Purchasing.date < period_end
-                ).scalar()
-                
-                ck_entry_qty = self.db.query(
-                    func.coalesce(func.sum(ColorKitchenEntryDetail.quantity), 0)
-                ).join(ColorKitchenEntry).filter(
-                    ColorKitchenEntry.date >= period_start,
-                    ColorKitchenEntry.date < period_end
-                ).scalar()
-                
-                ck_batch_qty = self.db.query(
-                    func.coalesce(func.sum(ColorKitchenBatchDetail.quantity), 0)
-                ).join(ColorKitchenBatch).filter(
-                    ColorKitchenBatch.date >= period_start,
-                    ColorKitchenBatch.date < period_end
-                ).scalar()
-                
-                stock_terpakai = float(ck_entry_qty or 0) + float(ck_batch_qty or 0)
-                
-                flow_data.append({
-                    "period": label,
-                    "stockMasuk": float(stock_masuk or 0),
-                    "stockTerpakai": stock_terpakai
-                })
-            except Exception as e:
-                print(f"    ✗ Error in period {label}: {e}")
-                flow_data.append({
-                    "period": label,
-                    "stockMasuk": 0,
-                    "stockTerpakai": 0
-                })
-        
-        return flow_data
+        if granularity not in self.PERIOD_STEPS:
+            return []
+
+        zero = literal_column("0")
+        stock_masuk = (
+            select(Purchasing.date.label("date"), PurchasingDetail.quantity.label("stock_masuk"), zero.label("stock_terpakai"))
+            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
+        )
+        ck_entry_qty = (
+            select(ColorKitchenEntry.date.label("date"), zero.label("stock_masuk"), ColorKitchenEntryDetail.quantity.label("stock_terpakai"))
+            .join(ColorKitchenEntry, ColorKitchenEntry.id == ColorKitchenEntryDetail.color_kitchen_entry_id)
+        )
+        ck_batch_qty = (
+            select(ColorKitchenBatch.date.label("date"), zero.label("stock_masuk"), ColorKitchenBatchDetail.quantity.label("stock_terpakai"))
+            .join(ColorKitchenBatch, ColorKitchenBatch.id == ColorKitchenBatchDetail.batch_id)
+        )
+
+        return [
+            {
+                "period": label,
+                "stockMasuk": float(row.stock_masuk),
+                "stockTerpakai": float(row.stock_terpakai)
+            }
+            for label, row in self._sum_per_period(
+                date_from, date_to, granularity, [stock_masuk, ck_entry_qty, ck_batch_qty]
+            )
+        ]
+
+    # granularity -> (SQL interval, python step, label format). Periods start at date_from
+    # and every step after it while <= date_to, each covering [start, start + step);
+    # a period is labelled by its start ("Week 01 Sep" is the 7 days from 1 September)
+    PERIOD_STEPS = {
+        "daily": ("1 day", relativedelta(days=1), "%d %b"),
+        "weekly": ("7 days", relativedelta(days=7), "Week %d %b"),
+        "monthly": ("1 month", relativedelta(months=1), "%b %Y"),
+        "yearly": ("1 year", relativedelta(years=1), "%Y"),
+    }
+
+    def _sum_per_period(
+        self,
+        date_from: datetime,
+        date_to: datetime,
+        granularity: str,
+        sources: list
+    ) -> list:
+        """
+        Sum the value columns of `sources` (selects of date + values, same columns)
+        per period in one query: a generate_series calendar LEFT JOINed to the rows,
+        so periods without data still come back (as 0).
+        Returns [(label, row)] ordered by period.
+        """
+        step, delta, label_format = self.PERIOD_STEPS[granularity]
+        interval = literal_column(f"INTERVAL '{step}'")
+
+        calendar = select(
+            func.generate_series(date_from, date_to, interval).label("period_start")
+        ).cte("calendar")
+
+        rows = union_all(*sources).subquery("rows")
+        values = [c for c in rows.c if c.name != "date"]
+
+        stmt = (
+            select(
+                calendar.c.period_start,
+                *[func.coalesce(func.sum(c), 0).label(c.name) for c in values],
+            )
+            .select_from(
+                calendar.outerjoin(
+                    rows,
+                    and_(
+                        rows.c.date >= calendar.c.period_start,
+                        rows.c.date < calendar.c.period_start + interval,
+                        # prune to the whole range up front (pushed down into each source)
+                        rows.c.date >= date_from,
+                        rows.c.date < date_to + delta,
+                    ),
+                )
+            )
+            .group_by(calendar.c.period_start)
+            .order_by(calendar.c.period_start)
+        )
+
+        return [(row.period_start.strftime(label_format), row) for row in self.db.execute(stmt)]
 
     def _get_most_used_products(
         self, 
@@ -467,48 +439,3 @@ class DashboardService:
         except Exception as e:
             print(f"    ✗ Error fetching most used {product_type}: {e}")
             return []
-
-    def _generate_periods(
-        self, 
-        date_from: datetime, 
-        date_to: datetime, 
-        granularity: str
-    ) -> list:
-        """Generate time periods based on granularity"""
-        periods = []
-        current = date_from
-        
-        try:
-            if granularity == "daily":
-                while current <= date_to:
-                    next_day = current + timedelta(days=1)
-                    label = current.strftime("%d %b")
-                    periods.append((current, next_day, label))
-                    current = next_day
-                    
-            elif granularity == "weekly":
-                while current <= date_to:
-                    next_week = current + timedelta(days=7)
-                    label = f"Week {current.strftime('%d %b')}"
-                    periods.append((current, next_week, label))
-                    current = next_week
-                    
-            elif granularity == "monthly":
-                while current <= date_to:
-                    next_month = current + relativedelta(months=1)
-                    label = current.strftime("%b %Y")
-                    periods.append((current, next_month, label))
-                    current = next_month
-                    
-            elif granularity == "yearly":
-                while current <= date_to:
-                    next_year = current + relativedelta(years=1)
-                    label = current.strftime("%Y")
-                    periods.append((current, next_year, label))
-                    current = next_year
-        except Exception as e:
-            print(f"    ✗ Error generating periods: {e}")
-            # Return at least one period
-            periods = [(date_from, date_to, "Total")]
-        
-        return periods
\ No newline at end of file
@@ -1,9 +1,10 @@
 from datetime import datetime
-from io import BytesIO
+import json
 import uuid
 
 from fastapi import HTTPException, UploadFile
 from fastapi.params import Depends
+import numpy as np
 import pandas as pd
 from sqlalchemy import or_, text
 
@@ -11,6 +12,28 @@ from app.core.database import Session, get_db
 from app.utils.deps import DB
 from app.utils.response import APIResponse
 from app.models.temp_import import TempImport
+from app.core.scheduler import product_avg_cost_refresher
+from app.utils.copy_helper import CopyWriter
+from app.utils.datatable.count import note_written_tables
+from app.utils.cost_helper import update_avg_cost_for_products, rebuild_product_cost_history, cost_history_since
+from app.core.sheet_parser import sheet_parser_pool
+from app.utils.import_registry import check_imported, register_import, sheet_names
+from app.utils.rollup_helper import header_days, refresh_daily_rollups
+from app.utils.safe_parse import date_column
+
+TEMP_IMPORT_COLUMNS = [
+    "session_id", "sheet_name", "table_target", "row_number", "raw_data", "parsed_data", "status", "reason",
+    # typed join keys, see TempImport
+    "product_name", "supplier_code", "no_bukti", "tanggal",
+]
+
+IMPORT_TYPE = "import-lap-pembelian"  # import registry key
+
+def parse_sheet_records(source, sheet: str) -> list:
+    """One sheet of the upload parsed to plain records (sheet_parser_pool task)."""
+    df = pd.read_excel(source, sheet_name=sheet, header=6)
+    df = df.iloc[:, :-2]  # Drop 2 kolom terakhir (junk cols)
+    return ImportLapPembelianService(db=None)._parse_sheet(df)
 
 class ImportLapPembelianService:
     def __init__(self, db = Depends(get_db)):
@@ -46,59 +69,116 @@ class ImportLapPembelianService:
             return ""
         return str(value).strip()
 
-    def upload_excel(self, file: UploadFile):
+    def _float_column(self, series, default=0.0):
+        """_safe_float for a whole column"""
+        if not pd.api.types.is_numeric_dtype(series):
+            numeric = series.map(lambda v: isinstance(v, (str, int, float, np.number, np.bool_)))
+            series = pd.to_numeric(series.where(numeric), errors="coerce")
+        values = series.astype(float)
+        return values.astype(object).where(values.notna(), default)
+
+    def _str_column(self, series):
+        """_safe_str for a whole column"""
+        return series.astype(object).astype(str).str.strip().where(series.notna(), "")
+
+    def _date_column(self, series):
+        """TANGGAL as "YYYY-MM-DD" (other text kept as is), None when empty"""
+        def to_text(value):
+            if pd.isna(value):
+                return None
+            if isinstance(value, (pd.Timestamp, datetime)):
+                return value.strftime("%Y-%m-%d")
+            return self._safe_str(value)
+        return series.map(to_text)
+
+    def _date_key_column(self, tanggal):
+        """
+        TANGGAL text (from _date_column) as a date for TempImport.tanggal, None when it is not one.
+        Read with safe_parse.date_column, like the TANGGAL of LapPembelianImportService.
+        """
+        return date_column(tanggal)
+
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """
+        Clean every column of a sheet once and return one record per non-empty row,
+        with the original cells under "raw" (already JSON encoded).
+        """
+        def column(name):
+            if name in df.columns:
+                return df[name]
+            return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+        rows = pd.DataFrame({
+            "acc_no": column("NO.ACC"),
+            "acc_name": column("ACCOUNT"),
+            "nama_barang": self._str_column(column("NAMA BARANG")),
+            "satuan": self._str_column(column("SATUAN")).str.upper(),
+            "kode_supplier": self._str_column(column("KODE SUPPLIER")).str.upper(),
+            "nama_supplier": self._str_column(column("SUPPLIER")),
+            # Ambil data transaksi (jika ada)
+            "qty": self._float_column(column("QTY"), 0),
+            "harga": self._float_column(column("HARGA SAT"), 0),
+            "no_bukti": self._str_column(column("NO.BUKTI")),
+            "no_po": self._str_column(column("NO.PO")),
+            "tanggal": self._date_column(column("TANGGAL")),
+            # Ambil data pajak dan lainnya
+            "ppn": self._float_column(column("PPN"), 0.0),
+            "dpp": self._float_column(column("DPP"), 0.0),
+            "pph": self._float_column(column("PPH"), 0.0),
+            "pot": self._float_column(column("POT."), 0.0),  # discount
+            "faktur_pajak": self._str_column(column("FAKTUR PAJAK")),
+            "kurs": self._float_column(column("KURS"), 0.0),  # exchange_rate
+        })
+        rows["tanggal_date"] = self._date_key_column(rows["tanggal"])
+        rows["row_number"] = rows.index + 7 + 1
+
+        # Skip row yang benar-benar kosong
+        filled = (
+            rows["acc_no"].astype(bool) | rows["acc_name"].astype(bool)
+            | (rows["nama_barang"] != "") | (rows["kode_supplier"] != "") | (rows["nama_supplier"] != "")
+        )
+        records = rows[filled].to_dict("records")
+        for record, raw in zip(records, df[filled].to_dict("records")):
+            record["raw"] = json.dumps(self._serialize_for_json(raw))
+        return records
+
+    def upload_excel(self, file: UploadFile, force: bool = False):
         try:
-            contents = file.file.read()
-            wb = pd.ExcelFile(BytesIO(contents))
+            # sheets committed before, unchanged, are not staged again
+            fingerprints, committed = check_imported(self.db, IMPORT_TYPE, file.file, force)
+            sheets = sheet_names(file.file)
         except Exception:
             return APIResponse.not_found(message=f"Invalid Excel file.")
 
         session_id = uuid.uuid4()
         summary = {"session_id": str(session_id), "sheets": {}}
+
+        unchanged = {"valid_rows": 0, "preview_rows": [], "unchanged": True}
+        if None in committed:
+            summary["sheets"] = {sheet: dict(unchanged) for sheet in sheets}
+            return APIResponse.ok(message="Workbook already imported, nothing to stage", data=summary)
+
+        # staging rows go through COPY in batches instead of one ORM insert each
+        staging = CopyWriter(self.db, TempImport.__tablename__, TEMP_IMPORT_COLUMNS)
         
         try:
-            for sheet in wb.sheet_names:
-                df = pd.read_excel(wb, sheet_name=sheet, header=6)
-                df = df.iloc[:, :-2]  # Drop 2 kolom terakhir (junk cols)
-                
+            # in workbook order, parsed sheets are filled in below
+            summary["sheets"] = {sheet: dict(unchanged) if sheet in committed else None for sheet in sheets}
+
+            # sheets are parsed side by side in worker processes, staged here in sheet order
+            parsed_sheets = sheet_parser_pool.map_sheets(
+                file.file, [sheet for sheet in sheets if sheet not in committed], parse_sheet_records
+            )
+            for sheet, records in parsed_sheets:
                 valid_rows, preview_rows = 0, []
 
-                for idx, row in df.iterrows():
-                    # Ambil semua data yang diperlukan
-                    acc_no = row.get("NO.ACC")
-                    acc_name = row.get("ACCOUNT")
-                    nama_barang = self._safe_str(row.get("NAMA BARANG"))
-                    satuan = self._safe_str(row.get("SATUAN")).upper()
-                    kode_supplier = self._safe_str(row.get("KODE SUPPLIER")).upper()
-                    nama_supplier = self._safe_str(row.get("SUPPLIER"))
-                    
-                    # Ambil data transaksi (jika ada)
-                    qty = self._safe_float(row.get("QTY"), 0)
-                    harga = self._safe_float(row.get("HARGA SAT"), 0)
-                    no_bukti = self._safe_str(row.get("NO.BUKTI"))
-                    no_po = self._safe_str(row.get("NO.PO"))
-                    tanggal = row.get("TANGGAL")
-                    
-                    # Ambil data pajak dan lainnya
-                    ppn = self._safe_float(row.get("PPN"), 0.0)
-                    dpp = self._safe_float(row.get("DPP"), 0.0)
-                    pph = self._safe_float(row.get("PPH"), 0.0)
-                    pot = self._safe_float(row.get("POT."), 0.0)  # discount
-                    faktur_pajak = self._safe_str(row.get("FAKTUR PAJAK"))
-                    kurs = self._safe_float(row.get("KURS"), 0.0)  # exchange_rate
-
-                    # Convert tanggal
-                    if pd.notna(tanggal):
-                        if isinstance(tanggal, (pd.Timestamp, datetime)):
-                            tanggal = tanggal.strftime("%Y-%m-%d")
-                        else:
-                            tanggal = self._safe_str(tanggal)
-                    else:
-                        tanggal = None
-
-                    # Skip row yang benar-benar kosong
-                    if not any([acc_no, acc_name, nama_barang, kode_supplier, nama_supplier]):
-                        continue
+                for row in records:
+                    acc_no, acc_name = row["acc_no"], row["acc_name"]
+                    nama_barang, satuan = row["nama_barang"], row["satuan"]
+                    kode_supplier, nama_supplier = row["kode_supplier"], row["nama_supplier"]
+                    qty, harga, no_bukti, no_po, tanggal = row["qty"], row["harga"], row["no_bukti"], row["no_po"], row["tanggal"]
+                    ppn, dpp, pph, pot = row["ppn"], row["dpp"], row["pph"], row["pot"]
+                    faktur_pajak, kurs = row["faktur_pajak"], row["kurs"]
 
                     # 1️⃣ ACCOUNT - Jika ada NO.ACC dan ACCOUNT
                     if pd.notna(acc_no) and pd.notna(acc_name):
@@ -116,17 +196,8 @@ class ImportLapPembelianService:
                             "name": self._safe_str(acc_name)
                         }
                         
-                        temp_data = TempImport(
-                            session_id=session_id,
-                            sheet_name=sheet,
-                            table_target="account",
-                            row_number=idx + 7 + 1,
-                            raw_data=self._serialize_for_json(row.to_dict()),
-                            parsed_data=parsed,
-                            status=status,
-                            reason=reason
-                        )
-                        self.db.add(temp_data)
+                        staging.add((session_id, sheet, "account", row["row_number"], row["raw"], json.dumps(parsed), status, reason,
+                                     None, None, None, None))
                         
                         if status == "valid":
                             valid_rows += 1
@@ -150,17 +221,8 @@ class ImportLapPembelianService:
                             "account_no": int(acc_no) if pd.notna(acc_no) else None
                         }
                         
-                        temp_data = TempImport(
-                            session_id=session_id,
-                            sheet_name=sheet,
-                            table_target="product",
-                            row_number=idx + 7 + 1,
-                            raw_data=self._serialize_for_json(row.to_dict()),
-                            parsed_data=parsed,
-                            status=status,
-                            reason=reason
-                        )
-                        self.db.add(temp_data)
+                        staging.add((session_id, sheet, "product", row["row_number"], row["raw"], json.dumps(parsed), status, reason,
+                                     nama_barang.upper(), None, None, None))
                         
                         if status == "valid":
                             valid_rows += 1
@@ -181,17 +243,8 @@ class ImportLapPembelianService:
                             "name": nama_supplier or None
                         }
                         
-                        temp_data = TempImport(
-                            session_id=session_id,
-                            sheet_name=sheet,
-                            table_target="supplier",
-                            row_number=idx + 7 + 1,
-                            raw_data=self._serialize_for_json(row.to_dict()),
-                            parsed_data=parsed,
-                            status=status,
-                            reason=reason
-                        )
-                        self.db.add(temp_data)
+                        staging.add((session_id, sheet, "supplier", row["row_number"], row["raw"], json.dumps(parsed), status, reason,
+                                     None, kode_supplier, None, None))
                         
                         if status == "valid":
                             valid_rows += 1
@@ -214,6 +267,8 @@ class ImportLapPembelianService:
                         
                         status = "valid" if not missing else "skipped"
                         reason = None if not missing else f"missing column(s): {', '.join(missing)}"
+                        if status == "valid" and tanggal and row["tanggal_date"] is None:
+                            status, reason = "skipped", f"invalid TANGGAL: {tanggal}"
                         
                         parsed = {
                             "supplier_code": kode_supplier or None,
@@ -231,17 +286,8 @@ class ImportLapPembelianService:
                             "no_po": no_po or None
                         }
                         
-                        temp_data = TempImport(
-                            session_id=session_id,
-                            sheet_name=sheet,
-                            table_target="purchasing",
-                            row_number=idx + 7 + 1,
-                            raw_data=self._serialize_for_json(row.to_dict()),
-                            parsed_data=parsed,
-                            status=status,
-                            reason=reason
-                        )
-                        self.db.add(temp_data)
+                        staging.add((session_id, sheet, "purchasing", row["row_number"], row["raw"], json.dumps(parsed), status, reason,
+                                     product_name_normalized, kode_supplier or None, no_bukti or None, row["tanggal_date"]))
                         
                         if status == "valid":
                             valid_rows += 1
@@ -259,8 +305,21 @@ class ImportLapPembelianService:
 
                 summary["sheets"][sheet] = {
                     "valid_rows": valid_rows,
-                    "preview_rows": preview_rows
+                    "preview_rows": preview_rows,
+                    "unchanged": False,
                 }
+
+            staging.flush()
+
+            # marked committed by commit_data
+            staged = {sheet for sheet, s in summary["sheets"].items() if not s["unchanged"]}
+            register_import(
+                self.db, IMPORT_TYPE,
+                {key: value for key, value in fingerprints.items() if key is None or key in staged},
+                filename=file.filename,
+                row_counts={sheet: summary["sheets"][sheet]["valid_rows"] for sheet in staged},
+                session_id=session_id, committed=False,
+            )
                 
         except Exception as e:
             import traceback
@@ -271,6 +330,24 @@ class ImportLapPembelianService:
 
     def commit_data(self, session_id: str):
         try:
+            # 0️⃣ Sheets committed meanwhile by another session (or by this one already) are skipped
+            skip_committed_sheets = text("""
+                UPDATE temp_import ti
+                SET status = 'skipped', reason = 'sheet already imported'
+                FROM import_registry staged
+                WHERE ti.session_id = :sid
+                AND ti.status = 'valid'
+                AND staged.session_id = ti.session_id
+                AND staged.sheet_name = ti.sheet_name
+                AND EXISTS (
+                    SELECT 1 FROM import_registry done
+                    WHERE done.import_type = staged.import_type
+                    AND done.sheet_name = staged.sheet_name
+                    AND done.content_hash = staged.content_hash
+                    AND done.committed_at IS NOT NULL
+                )
+            """)
+
             # 1️⃣ Import Account
             insert_accounts = text("""
                 INSERT INTO accounts (account_no, name, account_type)
@@ -287,27 +364,28 @@ class ImportLapPembelianService:
                 )
             """)
             
-            # 2️⃣ Import Supplier
+            # 2️⃣ Import Supplier (once per code, first row wins)
             insert_suppliers = text("""
                 INSERT INTO suppliers (code, name)
-                SELECT 
-                    parsed_data->>'code',
-                    parsed_data->>'name'
-                FROM temp_import
-                WHERE session_id = :sid 
-                AND status = 'valid' 
-                AND table_target = 'supplier'
+                SELECT DISTINCT ON (ti.supplier_code)
+                    ti.supplier_code,
+                    ti.parsed_data->>'name'
+                FROM temp_import ti
+                WHERE ti.session_id = :sid 
+                AND ti.status = 'valid' 
+                AND ti.table_target = 'supplier'
                 AND NOT EXISTS (
-                    SELECT 1 FROM suppliers s WHERE s.code = parsed_data->>'code'
+                    SELECT 1 FROM suppliers s WHERE s.code = ti.supplier_code
                 )
+                ORDER BY ti.supplier_code, ti.id
             """)
 
-            # 3️⃣ Import Product
+            # 3️⃣ Import Product (once per normalized name, first row wins)
             insert_products = text("""
                 INSERT INTO products (name, unit, account_id)
-                SELECT 
-                    parsed_data->>'name',
-                    parsed_data->>'unit',
+                SELECT DISTINCT ON (ti.product_name)
+                    ti.parsed_data->>'name',
+                    ti.parsed_data->>'unit',
                     a.id
                 FROM temp_import ti
                 LEFT JOIN accounts a ON a.account_no = (ti.parsed_data->>'account_no')::int
@@ -316,32 +394,33 @@ class ImportLapPembelianService:
                 AND ti.table_target = 'product'
                 AND a.id IS NOT NULL
                 AND NOT EXISTS (
-                    SELECT 1 FROM products p WHERE UPPER(p.name) = UPPER(ti.parsed_data->>'name')
+                    SELECT 1 FROM products p WHERE UPPER(p.name) = ti.product_name
                 )
+                ORDER BY ti.product_name, ti.id
             """)
 
             # 4️⃣ Import Purchasing Header
-            # Group by (no_bukti OR tanggal, supplier_code)
+            # Group by (no_bukti OR tanggal, supplier_code); one anti-join per key so
+            # both can use the (supplier_id, code) / (supplier_id, date) indexes
             insert_purchasing_header = text("""
                 INSERT INTO purchasings (date, code, purchase_order, supplier_id)
                 SELECT DISTINCT
-                    (ti.parsed_data->>'tanggal')::date,
-                    ti.parsed_data->>'no_bukti',
+                    ti.tanggal,
+                    ti.no_bukti,
                     ti.parsed_data->>'no_po',
                     s.id
                 FROM temp_import ti
-                JOIN suppliers s ON s.code = ti.parsed_data->>'supplier_code'
+                JOIN suppliers s ON s.code = ti.supplier_code
                 WHERE ti.session_id = :sid 
                 AND ti.status = 'valid' 
                 AND ti.table_target = 'purchasing'
                 AND NOT EXISTS (
-                    SELECT 1 FROM purchasings p 
-                    WHERE p.supplier_id = s.id
-                    AND (
-                        (ti.parsed_data->>'no_bukti' IS NOT NULL AND p.code = ti.parsed_data->>'no_bukti')
-                        OR 
-                        (ti.parsed_data->>'no_bukti' IS NULL AND p.date = (ti.parsed_data->>'tanggal')::date)
-                    )
+                    SELECT 1 FROM purchasings p
+                    WHERE p.supplier_id = s.id AND p.code = ti.no_bukti
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM purchasings p
+                    WHERE ti.no_bukti IS NULL AND p.supplier_id = s.id AND p.date = ti.tanggal
                 )
                 ON CONFLICT DO NOTHING
             """)
@@ -370,29 +449,57 @@ class ImportLapPembelianService:
                     ti.parsed_data->>'tax_no',
                     (ti.parsed_data->>'exchange_rate')::numeric,
                     pr.id,
-                    pu.id
+                    COALESCE(pb.id, pd.id)
                 FROM temp_import ti
-                JOIN suppliers s ON s.code = ti.parsed_data->>'supplier_code'
-                JOIN products pr ON UPPER(pr.name) = UPPER(ti.parsed_data->>'product_name')
-                JOIN purchasings pu ON pu.supplier_id = s.id
-                    AND (
-                        (ti.parsed_data->>'no_bukti' IS NOT NULL AND pu.code = ti.parsed_data->>'no_bukti')
-                        OR
-                        (ti.parsed_data->>'no_bukti' IS NULL AND pu.date = (ti.parsed_data->>'tanggal')::date)
-                    )
+                JOIN suppliers s ON s.code = ti.supplier_code
+                JOIN products pr ON UPPER(pr.name) = ti.product_name
+                -- header by no bukti, or by date for rows without one: two equi-joins instead of an OR
+                LEFT JOIN purchasings pb ON pb.supplier_id = s.id AND pb.code = ti.no_bukti
+                LEFT JOIN purchasings pd ON ti.no_bukti IS NULL AND pd.supplier_id = s.id AND pd.date = ti.tanggal
                 WHERE ti.session_id = :sid 
                 AND ti.status = 'valid' 
                 AND ti.table_target = 'purchasing'
+                AND COALESCE(pb.id, pd.id) IS NOT NULL
+                RETURNING purchasing_id, product_id
+            """)
+            
+            # 6️⃣ Register the session's fingerprints as committed
+            commit_fingerprints = text("""
+                UPDATE import_registry
+                SET committed_at = timezone('utc', now())
+                WHERE session_id = :sid
+                AND committed_at IS NULL
             """)
             
             # Execute in order
+            self.db.execute(skip_committed_sheets, {"sid": session_id})
             self.db.execute(insert_accounts, {"sid": session_id})
             self.db.execute(insert_suppliers, {"sid": session_id})
             self.db.execute(insert_products, {"sid": session_id})
             self.db.execute(insert_purchasing_header, {"sid": session_id})
-            self.db.execute(insert_purchasing_details, {"sid": session_id})
-            
+            inserted = self.db.execute(insert_purchasing_details, {"sid": session_id}).fetchall()
+            self.db.execute(commit_fingerprints, {"sid": session_id})
+
+            # raw SQL inserts bypass the ORM events: refresh the report rollups of the
+            # days that got details here, and the avg cost and cost history of their
+            # products (from their earliest new purchase on), in the same transaction
+            conn = self.db.connection()
+            note_written_tables(conn, [
+                "temp_import", "accounts", "suppliers", "products", "purchasings", "purchasing_details", "import_registry",
+            ])
+            days = header_days(conn, "purchasings", {row.purchasing_id for row in inserted})
+            refresh_daily_rollups(conn, "purchasing", days)
+
+            purchases = {}
+            for row in inserted:
+                purchases.setdefault(row.product_id, (set(), set()))[1].add(row.purchasing_id)
+            update_avg_cost_for_products(conn, sorted(purchases))
+            rebuild_product_cost_history(conn, *cost_history_since(conn, purchases))
+
             self.db.commit()
+
+            # the product_avg_cost view is refreshed in the background
+            product_avg_cost_refresher.mark_dirty()
             
             # Get summary
             summary = self._get_import_summary(session_id)
@@ -1,6 +1,44 @@
+import hashlib
+import zipfile
+
 from fastapi import UploadFile, HTTPException
-from io import BytesIO
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+from sqlalchemy import inspect, tuple_
+
+from app.models.import_checkpoint import ImportCheckpoint
+from app.utils.cost_helper import flush_avg_cost_updates
+from app.utils.import_checkpoint import resumable_checkpoint, save_checkpoint
+from app.utils.import_registry import check_imported
+from app.utils.parse_cache import cached_items, cached_value, file_digest, source_version
+
+# keys per IN (...) query when preloading lookups
+LOOKUP_CHUNK_SIZE = 5000
+
+# sheet rows per DataFrame yielded by iter_sheet_frames
+SHEET_CHUNK_ROWS = 20000
+
+def _excel_cell(cell):
+    """Cell value converted the way pd.read_excel (openpyxl engine) does it."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+def _excel_row(cells) -> list:
+    row = [_excel_cell(cell) for cell in cells]
+    while row and row[-1] == "":
+        row.pop()  # trim trailing empty cells
+    return row
 
 class BaseImportService:
     def __init__(self, db):
@@ -8,14 +46,198 @@ class BaseImportService:
         self.errors = []
         self.inserted = 0
         self.skipped = 0
+        # {(model, column): {key: instance or None}} — None marks a key known to be missing
+        self._lookups = {}
+        # set when the import runs as a background job (see app.core.import_jobs)
+        self.progress_callback = None
+        # import files / sheets even when the import registry already has them
+        self.force = False
+        # records committed per transaction (see commit_chunk), None imports in one transaction
+        self.chunk_size = None
 
     def read_excel(self, file: UploadFile) -> pd.DataFrame:
         """Default reader (simple one-sheet flat file). Override if needed."""
         try:
-            return pd.read_excel(BytesIO(file.file.read()))
+            file.file.seek(0)
+            return pd.read_excel(file.file)  # the upload is already a spooled file, no need to copy it to bytes
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid Excel: {e}")
 
+    # ------------------------------------------------------
+    # Streaming reader: large workbooks are read sheet by sheet,
+    # a chunk of rows at a time, straight from the spooled upload
+    # ------------------------------------------------------
+    def open_workbook(self, file: UploadFile):
+        """Read-only openpyxl workbook over the upload file; sheets are parsed lazily while iterating."""
+        file.file.seek(0)
+        return load_workbook(file.file, read_only=True, data_only=True, keep_links=False)
+
+    def estimate_sheet_rows(self, wb, sheet_names, header: int):
+        """
+        Data rows of the sheets according to their stored dimensions (read before
+        iter_sheet_frames resets them). Only an estimate for progress reporting,
+        None when a sheet has no dimension.
+        """
+        total = 0
+        for sheet_name in sheet_names:
+            max_row = wb[sheet_name].max_row
+            if max_row is None:
+                return None
+            total += max(max_row - header - 1, 0)
+        return total
+
+    def iter_sheet_frames(self, wb, sheet_name: str, header: int, chunk_rows: int = SHEET_CHUNK_ROWS):
+        """
+        Yield the sheet as DataFrames of at most `chunk_rows` rows, parsed like
+        pd.read_excel(sheet_name=sheet_name, header=header): same column names,
+        NaN handling and index (0 = first row under the header), so positional
+        Excel row numbers keep working.
+        Column dtypes are inferred per chunk. The column count is fixed by the rows
+        up to the first chunk; later cells beyond it can only be unnamed columns
+        and are dropped.
+        """
+        ws = wb[sheet_name]
+        ws.reset_dimensions()  # the stored dimension is often wrong, same as pandas
+        rows = ws.iter_rows()
+
+        top = [_excel_row(next(rows, ())) for _ in range(header + 1)]
+        width = None
+        start = 0
+        pending = []  # rows read but not yielded yet
+        done = False
+        while not done:
+            for cells in rows:
+                pending.append(_excel_row(cells))
+                if len(pending) >= chunk_rows:
+                    break
+            else:
+                done = True
+
+            if width is None:
+                width = max(len(r) for r in top + pending)
+
+            # cut after the last non-empty row: empty rows are kept only when data follows
+            # (carried into the next chunk), trailing empty rows are dropped
+            cut = len(pending)
+            while cut and not pending[cut - 1]:
+                cut -= 1
+            chunk, pending = pending[:cut], pending[cut:]
+
+            if chunk or (done and start == 0):
+                yield self._sheet_frame(top[header], chunk, width, start)
+                start += len(chunk)
+
+    @staticmethod
+    def _sheet_frame(header_row: list, rows: list, width: int, start: int) -> pd.DataFrame:
+        if not width:
+            return pd.DataFrame()
+        pad = lambda r: (r + [""] * (width - len(r)))[:width]
+        df = TextParser([pad(header_row)] + [pad(r) for r in rows], header=0).read()
+        df.index = pd.RangeIndex(start, start + len(df))
+        return df
+
+    # ------------------------------------------------------
+    # Parse cache: the parsed upload is kept on disk by content hash,
+    # so the import following a preview of the same file skips parsing.
+    # Only pure parsing belongs there, DB lookups / validation run each time.
+    # ------------------------------------------------------
+    def _parse_cache_kind(self, parse, args) -> str:
+        # the version covers the parse function's module, the service and the shared sheet
+        # reading / cleaning code, so a changed parser never reads entries of the old one
+        version = source_version(*dict.fromkeys((
+            parse.__module__, type(self).__module__, __name__, "app.utils.safe_parse", "app.core.sheet_parser",
+        )))
+        kind = f"{type(self).__name__}.{parse.__name__}-{version}"
+        if args:
+            kind += "-" + hashlib.sha256(repr(args).encode()).hexdigest()[:16]
+        return kind
+
+    def cached_parse(self, file: UploadFile, parse, *args):
+        """parse(file, *args), reused when this upload content was parsed by an earlier request."""
+        return cached_value(self._parse_cache_kind(parse, args), file_digest(file.file), lambda: parse(file, *args))
+
+    def cached_parse_chunks(self, file: UploadFile, parse, *args):
+        """Same for a parse generator: its items stream from the cache, or into it while consumed."""
+        return cached_items(self._parse_cache_kind(parse, args), file_digest(file.file), lambda: parse(file, *args))
+
+    # ------------------------------------------------------
+    # Import registry: uploads and sheets committed before are
+    # recognised by their fingerprint and skipped without parsing
+    # ------------------------------------------------------
+    def check_imported(self, file: UploadFile, import_type: str):
+        """
+        (fingerprints, imported) of the upload, see app.utils.import_registry.check_imported.
+        With self.force nothing counts as imported.
+        """
+        try:
+            return check_imported(self.db, import_type, file.file, self.force)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid Excel file: {e}")
+
+    # ------------------------------------------------------
+    # Chunked imports: with chunk_size set the rows are committed
+    # every chunk_size records together with a checkpoint, and the
+    # next import of the same file resumes after the last one
+    # ------------------------------------------------------
+    def start_checkpoint(self, file: UploadFile, import_type: str):
+        """
+        Checkpoint of the unfinished import of this upload to resume from, or a
+        new one (saved with the first chunk). None when chunk_size is not set.
+        """
+        if not self.chunk_size:
+            return None
+
+        content_hash = file_digest(file.file)
+        checkpoint = resumable_checkpoint(self.db, import_type, content_hash)
+        if checkpoint is None:
+            return ImportCheckpoint(
+                import_type=import_type,
+                content_hash=content_hash,
+                filename=file.filename,
+                records_done=0,
+                state={},
+            )
+
+        print(f"↻ Resuming {import_type} import of {file.filename} after {checkpoint.records_done} records")
+        return checkpoint
+
+    def chunk_due(self, checkpoint, records_done: int) -> bool:
+        """Whether the records handled since the last commit fill a chunk."""
+        return checkpoint is not None and records_done - checkpoint.records_done >= self.chunk_size
+
+    def commit_chunk(self, checkpoint, records_done: int, status: str = "running", **values):
+        """
+        Commit the rows added since the last chunk, with the checkpoint moved to
+        records_done (and sheet_name / row_number / state from values). Cost cache
+        updates deferred by skip_cost_cache_updates are applied in the same
+        transaction. The commit expires every loaded instance, so lookups are
+        dropped: reload them before the next chunk.
+        """
+        save_checkpoint(self.db, checkpoint, records_done=records_done, status=status, error=None, **values)
+        self.db.flush()  # queues the cost deltas of the pending rows, so none is left for the next chunk
+        flush_avg_cost_updates(self.db)
+        self.db.commit()
+        self._lookups.clear()
+
+    def fail_checkpoint(self, checkpoint, error):
+        """Roll back the chunk in progress and mark the checkpoint failed, to be resumed by the next import."""
+        if checkpoint is None:
+            return
+
+        self.db.rollback()
+        if inspect(checkpoint).has_identity:  # committed with an earlier chunk
+            save_checkpoint(self.db, checkpoint, status="failed", error=str(error))
+            self.db.commit()
+
+    def report_progress(self, phase: str = None, **counts):
+        """
+        Report the phase and row counters (rows_total, rows_parsed, rows_inserted,
+        rows_skipped; absolute values) of the running import. No-op for
+        synchronous imports.
+        """
+        if self.progress_callback is not None:
+            self.progress_callback(phase, **counts)
+
     def log_error(self, row, msg):
         self.errors.append({"row": row, "error": msg})
 
@@ -24,4 +246,57 @@ class BaseImportService:
             "inserted": self.inserted,
             "skipped": self.skipped,
             "errors": self.errors,
-        }
\ No newline at end of file
+        }
+
+    # ------------------------------------------------------
+    # Lookups: resolve sheet keys (product name, supplier code, ...)
+    # with one IN (...) query per entity instead of one query per row
+    # ------------------------------------------------------
+    @staticmethod
+    def _lookup_key(obj, column):
+        if isinstance(column, tuple):
+            return tuple(getattr(obj, c) for c in column)
+        return getattr(obj, column)
+
+    @staticmethod
+    def _is_blank_key(key):
+        if isinstance(key, tuple):
+            return any(k is None for k in key)
+        return key is None or pd.isna(key)
+
+    def load_lookup(self, model, column, keys) -> dict:
+        """
+        Load every `model` row whose `column` is in `keys` and keep them in memory
+        for `lookup`. Keys without a row are remembered as missing.
+        `column` is a column name, or a tuple of names for composite keys.
+        """
+        cache = self._lookups.setdefault((model, column), {})
+        pending = list({k for k in keys if not self._is_blank_key(k) and k not in cache})
+        if not pending:
+            return cache
+
+        if isinstance(column, tuple):
+            attr = tuple_(*(getattr(model, c) for c in column))
+        else:
+            attr = getattr(model, column)
+        for start in range(0, len(pending), LOOKUP_CHUNK_SIZE):
+            chunk = pending[start:start + LOOKUP_CHUNK_SIZE]
+            for obj in self.db.query(model).filter(attr.in_(chunk)):
+                cache.setdefault(self._lookup_key(obj, column), obj)
+
+        for key in pending:
+            cache.setdefault(key, None)
+        return cache
+
+    def lookup(self, model, column, key):
+        """Instance of `model` with `column == key` (None if there is none); queries only keys not loaded yet."""
+        if self._is_blank_key(key):
+            return None
+        cache = self._lookups.get((model, column))
+        if cache is None or key not in cache:
+            cache = self.load_lookup(model, column, [key])
+        return cache.get(key)
+
+    def add_to_lookup(self, model, column, obj):
+        """Register an instance created during the import so later rows resolve to it."""
+        self._lookups.setdefault((model, column), {})[self._lookup_key(obj, column)] = obj
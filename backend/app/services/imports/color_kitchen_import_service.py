@@ -4,6 +4,7 @@ from app.services.imports.base_import_service import BaseImportService
 from datetime import datetime
 from io import BytesIO
 import pandas as pd
+import numpy as np
 import math, re
 from collections import defaultdict
 from fastapi import HTTPException
@@ -18,12 +19,24 @@ from app.models import (
 )
 
 from app.utils.normalise import normalise_design_name, normalise_product_name
-from app.utils.safe_parse import safe_str, safe_date, safe_number
-from app.utils.cost_helper import get_avg_cost_for_product
+from app.utils.safe_parse import str_column, date_column, number_column, parse_columns
+from app.utils.cost_helper import get_costs_as_of
+from app.utils.import_registry import register_import
 from app.utils.response import APIResponse
 
 SKIP_NAMES = {"0.4", "0.5", "0.6", "0.65"}
 
+SHEET_NAME = "TEMPLATE QTY"
+IMPORT_TYPE = "lap-ck"  # import registry key
+
+PARENT_COLUMNS = {
+    "opj": ("OPJ", str_column),
+    "design": ("DESIGN", str_column),
+    "jenis_kain": ("JENIS KAIN", str_column),
+    "rolls": ("ROLL", number_column),
+    "tgl": ("TGL", date_column),
+}
+
 class ColorKitchenImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
@@ -32,7 +45,7 @@ class ColorKitchenImportService(BaseImportService):
     def read_excel(self, contents):
         header_rows = 6
         usecols = "A:BI"
-        sheet_name = "TEMPLATE QTY"
+        sheet_name = SHEET_NAME
 
         raw = pd.read_excel(
             BytesIO(contents),
@@ -95,28 +108,145 @@ class ColorKitchenImportService(BaseImportService):
 
         return df, meta
 
-    def save_to_db(self, parsed):
+    def _load_batch_lookups(self, batches):
+        """Preload every product and design referenced by the parsed batches (one query each)."""
+        product_names = set()
+        design_codes = set()
+        for b in batches:
+            product_names.update(d["product_name"] for d in b.get("details", []))
+            for e in b.get("entries", []):
+                design_codes.add(normalise_design_name(e["design"]))
+                product_names.update(d["product_name"] for d in e.get("details", []))
+
+        self.load_lookup(Product, "name", product_names)
+        self.load_lookup(Design, "code", design_codes)
+
+    def _parse_batches(self, df: pd.DataFrame, meta: list):
+        """
+        Turn the TEMPLATE QTY sheet into batches. Every column is cleaned once and the
+        per-product quantities are summed column-wise, the row loop only groups the
+        entries into batches (a row without OPJ and DESIGN closes the current batch).
+        Returns (batches, skipped_rows).
+        """
+        parent_cols = [flat for flat, _ in PARENT_COLUMNS.values()]
+        rows = parse_columns(df, PARENT_COLUMNS)
+
+        # Group metadata by product_name → merge duplicates, one summed column per product
+        grouped_meta = defaultdict(list)
+        for m in meta:
+            grouped_meta[m["product_name"]].append(m)
+
+        products, columns = [], []
+        for pname, metas in grouped_meta.items():
+            if pname in SKIP_NAMES or not pname:
+                continue
+            total_val = np.zeros(len(df))
+            for m in metas:
+                if m["flat"] in parent_cols:
+                    continue
+                total_val = total_val + number_column(df.iloc[:, m["idx"]]).astype(float).fillna(0.0).to_numpy()
+            products.append((pname, metas[0]))  # use first for role / flags
+            columns.append(total_val)
+        totals = np.column_stack(columns) if columns else np.zeros((len(df), 0))
+
+        batches = []
+        current_batch = None
+        batch_agg = {}
+        skipped_rows = []
+
+        def finalize_batch():
+            nonlocal current_batch, batch_agg
+            if current_batch:
+                current_batch["details"] = [
+                    {"product_name": p, "quantity": qty}
+                    for p, qty in batch_agg.items() if qty and qty != 0
+                ]
+                batches.append(current_batch)
+            current_batch = None
+            batch_agg = {}
+
+        for r_idx, row, values in zip(df.index, rows.to_dict("records"), totals):
+            opj = row["opj"]
+            design_name = row["design"]
+            tgl = row["tgl"]
+
+            if not any([opj, design_name]):
+                finalize_batch()
+                skipped_rows.append({"row": r_idx + 1, "reason": "empty separator"})
+                continue
+
+            if current_batch is None:
+                current_batch = {
+                    "code": f"BATCH-{opj}-{tgl}",
+                    "date": tgl.isoformat() if tgl else None,
+                    "entries": [],
+                    "details": [],
+                }
+
+            entry = {
+                "code": opj,
+                "date": tgl.isoformat() if tgl else None,
+                "design": design_name,
+                "jenis_kain": row["jenis_kain"],
+                "rolls": row["rolls"],
+                "paste_quantity": 0.0,
+                "details": [],
+            }
+            current_batch["entries"].append(entry)
+
+            aux_accum = {}
+            for i in values.nonzero()[0]:
+                pname, sample_meta = products[i]
+                total_val = float(values[i])
+                if sample_meta["role"] == "aux":
+                    if sample_meta["is_paste_col"]:
+                        entry["paste_quantity"] += total_val
+                    else:
+                        aux_accum[pname] = aux_accum.get(pname, 0.0) + total_val
+                else:
+                    # dyestuff values are in grams → convert to kilograms
+                    total_val_kg = total_val / 1000.0
+                    batch_agg[pname] = batch_agg.get(pname, 0.0) + total_val_kg
+            for pname, qty in aux_accum.items():
+                entry["details"].append({"product_name": pname, "quantity": qty})
+
+        finalize_batch()
+        return batches, skipped_rows
+
+    def save_to_db(self, parsed, checkpoint=None):
+        """
+        Validate every batch, then insert them. Without a checkpoint everything is
+        committed at once; with one (chunked import) the batches are committed every
+        chunk_size batches after those the checkpoint already has, and the last
+        chunk is left to the caller.
+        """
         missing_products = set()
         missing_designs = set()
+        products = {}  # product_name -> Product
+        self._load_batch_lookups(parsed["batches"])
 
         # ----------- validation pass -----------
         for b in parsed["batches"]:
             # batch-level products
             for d in b.get("details", []):
-                product = self.db.query(Product).filter_by(name=d["product_name"]).first()
+                product = self.lookup(Product, "name", d["product_name"])
                 if not product:
                     missing_products.add(d["product_name"])
+                else:
+                    products[d["product_name"]] = product
 
             # entries
             for e in b.get("entries", []):
-                design = self.db.query(Design).filter(Design.code == normalise_design_name(e["design"])).first()
+                design = self.lookup(Design, "code", normalise_design_name(e["design"]))
                 if not design:
                     missing_designs.add(e["design"])
 
                 for d in e.get("details", []):
-                    product = self.db.query(Product).filter_by(name=d["product_name"]).first()
+                    product = self.lookup(Product, "name", d["product_name"])
                     if not product:
                         missing_products.add(d["product_name"])
+                    else:
+                        products[d["product_name"]] = product
 
         # If anything missing → abort before any insert
         if missing_products or missing_designs:
@@ -133,19 +263,40 @@ class ColorKitchenImportService(BaseImportService):
             if msg:  # ✅ only raise if something meaningful exists
                 raise ValueError(" | ".join(msg))
             
-        # ----------- insert pass -----------
+        # ----------- avg cost as of each document date, one query -----------
+        now = datetime.utcnow()
+
+        def doc_date(value):
+            return datetime.fromisoformat(value) if value else now
+
+        cost_keys = []
         for b in parsed["batches"]:
+            cost_keys += [(products[d["product_name"]].id, doc_date(b["date"])) for d in b.get("details", [])]
+            for e in b.get("entries", []):
+                cost_keys += [(products[d["product_name"]].id, doc_date(e["date"])) for d in e.get("details", [])]
+        costs = get_costs_as_of(self.db, cost_keys)
+
+        # ----------- insert pass -----------
+        batches = parsed["batches"]
+        resume_after = checkpoint.records_done if checkpoint is not None else 0
+        for i, b in enumerate(batches):
+            if i < resume_after:
+                continue  # committed by the interrupted import
+            if self.chunk_due(checkpoint, i):
+                self.commit_chunk(checkpoint, i, sheet_name=SHEET_NAME)
+                self._load_batch_lookups(batches[i:])  # reloads the products expired by the commit
+
             batch = ColorKitchenBatch(
                 code=b["code"],
-                date=datetime.fromisoformat(b["date"]) if b["date"] else datetime.utcnow(),
+                date=doc_date(b["date"]),
             )
             self.db.add(batch)
 
             # batch-level details
             for d in b.get("details", []):
-                product = self.db.query(Product).filter_by(name=d["product_name"]).first()
+                product = products[d["product_name"]]
                 
-                unit_cost = get_avg_cost_for_product(self.db, product.id)
+                unit_cost = costs.get((product.id, batch.date))
                 if unit_cost is None:
                     print(f"⚠️ No avg cost for product {d['product_name']}, skipping cost stamping")
                     continue
@@ -165,14 +316,14 @@ class ColorKitchenImportService(BaseImportService):
                     # print(f"⚠️ Skipping entry with no code in batch {b['code']}")
                     continue
 
-                design = self.db.query(Design).filter_by(code=normalise_design_name(e["design"])).first()
+                design = self.lookup(Design, "code", normalise_design_name(e["design"]))
                 if not design:
                     # print(f"⚠️ Skipping entry with no matching design: {e['design']}")
                     continue
 
                 entry = ColorKitchenEntry(
                     code=e["code"],
-                    date=datetime.fromisoformat(e["date"]) if e["date"] else datetime.utcnow(),
+                    date=doc_date(e["date"]),
                     rolls=e.get("rolls") or 0,
                     paste_quantity=e.get("paste_quantity") or 0,
                     design=design,
@@ -181,9 +332,9 @@ class ColorKitchenImportService(BaseImportService):
                 self.db.add(entry)
 
                 for d in e.get("details", []):
-                    product = self.db.query(Product).filter_by(name=d["product_name"]).first()
+                    product = products[d["product_name"]]
                     
-                    unit_cost = get_avg_cost_for_product(self.db, product.id)
+                    unit_cost = costs.get((product.id, entry.date))
                     if unit_cost is None:
                         print(f"⚠️ No avg cost for product {d['product_name']}, skipping cost stamping")
                         continue
@@ -196,225 +347,85 @@ class ColorKitchenImportService(BaseImportService):
                     )
                     self.db.add(detail)
 
-        self.db.commit()
+        if checkpoint is None:
+            self.db.commit()
 
         return {"missing_products": parsed, "missing_designs": []}
 
-    async def _run(self, file: UploadFile):
+    def _parse_file(self, file: UploadFile):
+        """Read and parse the TEMPLATE QTY sheet: (batches, skipped_rows, sheet rows)."""
         contents: bytes = file.file.read()
-    
-        df, meta = self.read_excel(contents)
-        parent_cols = ["OPJ", "DESIGN", "JENIS KAIN", "ROLL", "TGL"]
-
-        batches = []
-        current_batch = None
-        batch_agg = {}
-        skipped_rows = []
-        
-        # Group metadata by product_name → merge duplicates
-        grouped_meta = defaultdict(list)
-        for m in meta:
-            grouped_meta[m["product_name"]].append(m)
-
-        def finalize_batch():
-            nonlocal current_batch, batch_agg
-            if current_batch:
-                current_batch["details"] = [
-                    {"product_name": p, "quantity": qty}
-                    for p, qty in batch_agg.items() if qty and qty != 0
-                ]
-                batches.append(current_batch)
-            current_batch = None
-            batch_agg = {}
-
-        for r_idx, row in df.iterrows():
-            opj         = safe_str(row.get("OPJ"))
-            design_name = safe_str(row.get("DESIGN"))
-            jenis_kain  = safe_str(row.get("JENIS KAIN"))
-            rolls       = safe_number(row.get("ROLL"))
-            tgl         = safe_date(row.get("TGL"))
-
-            if not any([opj, design_name]):
-                finalize_batch()
-                skipped_rows.append({"row": r_idx + 1, "reason": "empty separator"})
-                continue
-
-            if current_batch is None:
-                current_batch = {
-                    "code": f"BATCH-{opj}-{tgl}",
-                    "date": tgl.isoformat() if tgl else None,
-                    "entries": [],
-                    "details": [],
-                }
-
-            entry = {
-                "code": opj,
-                "date": tgl.isoformat() if tgl else None,
-                "design": design_name,
-                "jenis_kain": jenis_kain,
-                "rolls": rolls,
-                "paste_quantity": 0.0,
-                "details": [],
-            }
-            current_batch["entries"].append(entry)
 
-            aux_accum = {}
-            
-            # process by grouped product_name
-            for pname, metas in grouped_meta.items():
-                if pname in SKIP_NAMES or not pname:
-                    continue
-                total_val = 0.0
-                for m in metas:
-                    if m["flat"] in parent_cols:
-                        continue
-                    val = safe_number(row[m["idx"]])
-                    
-                    if val is not None and val != 0:
-                        total_val += val
+        df, meta = self.read_excel(contents)
+        batches, skipped_rows = self._parse_batches(df, meta)
+        return batches, skipped_rows, len(df)
 
-                if total_val == 0:
-                    continue
-                
-                sample_meta = metas[0]  # use first for role / flags
-                if sample_meta["role"] == "aux":
+    async def _run(self, file: UploadFile):
+        # the same TEMPLATE QTY sheet imported before is not parsed again
+        fingerprints, imported = self.check_imported(file, IMPORT_TYPE)
+        if None in imported or SHEET_NAME in imported:
+            return APIResponse.ok(message="Workbook already imported, nothing to do")
+
+        # parsed by the preview of the same file already, if there was one
+        batches, skipped_rows, sheet_rows = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=sheet_rows, rows_parsed=sheet_rows, rows_skipped=len(skipped_rows))
+
+        # with chunk_size set: resumes after the batches committed by an interrupted import of this file
+        checkpoint = self.start_checkpoint(file, IMPORT_TYPE)
+        try:
+            if checkpoint is not None:
+                self.save_to_db({"batches": batches}, checkpoint)
+
+            # committed together with the (last) batches
+            register_import(
+                self.db, IMPORT_TYPE,
+                {key: value for key, value in fingerprints.items() if key in (None, SHEET_NAME)},
+                filename=file.filename, row_counts={SHEET_NAME: sheet_rows},
+            )
 
-                    if sample_meta["is_paste_col"]:
-                        entry["paste_quantity"] += total_val
-                    else:
-                        aux_accum[pname] = aux_accum.get(pname, 0.0) + total_val
-                else:
-                    # dyestuff values are in grams → convert to kilograms
-                    total_val_kg = total_val / 1000.0
-                    batch_agg[pname] = batch_agg.get(pname, 0.0) + total_val_kg
-            for pname, qty in aux_accum.items():
-                entry["details"].append({"product_name": pname, "quantity": qty})
-        
-        finalize_batch()
-        ret = self.save_to_db({"batches": batches})
+            if checkpoint is not None:
+                self.commit_chunk(checkpoint, len(batches), status="done", sheet_name=SHEET_NAME)
+            else:
+                ret = self.save_to_db({"batches": batches})
+        except Exception as e:
+            self.fail_checkpoint(checkpoint, e)
+            raise
+        self.report_progress(rows_inserted=sheet_rows - len(skipped_rows))
 
         return APIResponse.created()
     
 
     async def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        df, meta = self.read_excel(contents)
-        parent_cols = ["OPJ", "DESIGN", "JENIS KAIN", "ROLL", "TGL"]
-
-        batches = []
-        current_batch = None
-        batch_agg = {}
-        skipped_rows = []
-        grouped_meta = defaultdict(list)
-        for m in meta:
-            grouped_meta[m["product_name"]].append(m)
-
-        def finalize_batch():
-            nonlocal current_batch, batch_agg
-            if current_batch:
-                current_batch["details"] = [
-                    {"product_name": p, "quantity": qty}
-                    for p, qty in batch_agg.items() if qty and qty != 0
-                ]
-                batches.append(current_batch)
-            current_batch = None
-            batch_agg = {}
-
-        for r_idx, row in df.iterrows():
-            opj         = safe_str(row.get("OPJ"))
-            design_name = safe_str(row.get("DESIGN"))
-            jenis_kain  = safe_str(row.get("JENIS KAIN"))
-            rolls       = safe_number(row.get("ROLL"))
-            tgl         = safe_date(row.get("TGL"))
-
-            if not any([opj, design_name]):
-                finalize_batch()
-                skipped_rows.append({"row": r_idx + 1, "reason": "empty separator"})
-                continue
-
-            if current_batch is None:
-                current_batch = {
-                    "code": f"BATCH-{opj}-{tgl}",
-                    "date": tgl.isoformat() if tgl else None,
-                    "entries": [],
-                    "details": [],
-                }
-
-            entry = {
-                "code": opj,
-                "date": tgl.isoformat() if tgl else None,
-                "design": design_name,
-                "jenis_kain": jenis_kain,
-                "rolls": rolls,
-                "paste_quantity": 0.0,
-                "details": [],
-            }
-            current_batch["entries"].append(entry)
-
-            aux_accum = {}
-            for pname, metas in grouped_meta.items():
-                if pname in SKIP_NAMES or not pname:
-                    continue
-                total_val = 0.0
-                for m in metas:
-                    if m["flat"] in parent_cols:
-                        continue
-                    val = safe_number(row[m["idx"]])
-                    if val:
-                        total_val += val
-
-                if total_val == 0:
-                    continue
-
-                sample_meta = metas[0]
-                if sample_meta["role"] == "aux":
-                    if sample_meta["is_paste_col"]:
-                        entry["paste_quantity"] += total_val
-                    else:
-                        aux_accum[pname] = aux_accum.get(pname, 0.0) + total_val
-                else:
-                    # dyestuff values are in grams → convert to kilograms
-                    total_val_kg = total_val / 1000.0
-                    batch_agg[pname] = batch_agg.get(pname, 0.0) + total_val_kg
+        _, imported = self.check_imported(file, IMPORT_TYPE)
 
-            for pname, qty in aux_accum.items():
-                entry["details"].append({"product_name": pname, "quantity": qty})
-
-        finalize_batch()
+        # the parsed batches are cached for the import of the same file
+        batches, skipped_rows, _ = self.cached_parse(file, self._parse_file)
 
         # --- Validation check, same as save_to_db ---
         missing_products = set()
         missing_designs = set()
+        self._load_batch_lookups(batches)
 
         for b in batches:
             for d in b.get("details", []):
-                if not self.db.query(Product).filter_by(name=d["product_name"]).first():
+                if not self.lookup(Product, "name", d["product_name"]):
                     missing_products.add(d["product_name"])
             for e in b.get("entries", []):
-                if not self.db.query(Design).filter(Design.code == normalise_design_name(e["design"])).first():
+                if not self.lookup(Design, "code", normalise_design_name(e["design"])):
                     missing_designs.add(e["design"])
                 for d in e.get("details", []):
-                    if not self.db.query(Product).filter_by(name=d["product_name"]).first():
+                    if not self.lookup(Product, "name", d["product_name"]):
                         missing_products.add(d["product_name"])
 
-        def safe_json(obj):
-            """Recursively convert datetime objects to isoformat strings."""
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            elif isinstance(obj, list):
-                return [safe_json(i) for i in obj]
-            elif isinstance(obj, dict):
-                return {k: safe_json(v) for k, v in obj.items()}
-            return obj
-
         return APIResponse.ok(
-            data=safe_json({
+            data={
                 "batches": batches[:30],
                 "missing_products": sorted(list(missing_products))[:30],
                 "missing_designs": sorted(list(missing_designs))[:30],
                 "skipped_rows": skipped_rows[:30],
                 "skipped_rows_count": len(skipped_rows),
-                "batch_count": len(batches)
-            })
+                "batch_count": len(batches),
+                "already_imported": None in imported or SHEET_NAME in imported,
+            }
         )
         
\ No newline at end of file
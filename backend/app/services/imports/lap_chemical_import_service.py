@@ -16,15 +16,39 @@ from app.models import (
     ProductAvgCostCache
 )
 
-from app.utils.safe_parse import safe_str, safe_date, safe_number
-from app.utils.cost_helper import get_avg_cost_for_product
+from app.utils.safe_parse import str_column, date_column, number_column, parse_columns
+from app.utils.cost_helper import get_costs_as_of
 from app.utils.response import APIResponse
 
+SHEET_COLUMNS = {
+    "code": ("NOBUKTI", str_column),
+    "tanggal": ("TANGGAL", date_column),
+    "qty": ("QTY", number_column),
+    "nama_brg": ("NAMABRG", str_column),
+}
+
 class LapChemicalImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
 
-    def _run(self, file: UploadFile):
+    def _parse_sheet(self, df: pd.DataFrame):
+        """
+        Clean the sheet column by column.
+        Returns (complete rows as records, number of rows missing a required field).
+        """
+        rows = parse_columns(df, SHEET_COLUMNS)
+        rows["excel_row"] = rows.index + 5  # offset since header=4
+
+        # --- Required fields check ---
+        complete = rows["code"].notna() & rows["tanggal"].notna() & rows["qty"].notna() & rows["nama_brg"].notna()
+        return rows[complete].to_dict("records"), int((~complete).sum())
+
+    def _load_product_lookup(self, rows: list):
+        """Preload every product named in the sheet with one query."""
+        self.load_lookup(Product, "name", (r["nama_brg"].upper() for r in rows))
+
+    def _parse_file(self, file: UploadFile):
+        """Read and clean the CHEMICAL sheet: (records, incomplete rows, sheet rows)."""
         contents: bytes = file.file.read()
 
         df = pd.read_excel(
@@ -33,25 +57,24 @@ class LapChemicalImportService(BaseImportService):
             header=4
         )
         df = df.iloc[:, :-2]  # drop trailing junk cols
+        parsed_rows, incomplete = self._parse_sheet(df)
+        return parsed_rows, incomplete, len(df)
 
-        inserted = {"movements": 0, "details": 0, "skipped": 0, "errors": []}
-        movements_map = {}  # (code, date) -> StockMovement
-
-        for idx, row in df.iterrows():
-            excel_row = idx + 5  # offset since header=4
+    def _run(self, file: UploadFile):
+        # parsed by the preview of the same file already, if there was one
+        parsed_rows, incomplete, sheet_rows = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=sheet_rows, rows_parsed=sheet_rows)
+        self._load_product_lookup(parsed_rows)
 
-            code = safe_str(row.get("NOBUKTI"))
-            tanggal = safe_date(row.get("TANGGAL"))
-            qty = safe_number(row.get("QTY"))
-            nama_brg = safe_str(row.get("NAMABRG"))
+        inserted = {"movements": 0, "details": 0, "skipped": incomplete, "errors": []}
+        movements_map = {}  # (code, date) -> StockMovement
+        rows = []
 
-            # --- Required fields check ---
-            if not code or not tanggal or qty is None or not nama_brg:
-                inserted["skipped"] += 1
-                continue
+        for row in parsed_rows:
+            excel_row, code, tanggal, qty, nama_brg = row["excel_row"], row["code"], row["tanggal"], row["qty"], row["nama_brg"]
 
             # --- find product ---
-            product = self.db.query(Product).filter_by(name=nama_brg.upper()).first()
+            product = self.lookup(Product, "name", nama_brg.upper())
             if not product:
                 inserted["errors"].append(
                     {
@@ -63,12 +86,17 @@ class LapChemicalImportService(BaseImportService):
                 )
                 continue
 
-            # --- fetch cached avg cost ---
-            unit_cost = get_avg_cost_for_product(self.db, product.id)
+            rows.append((excel_row, code, tanggal, qty, nama_brg, product))
+
+        # --- avg cost as of each movement date, one query for all rows ---
+        costs = get_costs_as_of(self.db, [(product.id, tanggal) for _, _, tanggal, _, _, product in rows])
+
+        for excel_row, code, tanggal, qty, nama_brg, product in rows:
+            unit_cost = costs.get((product.id, tanggal))
             if unit_cost is None:
                 inserted["errors"].append({
                     "row": excel_row,
-                    "reason": f"no cached avg cost for product: {nama_brg}",
+                    "reason": f"no avg cost as of {tanggal} for product: {nama_brg}",
                     "product_id": product.id,
                     "code": code,
                     "qty": qty
@@ -97,50 +125,45 @@ class LapChemicalImportService(BaseImportService):
             self.db.add(detail)
             inserted["details"] += 1
 
+        self.report_progress(rows_inserted=inserted["details"], rows_skipped=sheet_rows - inserted["details"])
         return inserted
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        df = pd.read_excel(
-            BytesIO(contents),
-            sheet_name="CHEMICAL",
-            header=4
-        )
-        df = df.iloc[:, :-2]
+        # the parsed sheet is cached for the import of the same file
+        parsed_rows, incomplete, sheet_rows = self.cached_parse(file, self._parse_file)
+        self._load_product_lookup(parsed_rows)
 
         summary = {
-            "total_rows": len(df),
+            "total_rows": sheet_rows,
             "valid_rows": 0,
-            "skipped": 0,
+            "skipped": incomplete,
             "errors": [],
             "movements": [],
         }
 
         movements_map = defaultdict(lambda: {"date": None, "code": None, "details": []})
+        rows = []
 
-        for idx, row in df.iterrows():
-            excel_row = idx + 5
-            code = safe_str(row.get("NOBUKTI"))
-            tanggal = safe_date(row.get("TANGGAL"))
-            qty = safe_number(row.get("QTY"))
-            nama_brg = safe_str(row.get("NAMABRG"))
-
-            if not code or not tanggal or qty is None or not nama_brg:
-                summary["skipped"] += 1
-                continue
+        for row in parsed_rows:
+            excel_row, code, tanggal, qty, nama_brg = row["excel_row"], row["code"], row["tanggal"], row["qty"], row["nama_brg"]
 
-            product = self.db.query(Product).filter_by(name=nama_brg.upper()).first()
+            product = self.lookup(Product, "name", nama_brg.upper())
             if not product:
                 summary["errors"].append(
                     {"row": excel_row, "reason": f"product not found: {nama_brg}", "code": code, "qty": qty}
                 )
                 continue
 
-            unit_cost = get_avg_cost_for_product(self.db, product.id)
+            rows.append((excel_row, code, tanggal, qty, nama_brg, product))
+
+        costs = get_costs_as_of(self.db, [(product.id, tanggal) for _, _, tanggal, _, _, product in rows])
+
+        for excel_row, code, tanggal, qty, nama_brg, product in rows:
+            unit_cost = costs.get((product.id, tanggal))
             if unit_cost is None:
                 summary["errors"].append({
                     "row": excel_row,
-                    "reason": f"no cached avg cost for product: {nama_brg}",
+                    "reason": f"no avg cost as of {tanggal} for product: {nama_brg}",
                     "product_id": product.id,
                     "code": code,
                     "qty": qty
@@ -1,10 +1,9 @@
 from fastapi import UploadFile
 from app.utils.deps import DB 
 from app.services.imports.base_import_service import BaseImportService
-from io import BytesIO
 import pandas as pd
 import math
-from openpyxl import load_workbook
+from datetime import date
 
 from app.models import (
     Product,
@@ -13,194 +12,307 @@ from app.models import (
     PurchasingDetail
 )
 
-from app.utils.normalise import normalise_product_name
-from app.utils.safe_parse import safe_str, safe_date, safe_number
-from app.utils.cost_helper import update_avg_cost_for_products, refresh_product_avg_cost
+from app.utils.normalise import normalise_product_names
+from app.utils.safe_parse import str_column, date_column, number_column, parse_columns
+from app.utils.cost_helper import flush_avg_cost_updates, refresh_product_avg_cost
 from app.utils.event_flags import skip_cost_cache_updates
+from app.utils.import_registry import register_import
 from app.utils.response import APIResponse
 
+# Excel rows start at 1, Pandas index starts at 0
+HEADER_ROW = 6  # you used header=6 → means actual header row is Excel row 7
+ROW_OFFSET = HEADER_ROW + 1  # offset for correct Excel row numbers
+
+EXCLUDE_SHEETS = ["JANUARI 2025", "FEB 2025", "MARET", "APRIL", "MEI", "JUNI", "JULI"] # TODO: only import AGUSTUS for now
+
+IMPORT_TYPE = "lap-pembelian"  # import registry key
+
+SHEET_COLUMNS = {
+    "kode_supplier": ("KODE SUPPLIER", str_column),
+    "tanggal": ("TANGGAL", date_column),
+    "no_bukti": ("NO.BUKTI", str_column),
+    "no_po": ("NO.PO", str_column),
+    "qty": ("QTY", number_column),
+    "price": ("HARGA SAT", number_column),
+    "discount": ("POT.", number_column),
+    "ppn": ("PPN", number_column),
+    "dpp": ("DPP", number_column),
+    "pph": ("PPH", number_column),
+    "tax_no": ("FAKTUR PAJAK", str_column),
+    "exchange_rate": ("KURS", number_column),
+}
+
+def sanitize(obj):
+    """NaN / inf floats as None, so the checkpoint state is valid JSON."""
+    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+        return None
+    if isinstance(obj, dict):
+        return {k: sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [sanitize(v) for v in obj]
+    return obj
+
 class LapPembelianImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
 
-    def _run(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        
-        wb = load_workbook(BytesIO(contents), data_only=True, keep_links=False)
-
-        purchasings_map = {}
-        count = {}
-        skipped = []
-
-        # Excel rows start at 1, Pandas index starts at 0
-        HEADER_ROW = 6  # you used header=6 → means actual header row is Excel row 7
-        ROW_OFFSET = HEADER_ROW + 1  # offset for correct Excel row numbers
-
-        affected_product_ids = set()
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """
+        Clean a sheet column by column and return one record per product row
+        (rows without a product name are dropped silently).
+        """
+        if "NAMA BARANG" not in df.columns:
+            return []
+
+        # treat None, NaN, NaT, "NAT", "NONE" as empty
+        raw_names = df["NAMA BARANG"]
+        product_names = str_column(normalise_product_names(raw_names))
+        keep = raw_names.notna() & product_names.notna() & ~product_names.isin(["NAT", "NONE"])
+
+        rows = parse_columns(df[keep], SHEET_COLUMNS)
+        rows["product_name"] = product_names[keep]
+        rows["excel_row"] = rows.index + ROW_OFFSET
+
+        # sheet PPN is per line, store it per unit (an empty or zero QTY divides by 1)
+        qty = rows["qty"].astype(float)
+        rows["ppn_unit"] = number_column(rows["ppn"].astype(float) / qty.where(qty != 0, 1))
+        return rows.to_dict("records")
+
+    def _load_sheet_lookups(self, rows: list):
+        """Preload the suppliers and products referenced by a sheet (one query each)."""
+        self.load_lookup(Supplier, "code", (r["kode_supplier"] for r in rows))
+        self.load_lookup(Product, "name", (r["product_name"].upper() for r in rows))
+
+    def _parse_workbook(self, file: UploadFile, skip_sheets=()):
+        """
+        Parse the imported sheets (but skip_sheets), streamed in chunks of rows. Yields
+        the estimated number of data rows first, then (sheet, sheet_rows, records)
+        per chunk; every sheet yields at least one chunk.
+        """
+        wb = self.open_workbook(file)
+        sheets = [sheet for sheet in wb.sheetnames if sheet not in EXCLUDE_SHEETS and sheet not in skip_sheets]
+        yield self.estimate_sheet_rows(wb, sheets, HEADER_ROW)
+
+        for sheet in sheets:
+            for df in self.iter_sheet_frames(wb, sheet, HEADER_ROW):
+                df = df.iloc[:, :-2]  # drop last 2 junk columns
+                yield sheet, len(df), self._parse_sheet(df)
+
+    @staticmethod
+    def _purchasings_state(purchasings_map: dict) -> list:
+        """purchasings_map as JSON for the checkpoint: [no_bukti, tanggal (ISO), kode_supplier, id]."""
+        return [
+            [key, None, supplier, purchasing_id] if isinstance(key, str) else [None, key.isoformat(), supplier, purchasing_id]
+            for (key, supplier), purchasing_id in purchasings_map.items()
+        ]
+
+    @staticmethod
+    def _purchasings_from_state(entries: list) -> dict:
+        return {
+            (no_bukti if no_bukti else date.fromisoformat(tanggal), supplier): purchasing_id
+            for no_bukti, tanggal, supplier, purchasing_id in entries
+        }
 
-        with skip_cost_cache_updates():
-            EXCLUDE_SHEETS = ["JANUARI 2025", "FEB 2025", "MARET", "APRIL", "MEI", "JUNI", "JULI"]
-            for sheet in wb.sheetnames:
-                if sheet in EXCLUDE_SHEETS:
-                    continue # TODO: only import AGUSTUS for now
+    def _run(self, file: UploadFile):
+        # sheets imported before, unchanged, are not parsed again
+        fingerprints, imported = self.check_imported(file, IMPORT_TYPE)
+        unchanged_sheets = sorted(sheet for sheet in imported if sheet is not None and sheet not in EXCLUDE_SHEETS)
+        if None in imported:
+            return {
+                "inserted_detail_counts": {},
+                "skipped_total": 0,
+                "skipped_sample": [],
+                "unchanged_sheets": unchanged_sheets,
+            }
 
-                df = pd.read_excel(BytesIO(contents), sheet_name=sheet, header=HEADER_ROW)
-                df = df.iloc[:, :-2]  # drop last 2 junk columns
+        # with chunk_size set: resumes after the rows committed by an interrupted import of this file
+        checkpoint = self.start_checkpoint(file, IMPORT_TYPE)
+        state = checkpoint.state if checkpoint is not None else {}
+        resume_after = checkpoint.records_done if checkpoint is not None else 0
+
+        # parsed by the preview of the same file already, if there was one
+        chunks = self.cached_parse_chunks(file, self._parse_workbook, unchanged_sheets)
+        self.report_progress("importing", rows_total=next(chunks))
+
+        purchasings_map = self._purchasings_from_state(state.get("purchasings", []))  # key -> purchasing id
+        count = dict(state.get("count", {}))
+        skipped_total = state.get("skipped_total", 0)
+        skipped_sample = list(state.get("skipped_sample", []))
+        rows_parsed = 0
+        records = 0  # product rows gone through, in parse order
+        position = {}  # sheet / Excel row of the last one
+
+        def skip(entry):
+            nonlocal skipped_total
+            skipped_total += 1
+            if len(skipped_sample) < 50:
+                skipped_sample.append(sanitize(entry))
+
+        def checkpoint_values():
+            return {
+                **position,
+                "state": {
+                    "count": count,
+                    "skipped_total": skipped_total,
+                    "skipped_sample": skipped_sample,
+                    "purchasings": self._purchasings_state(purchasings_map),
+                },
+            }
 
-                count[sheet] = 0
-
-                for idx, row in df.iterrows():
-                    excel_row_num = idx + ROW_OFFSET
-                    product_name_raw = row.get("NAMA BARANG")
-
-                    # treat None, NaN, NaT, "NAT", "NONE" as empty
-                    if pd.isna(product_name_raw):
-                        continue
-
-                    product_name = safe_str(normalise_product_name(product_name_raw))
-                    if not product_name or product_name in {"NAT", "NONE"}:
-                        continue  # skip silently
-
-                    # --- collect required fields ---
-                    kode_supplier = safe_str(row.get("KODE SUPPLIER"))
-                    tanggal = safe_date(row.get("TANGGAL"))
-                    no_bukti = safe_str(row.get("NO.BUKTI"))
-
-                    missing_cols = []
-                    if not kode_supplier:
-                        missing_cols.append("KODE SUPPLIER")
-                    if not tanggal and not no_bukti:
-                        missing_cols.append("TANGGAL/NO.BUKTI")
-
-                    # --- log missing requireds ---
-                    if missing_cols:
-                        skipped.append({
-                            "sheet": sheet,
-                            "row": excel_row_num,
-                            "reason": f"missing column(s): {', '.join(missing_cols)}",
-                            "product": product_name,
-                            "ppn": safe_number(row.get("PPN")),
-                            "dpp": safe_number(row.get("DPP")),
-                            "pph": safe_number(row.get("PPH")),
-                        })
-                        continue
-
-                    # --- supplier check ---
-                    supplier = self.db.query(Supplier).filter_by(code=kode_supplier).first()
-                    if not supplier:
-                        skipped.append({
-                            "sheet": sheet,
-                            "row": excel_row_num,
-                            "reason": f"supplier not found: {kode_supplier}",
-                            "product": product_name,
-                            "ppn": safe_number(row.get("PPN")),
-                            "dpp": safe_number(row.get("DPP")),
-                            "pph": safe_number(row.get("PPH")),
-                        })
-                        continue
-
-                    # --- purchasing key ---
-                    key = (no_bukti if no_bukti else tanggal, kode_supplier)
-                    if key not in purchasings_map:
-                        purchasing = Purchasing(
-                            date=tanggal,
-                            code=no_bukti,
-                            purchase_order=safe_str(row.get("NO.PO")),
-                            supplier_id=supplier.id
+        try:
+            with skip_cost_cache_updates():
+                for sheet, sheet_rows, rows in chunks:
+                    count.setdefault(sheet, 0)
+                    rows_parsed += sheet_rows
+                    self._load_sheet_lookups(rows)
+
+                    for i, row in enumerate(rows):
+                        if self.chunk_due(checkpoint, records):
+                            self.commit_chunk(checkpoint, records, **checkpoint_values())
+                            self._load_sheet_lookups(rows[i:])
+
+                        records += 1
+                        if records <= resume_after:
+                            continue  # committed by the interrupted import
+
+                        excel_row_num = row["excel_row"]
+                        product_name = row["product_name"]
+                        position = {"sheet_name": sheet, "row_number": excel_row_num}
+
+                        # --- collect required fields ---
+                        kode_supplier = row["kode_supplier"]
+                        tanggal = row["tanggal"]
+                        no_bukti = row["no_bukti"]
+
+                        missing_cols = []
+                        if not kode_supplier:
+                            missing_cols.append("KODE SUPPLIER")
+                        if not tanggal and not no_bukti:
+                            missing_cols.append("TANGGAL/NO.BUKTI")
+
+                        # --- log missing requireds ---
+                        if missing_cols:
+                            skip({
+                                "sheet": sheet,
+                                "row": excel_row_num,
+                                "reason": f"missing column(s): {', '.join(missing_cols)}",
+                                "product": product_name,
+                                "ppn": row["ppn"],
+                                "dpp": row["dpp"],
+                                "pph": row["pph"],
+                            })
+                            continue
+
+                        # --- supplier check ---
+                        supplier = self.lookup(Supplier, "code", kode_supplier)
+                        if not supplier:
+                            skip({
+                                "sheet": sheet,
+                                "row": excel_row_num,
+                                "reason": f"supplier not found: {kode_supplier}",
+                                "product": product_name,
+                                "ppn": row["ppn"],
+                                "dpp": row["dpp"],
+                                "pph": row["pph"],
+                            })
+                            continue
+
+                        # --- purchasing key ---
+                        key = (no_bukti if no_bukti else tanggal, kode_supplier)
+                        if key not in purchasings_map:
+                            purchasing = Purchasing(
+                                date=tanggal,
+                                code=no_bukti,
+                                purchase_order=row["no_po"],
+                                supplier_id=supplier.id
+                            )
+                            self.db.add(purchasing)
+                            self.db.flush()
+                            purchasings_map[key] = purchasing.id
+
+                        # --- product check ---
+                        product = self.lookup(Product, "name", product_name.upper())
+                        if not product:
+                            skip({
+                                "sheet": sheet,
+                                "row": excel_row_num,
+                                "reason": f"product not found: {product_name}",
+                                "ppn": row["ppn"],
+                                "dpp": row["dpp"],
+                                "pph": row["pph"],
+                            })
+                            continue
+
+                        # --- detail insert ---
+                        detail = PurchasingDetail(
+                            quantity=row["qty"] or 0,
+                            price=row["price"] or 0,
+                            discount=row["discount"] or 0.0,
+                            ppn=row["ppn_unit"] or 0.0,
+                            dpp=row["dpp"] or 0.0,
+                            pph=row["pph"] or 0.0,
+                            tax_no=row["tax_no"],
+                            exchange_rate=row["exchange_rate"] or 1,
+                            product_id=product.id,
+                            purchasing_id=purchasings_map[key]
                         )
-                        self.db.add(purchasing)
-                        self.db.flush()
-                        purchasings_map[key] = purchasing
-                    else:
-                        purchasing = purchasings_map[key]
-
-                    # --- product check ---
-                    product = self.db.query(Product).filter_by(name=product_name.upper()).first()
-                    if not product:
-                        skipped.append({
-                            "sheet": sheet,
-                            "row": excel_row_num,
-                            "reason": f"product not found: {product_name}",
-                            "ppn": safe_number(row.get("PPN")),
-                            "dpp": safe_number(row.get("DPP")),
-                            "pph": safe_number(row.get("PPH")),
-                        })
-                        continue
-
-                    # --- detail insert ---
-                    detail = PurchasingDetail(
-                        quantity=safe_number(row.get("QTY")) or 0,
-                        price=safe_number(row.get("HARGA SAT")) or 0,
-                        discount=safe_number(row.get("POT.")) or 0.0,
-                        ppn=safe_number((row.get("PPN") or 0) / (row.get("QTY") or 1)) or 0.0,
-                        dpp=safe_number(row.get("DPP")) or 0.0,
-                        pph=safe_number((row.get("PPH")) or 0 / (row.get("QTY") or 1)) or 0.0,
-                        tax_no=safe_str(row.get("FAKTUR PAJAK")),
-                        exchange_rate=safe_number(row.get("KURS")) or 1,
-                        product_id=product.id,
-                        purchasing_id=purchasing.id
-                    )
-                    self.db.add(detail)
-                    affected_product_ids.add(product.id)
-                    
-                    count[sheet] += 1
-
-            self.db.commit()
-
-        # Bulk update the cost cache for all affected products
-        if affected_product_ids:
-            update_avg_cost_for_products(self.db.connection(), list(affected_product_ids))
+                        self.db.add(detail)
+
+                        count[sheet] += 1
+
+                    self.report_progress(rows_parsed=rows_parsed, rows_inserted=sum(count.values()), rows_skipped=skipped_total)
+
+                # committed with the rows: the same file / sheets are skipped next time
+                register_import(
+                    self.db, IMPORT_TYPE,
+                    {key: value for key, value in fingerprints.items() if key is None or key in count},
+                    filename=file.filename, row_counts=count,
+                )
+
+                self.report_progress("committing")
+                if checkpoint is not None:
+                    self.commit_chunk(checkpoint, records, status="done", **checkpoint_values())
+                else:
+                    self.db.commit()
+        except Exception as e:
+            self.fail_checkpoint(checkpoint, e)
+            raise
+
+        # Cost cache updates were deferred above, apply them for all affected products in one go
+        # (chunked imports applied them with every chunk)
+        self.report_progress("updating costs")
+        flush_avg_cost_updates(self.db)
+        self.db.commit()
 
         # refresh_product_avg_cost(self.db)
 
-        def sanitize(obj):
-            if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-                return None
-            if isinstance(obj, dict):
-                return {k: sanitize(v) for k, v in obj.items()}
-            if isinstance(obj, list):
-                return [sanitize(v) for v in obj]
-            return obj
-
-        return sanitize({
+        return {
             "inserted_detail_counts": count,
-            "skipped_total": len(skipped),
-            "skipped_sample": skipped[:50],
-        })
+            "skipped_total": skipped_total,
+            "skipped_sample": skipped_sample,
+            "unchanged_sheets": unchanged_sheets,
+        }
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        wb = load_workbook(BytesIO(contents), data_only=True, keep_links=False)
+        _, imported = self.check_imported(file, IMPORT_TYPE)
+        unchanged_sheets = sorted(sheet for sheet in imported if sheet is not None and sheet not in EXCLUDE_SHEETS)
 
-        HEADER_ROW = 6
-        ROW_OFFSET = HEADER_ROW + 1
+        # the parsed chunks are cached for the import of the same file
+        chunks = self.cached_parse_chunks(file, self._parse_workbook, unchanged_sheets)
+        next(chunks)  # estimated row count, only used for job progress
 
         summary = {"sheets": {}, "missing_products": set(), "missing_suppliers": set(), "skipped": []}
-        EXCLUDE_SHEETS = ["JANUARI 2025", "FEB 2025", "MARET", "APRIL", "MEI", "JUNI", "JULI"]
-        for sheet in wb.sheetnames:
-            if sheet in EXCLUDE_SHEETS:
-                continue  
-
-            df = pd.read_excel(BytesIO(contents), sheet_name=sheet, header=HEADER_ROW)
-            df = df.iloc[:, :-2]
-
-            rows_preview = []
-            valid_rows = 0
-
-            for idx, row in df.iterrows():
-                excel_row_num = idx + ROW_OFFSET
-                product_name_raw = row.get("NAMA BARANG")
+        for sheet, _, rows in chunks:
+            sheet_summary = summary["sheets"].setdefault(sheet, {"valid_rows": 0, "preview_rows": []})
+            self._load_sheet_lookups(rows)
 
-                if pd.isna(product_name_raw):
-                    continue
-
-                product_name = safe_str(normalise_product_name(product_name_raw))
-                if not product_name or product_name in {"NAT", "NONE"}:
-                    continue
+            for row in rows:
+                excel_row_num = row["excel_row"]
+                product_name = row["product_name"]
 
-                kode_supplier = safe_str(row.get("KODE SUPPLIER"))
-                tanggal = safe_date(row.get("TANGGAL"))
-                no_bukti = safe_str(row.get("NO.BUKTI"))
+                kode_supplier = row["kode_supplier"]
+                tanggal = row["tanggal"]
+                no_bukti = row["no_bukti"]
 
                 missing_cols = []
                 if not kode_supplier:
@@ -217,7 +329,7 @@ class LapPembelianImportService(BaseImportService):
                     })
                     continue
 
-                supplier = self.db.query(Supplier).filter_by(code=kode_supplier).first()
+                supplier = self.lookup(Supplier, "code", kode_supplier)
                 if not supplier:
                     summary["missing_suppliers"].add(kode_supplier)
                     summary["skipped"].append({
@@ -228,7 +340,7 @@ class LapPembelianImportService(BaseImportService):
                     })
                     continue
 
-                product = self.db.query(Product).filter_by(name=product_name.upper()).first()
+                product = self.lookup(Product, "name", product_name.upper())
                 if not product:
                     summary["missing_products"].add(product_name)
                     summary["skipped"].append({
@@ -238,24 +350,21 @@ class LapPembelianImportService(BaseImportService):
                     })
                     continue
 
-                valid_rows += 1
-                rows_preview.append({
+                sheet_summary["valid_rows"] += 1
+                if len(sheet_summary["preview_rows"]) >= 30:
+                    continue  # limit to first 30 rows per sheet
+                sheet_summary["preview_rows"].append({
                     "sheet": sheet,
                     "row": excel_row_num,
                     "supplier": kode_supplier,
                     "product": product_name,
-                    "qty": safe_number(row.get("QTY")),
-                    "price": safe_number(row.get("HARGA SAT")),
-                    "total": round((row.get("QTY") or 0) * (row.get("HARGA SAT") or 0), 2),
+                    "qty": row["qty"],
+                    "price": row["price"],
+                    "total": round((row["qty"] or 0) * (row["price"] or 0), 2),
                     "tanggal": tanggal.isoformat() if tanggal else None,
                     "no_bukti": no_bukti,
                 })
 
-            summary["sheets"][sheet] = {
-                "valid_rows": valid_rows,
-                "preview_rows": rows_preview[:30],  # limit to first 30 rows per sheet
-            }
-
         return APIResponse.ok(
             data={
                 "summary": {
@@ -263,6 +372,7 @@ class LapPembelianImportService(BaseImportService):
                     "missing_products": sorted(list(summary["missing_products"])),
                     "missing_suppliers": sorted(list(summary["missing_suppliers"])),
                     "skipped_total": len(summary["skipped"]),
+                    "unchanged_sheets": unchanged_sheets,  # imported before, skipped
                 },
                 "sheets": summary["sheets"],
                 "skipped_sample": summary["skipped"][:50],
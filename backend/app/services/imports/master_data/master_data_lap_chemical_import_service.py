@@ -9,18 +9,39 @@ from app.models import (
     Account, 
 )
 
-from app.utils.normalise import normalise_product_name
+from app.utils.normalise import normalise_product_names
 from app.utils.response import APIResponse
 
 class MasterDataLapChemicalImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
 
-    def _run(self, file: UploadFile):
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """Clean the sheet column by column: (code, name, unit) for every row with a code and a name."""
+        rows = df[df["NAMABRG"].notna() & df["KDBRG"].notna()]
+        codes = rows["KDBRG"].astype(object).astype(str).str.strip().str.upper()
+        names = normalise_product_names(rows["NAMABRG"])
+        units = rows["SAT"] if "SAT" in rows.columns else pd.Series([None] * len(rows), dtype=object)
+        return list(zip(codes, names, units.tolist()))
+
+    def _load_product_lookups(self, rows: list):
+        """Preload the products matching the sheet's codes or names (one query each)."""
+        self.load_lookup(Product, "code", (code for code, _, _ in rows))
+        self.load_lookup(Product, "name", (name for _, name, _ in rows))
+
+    def _parse_file(self, file: UploadFile):
+        """Read and clean the CHEMICAL sheet: (records, sheet rows)."""
         contents: bytes = file.file.read()
 
         xls = pd.ExcelFile(BytesIO(contents))
         df = pd.read_excel(xls, sheet_name="CHEMICAL", header=4)
+        return self._parse_sheet(df), len(df)
+
+    def _run(self, file: UploadFile):
+        # parsed by the preview of the same file already, if there was one
+        rows, _ = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=len(rows), rows_parsed=len(rows))
+        self._load_product_lookups(rows)
 
         # Lookup target account
         # account = self.db.query(Account).filter(Account.name == "PERSEDIAAN_OBAT").first()
@@ -30,17 +51,7 @@ class MasterDataLapChemicalImportService(BaseImportService):
         updated, inserted, skipped = 0, 0, []
         seen_codes = set()  # prevent duplicates within this run
 
-        for _, row in df.iterrows():
-            raw_name = row.get("NAMABRG")
-            code = row.get("KDBRG")
-            unit = row.get("SAT")
-
-            if pd.isna(raw_name) or pd.isna(code):
-                continue
-
-            name = normalise_product_name(raw_name)
-            code = str(code).strip().upper()
-
+        for code, name, unit in rows:
             # skip duplicate codes within Excel
             if code in seen_codes:
                 skipped.append(code)
@@ -48,11 +59,7 @@ class MasterDataLapChemicalImportService(BaseImportService):
             seen_codes.add(code)
 
             # Try to find existing product by code or name
-            product = (
-                self.db.query(Product)
-                .filter((Product.code == code) | (Product.name == name))
-                .first()
-            )
+            product = self.lookup(Product, "code", code) or self.lookup(Product, "name", name)
 
             if product:
                 # Update existing product’s code/name/account if needed
@@ -70,8 +77,11 @@ class MasterDataLapChemicalImportService(BaseImportService):
                     # account_id=account.id,
                 )
                 self.db.add(new_product)
+                self.add_to_lookup(Product, "code", new_product)
+                self.add_to_lookup(Product, "name", new_product)
                 inserted += 1
 
+        self.report_progress("committing", rows_inserted=inserted + updated, rows_skipped=len(skipped))
         self.db.commit()
 
         return {
@@ -83,9 +93,9 @@ class MasterDataLapChemicalImportService(BaseImportService):
         }
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        xls = pd.ExcelFile(BytesIO(contents))
-        df = pd.read_excel(xls, sheet_name="CHEMICAL", header=4)
+        # the parsed sheet is cached for the import of the same file
+        rows, sheet_rows = self.cached_parse(file, self._parse_file)
+        self._load_product_lookups(rows)
 
         # account = self.db.query(Account).filter(Account.name == "PERSEDIAAN_OBAT").first()
         # if not account:
@@ -94,27 +104,13 @@ class MasterDataLapChemicalImportService(BaseImportService):
         seen_codes = set()
         to_insert, to_update, skipped = [], [], []
 
-        for _, row in df.iterrows():
-            raw_name = row.get("NAMABRG")
-            code = row.get("KDBRG")
-            unit = row.get("SAT")
-
-            if pd.isna(raw_name) or pd.isna(code):
-                continue
-
-            name = normalise_product_name(raw_name)
-            code = str(code).strip().upper()
-
+        for code, name, unit in rows:
             if code in seen_codes:
                 skipped.append(code)
                 continue
             seen_codes.add(code)
 
-            product = (
-                self.db.query(Product)
-                .filter((Product.code == code) | (Product.name == name))
-                .first()
-            )
+            product = self.lookup(Product, "code", code) or self.lookup(Product, "name", name)
 
             if product:
                 action = "update" if (not product.code or not product.account_id) else "skip"
@@ -139,7 +135,7 @@ class MasterDataLapChemicalImportService(BaseImportService):
         return APIResponse.ok(
             data={
                 "summary": {
-                    "total_rows": len(df),
+                    "total_rows": sheet_rows,
                     "to_insert": len(to_insert),
                     "to_update": len(to_update),
                     "skipped": len(skipped),
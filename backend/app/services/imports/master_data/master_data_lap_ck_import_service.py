@@ -11,8 +11,7 @@ from app.models import (
     DesignType
 )
 
-from app.utils.normalise import normalise_design_name, normalise_design_type
-from app.utils.safe_parse import safe_str, safe_date, safe_number
+from app.utils.normalise import normalise_design_names, normalise_design_type
 from app.utils.response import APIResponse
 
 class MasterDataLapCkImportService(BaseImportService):
@@ -21,14 +20,29 @@ class MasterDataLapCkImportService(BaseImportService):
 
     def get_or_create_design_type(self, raw_value: str):
         normalized = normalise_design_type(raw_value)
-        dtype = self.db.query(DesignType).filter_by(name=normalized).first()
+        dtype = self.lookup(DesignType, "name", normalized)
         if not dtype:
             dtype = DesignType(name=normalized)
             self.db.add(dtype)
             self.db.flush()  # assign ID before commit
+            self.add_to_lookup(DesignType, "name", dtype)
         return dtype
 
-    def _run(self, file: UploadFile):
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """Clean the sheet column by column: (design code, raw type) for every OPJ row having both."""
+        rows = df[df["OPJ"].notna()]  # skip rows with no OPJ
+        codes = normalise_design_names(rows["DESIGN"])
+        types = rows["JENIS KAIN"].map(lambda v: str(v or ""))
+        return [(code, type_raw) for code, type_raw in zip(codes, types) if code and type_raw]
+
+    def _load_sheet_lookups(self, rows: list, designs: bool = False):
+        """Preload the design types (and designs) referenced by the sheet, one query each."""
+        self.load_lookup(DesignType, "name", {normalise_design_type(type_raw) for _, type_raw in rows})
+        if designs:
+            self.load_lookup(Design, "code", (code for code, _ in rows))
+
+    def _parse_file(self, file: UploadFile):
+        """Read and clean the design columns of the TEMPLATE QTY sheet: (records, sheet rows)."""
         contents: bytes = file.file.read()
 
         df = pd.read_excel(
@@ -38,21 +52,19 @@ class MasterDataLapCkImportService(BaseImportService):
             usecols="A:E"
         )
 
+        return self._parse_sheet(df), len(df)
+
+    def _run(self, file: UploadFile):
+        # parsed by the preview of the same file already, if there was one
+        rows, _ = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=len(rows), rows_parsed=len(rows))
+        self._load_sheet_lookups(rows)
+
         seen = set()
         added, skipped, unknown = 0, 0, []
         
 
-        for _, row in df.iterrows():
-            opj = row.get("OPJ")
-            if pd.isna(opj):
-                continue  # skip rows with no OPJ
-
-            code = normalise_design_name(str(row.get("DESIGN") or ""))
-            type_raw = str(row.get("JENIS KAIN") or "")
-
-            if not code or not type_raw:
-                continue
-
+        for code, type_raw in rows:
             if code in seen:
                 continue
             seen.add(code)
@@ -62,6 +74,7 @@ class MasterDataLapCkImportService(BaseImportService):
             added += 1
             self.db.add(design)
 
+        self.report_progress(rows_inserted=added, rows_skipped=len(rows) - added)
         return {
             "added": added,
             "skipped": skipped,
@@ -69,40 +82,26 @@ class MasterDataLapCkImportService(BaseImportService):
         }
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        df = pd.read_excel(
-            BytesIO(contents),
-            sheet_name="TEMPLATE QTY",
-            header=2,
-            usecols="A:E",
-        )
+        # the parsed sheet is cached for the import of the same file
+        rows, sheet_rows = self.cached_parse(file, self._parse_file)
+        self._load_sheet_lookups(rows, designs=True)
 
         seen = set()
         to_insert, existing, skipped = [], [], []
         missing_types = set()
 
-        for _, row in df.iterrows():
-            opj = row.get("OPJ")
-            if pd.isna(opj):
-                continue
-
-            code = normalise_design_name(str(row.get("DESIGN") or ""))
-            type_raw = str(row.get("JENIS KAIN") or "")
-
-            if not code or not type_raw:
-                continue
-
+        for code, type_raw in rows:
             if code in seen:
                 skipped.append(code)
                 continue
             seen.add(code)
 
             normalized_type = normalise_design_type(type_raw)
-            dtype = self.db.query(DesignType).filter_by(name=normalized_type).first()
+            dtype = self.lookup(DesignType, "name", normalized_type)
             if not dtype:
                 missing_types.add(normalized_type)
 
-            existing_design = self.db.query(Design).filter_by(code=code).first()
+            existing_design = self.lookup(Design, "code", code)
             if existing_design:
                 existing.append({"code": code, "type": normalized_type})
             else:
@@ -111,7 +110,7 @@ class MasterDataLapCkImportService(BaseImportService):
         return APIResponse.ok(
             data={
                 "summary": {
-                    "total_rows": len(df),
+                    "total_rows": sheet_rows,
                     "to_insert": len(to_insert),
                     "existing": len(existing),
                     "skipped": len(skipped),
@@ -1,7 +1,6 @@
 from fastapi import UploadFile
 from app.utils.deps import DB 
 from app.services.imports.base_import_service import BaseImportService
-from io import BytesIO
 import pandas as pd
 import math
 from openpyxl import load_workbook
@@ -13,29 +12,81 @@ from app.models import (
     AccountParent
 )
 
-from app.utils.normalise import normalise_product_name, normalise_account_name, normalise_supplier_name
+from app.core.sheet_parser import sheet_parser_pool
+from app.utils.import_registry import sheet_names
+from app.utils.normalise import normalise_product_names, normalise_account_names, normalise_supplier_names
 from app.utils.response import APIResponse
 
+EXCLUDE_SHEETS = {"JANUARI 2025", "FEB 2025"}
+
+def read_sheet(source, sheet: str) -> pd.DataFrame:
+    """One sheet of the workbook, trailing junk columns dropped (sheet_parser_pool task)."""
+    df = pd.read_excel(source, sheet_name=sheet, header=6)
+    return df.iloc[:, :-2]
+
 class MasterDataLapPembelianImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
 
-    def _run(self, file: UploadFile):
-        contents: bytes = file.file.read()
-
-        EXCLUDE_SHEETS = {"JANUARI 2025", "FEB 2025"}
-        
-        xls = pd.ExcelFile(BytesIO(contents))
-        frames = []
-        for sheet in xls.sheet_names:
-            if sheet.upper().strip() in EXCLUDE_SHEETS:
-                continue
-            
-            df = pd.read_excel(BytesIO(contents), sheet_name=sheet, header=6)
-            df = df.iloc[:, :-2]  # drop trailing junk cols
-            frames.append(df)
+    def _parse_rows(self, all_data: pd.DataFrame) -> list:
+        """Clean the concatenated sheets column by column, one record per sheet row."""
+        def column(name):
+            if name in all_data.columns:
+                return all_data[name]
+            return pd.Series([None] * len(all_data), index=all_data.index, dtype=object)
+
+        def text(name):
+            return column(name).map(lambda v: str(v or "")).str.strip()
+
+        acc_name = column("ACCOUNT")
+        product_name = column("NAMA BARANG")
+        unit = text("SATUAN").str.upper()
+        rows = pd.DataFrame({
+            "acc_no": column("NO.ACC"),
+            "acc_name": acc_name,
+            "acc_name_norm": normalise_account_names(acc_name).where(acc_name.notna(), None),
+            "product_name": normalise_product_names(product_name).where(product_name.notna(), None),
+            "unit": unit.where(unit != "", None),
+            "supplier_code": text("KODE SUPPLIER").str.upper(),
+            "supplier_name": normalise_supplier_names(column("SUPPLIER")),
+        })
+        return rows.to_dict("records")
+
+    def _load_lookups(self, rows: list):
+        """Preload the account parents, accounts, products and suppliers referenced by the sheets (one query each)."""
+        def acc_no_of(value):
+            try:
+                return int(float(value))
+            except (TypeError, ValueError):
+                return None
+
+        accounts = [r for r in rows if pd.notna(r["acc_no"]) and pd.notna(r["acc_name"])]
+        parents = self.load_lookup(AccountParent, "account_no", (acc_no_of(r["acc_no"]) for r in accounts))
+
+        account_keys = set()
+        for r in accounts:
+            parent = parents.get(acc_no_of(r["acc_no"]))
+            if parent:
+                account_keys.add((r["acc_name_norm"], parent.id))
+        self.load_lookup(Account, ("name", "parent_id"), account_keys)
+        self.load_lookup(Account, "name", (r["acc_name_norm"] for r in accounts))
+
+        self.load_lookup(Product, "name", (r["product_name"] for r in rows if r["product_name"] is not None))
+        self.load_lookup(Supplier, "code", (r["supplier_code"] for r in rows))
+
+    def _parse_file(self, file: UploadFile) -> list:
+        """Read every sheet but the excluded ones (in parallel) and clean them as one table."""
+        sheets = [sheet for sheet in sheet_names(file.file) if sheet.upper().strip() not in EXCLUDE_SHEETS]
+        frames = [df for _, df in sheet_parser_pool.map_sheets(file.file, sheets, read_sheet)]
 
         all_data = pd.concat(frames, ignore_index=True)
+        return self._parse_rows(all_data)
+
+    def _run(self, file: UploadFile):
+        # parsed by the preview of the same file already, if there was one
+        rows = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=len(rows), rows_parsed=len(rows))
+        self._load_lookups(rows)
 
         # Caches
         seen_account_parents = set()
@@ -50,13 +101,13 @@ class MasterDataLapPembelianImportService(BaseImportService):
             "suppliers": {"inserted": 0, "skipped": 0},
         }
 
-        for _, row in all_data.iterrows():
+        for row in rows:
             # --- Accounts ---
-            acc_no = row.get("NO.ACC")
-            acc_name = row.get("ACCOUNT")
+            acc_no = row["acc_no"]
+            acc_name = row["acc_name"]
             if pd.notna(acc_no) and pd.notna(acc_name):
                 acc_no = int(acc_no)
-                parent = self.db.query(AccountParent).filter_by(account_no=acc_no).first()
+                parent = self.lookup(AccountParent, "account_no", acc_no)
 
                 if acc_no not in seen_account_parents:
                     seen_account_parents.add(acc_no)
@@ -64,17 +115,14 @@ class MasterDataLapPembelianImportService(BaseImportService):
                         parent = AccountParent(account_no=acc_no)
                         self.db.add(parent)
                         self.db.flush()
+                        self.add_to_lookup(AccountParent, "account_no", parent)
                         summary["acc_parents"]["inserted"] += 1
                     else:
                         summary["acc_parents"]["skipped"] += 1
 
-                acc_name_norm = normalise_account_name(acc_name)
+                acc_name_norm = row["acc_name_norm"]
 
-                existing_acc = (
-                    self.db.query(Account)
-                    .filter_by(name=acc_name_norm, parent_id=parent.id)
-                    .first()
-                )
+                existing_acc = self.lookup(Account, ("name", "parent_id"), (acc_name_norm, parent.id))
                 if existing_acc or (acc_name_norm, parent.id) in seen_accounts:
                     summary["accounts"]["skipped"] += 1
                 else:
@@ -83,6 +131,7 @@ class MasterDataLapPembelianImportService(BaseImportService):
                         parent_id=parent.id,
                     )
                     self.db.add(account)
+                    self.add_to_lookup(Account, ("name", "parent_id"), account)
                     seen_accounts.add((acc_name_norm, parent.id))
                     summary["accounts"]["inserted"] += 1
 
@@ -91,34 +140,26 @@ class MasterDataLapPembelianImportService(BaseImportService):
         self.db.flush()
 
         # --- Products ---
-        for _, row in all_data.iterrows():
-            raw_name = row.get("NAMA BARANG")
-            if pd.notna(raw_name):
-                name = normalise_product_name(raw_name)
+        for row in rows:
+            name = row["product_name"]
+            if name is not None:
                 if name and name not in seen_products:
                     seen_products.add(name)
-                    unit = str(row.get("SATUAN") or "").strip().upper() or None
-                    acc_no = row.get("NO.ACC")
-                    acc_name = row.get("ACCOUNT")
+                    unit = row["unit"]
+                    acc_no = row["acc_no"]
+                    acc_name = row["acc_name"]
                     account_id = None
                     
                     if pd.notna(acc_name):
-                        acc_name_norm = normalise_account_name(acc_name)
+                        acc_name_norm = row["acc_name_norm"]
                         acc_no = int(acc_no)
                         
-                        existing_acc = (
-                            self.db.query(Account)
-                                .join(Account.parent)
-                                .filter(
-                                    Account.name == acc_name_norm,
-                                    AccountParent.account_no == acc_no
-                                )
-                                .first()
-                            )
+                        parent = self.lookup(AccountParent, "account_no", acc_no)
+                        existing_acc = parent and self.lookup(Account, ("name", "parent_id"), (acc_name_norm, parent.id))
                         if existing_acc:
                             account_id = existing_acc.id
 
-                    existing = self.db.query(Product).filter_by(name=name).first()
+                    existing = self.lookup(Product, "name", name)
                     if existing:
                         summary["products"]["skipped"] += 1
                     elif account_id == None:
@@ -134,11 +175,11 @@ class MasterDataLapPembelianImportService(BaseImportService):
                         summary["products"]["inserted"] += 1
 
             # --- Suppliers ---
-            code = str(row.get("KODE SUPPLIER") or "").strip().upper()
-            name = normalise_supplier_name(row.get("SUPPLIER") or "")
+            code = row["supplier_code"]
+            name = row["supplier_name"]
             if code and name and code not in seen_suppliers:
                 seen_suppliers.add(code)
-                existing = self.db.query(Supplier).filter_by(code=code).first()
+                existing = self.lookup(Supplier, "code", code)
                 if existing:
                     summary["suppliers"]["skipped"] += 1
                 else:
@@ -159,8 +200,6 @@ class MasterDataLapPembelianImportService(BaseImportService):
         but never writes to DB. Returns counts + sample data.
         """
 
-        EXCLUDE_SHEETS = {"JANUARI 2025", "FEB 2025"}
-
         def safe_int(x):
             try:
                 if pd.isna(x):
@@ -169,17 +208,9 @@ class MasterDataLapPembelianImportService(BaseImportService):
             except (ValueError, TypeError):
                 return None
 
-        contents: bytes = file.file.read()
-        xls = pd.ExcelFile(BytesIO(contents))
-        frames = []
-        for sheet in xls.sheet_names:
-            if sheet.upper().strip() in EXCLUDE_SHEETS:
-                continue
-            df = pd.read_excel(BytesIO(contents), sheet_name=sheet, header=6)
-            df = df.iloc[:, :-2]  # drop trailing junk cols
-            frames.append(df)
-
-        all_data = pd.concat(frames, ignore_index=True)
+        # the parsed sheets are cached for the import of the same file
+        rows = self.cached_parse(file, self._parse_file)
+        self._load_lookups(rows)
 
         # --- caches ------------------------------------------------------------
         seen_account_parents = set()
@@ -202,15 +233,15 @@ class MasterDataLapPembelianImportService(BaseImportService):
         missing_account_refs = []
 
         # --- simulate import ---------------------------------------------------
-        for _, row in all_data.iterrows():
+        for row in rows:
             # ===== ACCOUNTS =====
-            acc_no = safe_int(row.get("NO.ACC"))
-            acc_name = row.get("ACCOUNT")
+            acc_no = safe_int(row["acc_no"])
+            acc_name = row["acc_name"]
             if acc_no and pd.notna(acc_name):
-                acc_name_norm = normalise_account_name(acc_name)
+                acc_name_norm = row["acc_name_norm"]
 
                 # Parent check
-                parent_exists = self.db.query(AccountParent).filter_by(account_no=acc_no).first()
+                parent_exists = self.lookup(AccountParent, "account_no", acc_no)
                 if acc_no not in seen_account_parents and not parent_exists:
                     to_insert["acc_parents"].append({"account_no": acc_no})
                     seen_account_parents.add(acc_no)
@@ -226,11 +257,7 @@ class MasterDataLapPembelianImportService(BaseImportService):
                 parent_id = getattr(parent_exists, "id", None)
                 existing_acc = None
                 if parent_id:
-                    existing_acc = (
-                        self.db.query(Account)
-                        .filter_by(name=acc_name_norm, parent_id=parent_id)
-                        .first()
-                    )
+                    existing_acc = self.lookup(Account, ("name", "parent_id"), (acc_name_norm, parent_id))
 
                 if existing_acc or (acc_name_norm, acc_no) in seen_accounts:
                     if acc_name_norm not in seen_accounts:
@@ -244,18 +271,16 @@ class MasterDataLapPembelianImportService(BaseImportService):
                     seen_accounts.add((acc_name_norm, acc_no))
 
             # ===== PRODUCTS =====
-            raw_name = row.get("NAMA BARANG")
-            if pd.notna(raw_name):
-                name = normalise_product_name(raw_name)
+            name = row["product_name"]
+            if name is not None:
                 if name and name not in seen_products:
                     seen_products.add(name)
-                    unit = str(row.get("SATUAN") or "").strip().upper() or None
+                    unit = row["unit"]
 
                     # ✅ now match to Account by ACCOUNT NAME (not NO.ACC)
-                    acc_name_raw = row.get("ACCOUNT")
-                    acc_name_norm = normalise_account_name(acc_name_raw) if pd.notna(acc_name_raw) else None
+                    acc_name_norm = row["acc_name_norm"]
 
-                    existing_product = self.db.query(Product).filter_by(name=name).first()
+                    existing_product = self.lookup(Product, "name", name)
                     if existing_product:
                         skipped["products"].append(
                             {"name": name, "reason": "Already exists"}
@@ -265,11 +290,7 @@ class MasterDataLapPembelianImportService(BaseImportService):
                     # 🔹 check if account with that name exists in DB or will exist after import
                     account_exists = None
                     if acc_name_norm:
-                        account_exists = (
-                            self.db.query(Account)
-                            .filter_by(name=acc_name_norm)
-                            .first()
-                        )
+                        account_exists = self.lookup(Account, "name", acc_name_norm)
 
                     will_exist = bool(
                         account_exists
@@ -304,11 +325,11 @@ class MasterDataLapPembelianImportService(BaseImportService):
                         )
 
             # ===== SUPPLIERS =====
-            code = str(row.get("KODE SUPPLIER") or "").strip().upper()
-            supp_name = normalise_supplier_name(row.get("SUPPLIER") or "")
+            code = row["supplier_code"]
+            supp_name = row["supplier_name"]
             if code and supp_name and code not in seen_suppliers:
                 seen_suppliers.add(code)
-                existing = self.db.query(Supplier).filter_by(code=code).first()
+                existing = self.lookup(Supplier, "code", code)
                 if existing:
                     skipped["suppliers"].append(
                         {"code": code, "name": supp_name, "reason": "Already exists"}
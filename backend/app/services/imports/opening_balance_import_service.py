@@ -18,11 +18,18 @@ from app.models import (
     StockMovementDetail,
 )
 
-from app.utils.normalise import normalise_product_name
-from app.utils.safe_parse import safe_str, safe_date, safe_number
-from app.utils.cost_helper import update_avg_cost_for_products, refresh_product_avg_cost
+from app.utils.normalise import normalise_product_names
+from app.utils.safe_parse import str_column, number_column, parse_columns
+from app.utils.cost_helper import refresh_product_avg_cost
 from app.utils.response import APIResponse
 
+SHEET_COLUMNS = {
+    "init_qty": ("SALDO AWAL", number_column),
+    "price": ("JUMLAH SALDO AWAL + PPN", number_column),
+    "tmp_price": ("JUMLAH FISIK", number_column),
+    "end_qty": ("FISIK", number_column),
+}
+
 class OpeningBalanceImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
@@ -35,17 +42,34 @@ class OpeningBalanceImportService(BaseImportService):
             self.db.commit()
         return supplier
 
-    def _run(self, file: UploadFile):
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """Clean the sheet column by column, one record per row that names a product."""
+        rows = parse_columns(df, SHEET_COLUMNS)
+        rows["prod_name"] = str_column(normalise_product_names(df["NAMA BARANG"]))
+        return rows[rows["prod_name"].notna()].to_dict("records")
+
+    def _load_product_lookup(self, rows: list):
+        """Preload every product named in the sheet with one query."""
+        self.load_lookup(Product, "name", (r["prod_name"] for r in rows))
+
+    def _parse_file(self, file: UploadFile):
+        """Read and clean the GUDANG BESAR sheet: (records, sheet rows numbered in NO)."""
         contents: bytes = file.file.read()
 
-        system_supplier = self.get_or_create_system_supplier()
-    
         # Load Excel
         xls = pd.ExcelFile(BytesIO(contents))
-        start_date = datetime(2025,7,31)
-        
         df = pd.read_excel(xls, sheet_name="GUDANG BESAR", header=4)
         df = df[df["NO"].notna()]
+        return self._parse_sheet(df), len(df)
+
+    def _run(self, file: UploadFile):
+        system_supplier = self.get_or_create_system_supplier()
+        start_date = datetime(2025,7,31)
+
+        # parsed by the preview of the same file already, if there was one
+        rows, _ = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=len(rows), rows_parsed=len(rows))
+        self._load_product_lookup(rows)
         
         purchasing = Purchasing(
             date=start_date,
@@ -59,26 +83,23 @@ class OpeningBalanceImportService(BaseImportService):
         skipped = 0
         skipped_products = []
         added = 0
-        affected_products = set()
         
-        for _, row in df.iterrows():
-            prod_name = safe_str(normalise_product_name(row.get("NAMA BARANG")))
-            if prod_name is None:
-                continue
+        for row in rows:
+            prod_name = row["prod_name"]
 
-            product = self.db.query(Product).filter_by(name=prod_name).first()
+            product = self.lookup(Product, "name", prod_name)
             if not product:
                 print(f"⚠️ Product not found: {prod_name}, skipping")
                 skipped += 1
                 skipped_products.append({"name": prod_name, "reason": "Product not found"})
                 continue
 
-            init_qty = safe_number(row.get("SALDO AWAL"))
+            init_qty = row["init_qty"]
 
-            price = safe_number(row.get("JUMLAH SALDO AWAL + PPN"))
+            price = row["price"]
             if price is None or price == 0:
-                tmp_price = safe_number(row.get("JUMLAH FISIK"))
-                end_qty = safe_number(row.get("FISIK"))
+                tmp_price = row["tmp_price"]
+                end_qty = row["end_qty"]
                 unit_price = tmp_price / end_qty if end_qty != 0 else 0
             else:
                 price = price / init_qty
@@ -105,14 +126,12 @@ class OpeningBalanceImportService(BaseImportService):
                 exchange_rate=0.0,
             )
             self.db.add(detail)
-            affected_products.add(product.id)
             added += 1
 
+        # commit recomputes the cost cache for every product added above
+        self.report_progress("committing", rows_inserted=added, rows_skipped=skipped)
         self.db.commit()
 
-        if affected_products:
-            update_avg_cost_for_products(self.db.connection(), list(affected_products))
-
         # refresh_product_avg_cost(self.db)
         
 
@@ -125,35 +144,31 @@ class OpeningBalanceImportService(BaseImportService):
         )
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        xls = pd.ExcelFile(BytesIO(contents))
         start_date = datetime(2025, 7, 31)
 
-        df = pd.read_excel(xls, sheet_name="GUDANG BESAR", header=4)
-        df = df[df["NO"].notna()]
+        # the parsed sheet is cached for the import of the same file
+        rows, sheet_rows = self.cached_parse(file, self._parse_file)
+        self._load_product_lookup(rows)
 
         preview_rows = []
         skipped_products = []
         added = 0
 
-        for _, row in df.iterrows():
-            prod_name = safe_str(normalise_product_name(row.get("NAMA BARANG")))
-            if not prod_name:
-                continue
+        for row in rows:
+            prod_name = row["prod_name"]
 
-            
-            product = self.db.query(Product).filter_by(name=prod_name).first()
+            product = self.lookup(Product, "name", prod_name)
             if not product:
                 print(f"⚠️ Product not found: {prod_name}, skipping")
                 skipped_products.append({"name": prod_name, "reason": "Product not found"})
                 continue
 
-            init_qty = safe_number(row.get("SALDO AWAL"))
+            init_qty = row["init_qty"]
 
-            price = safe_number(row.get("JUMLAH SALDO AWAL + PPN"))
+            price = row["price"]
             if price is None or price == 0:
-                tmp_price = safe_number(row.get("JUMLAH FISIK"))
-                end_qty = safe_number(row.get("FISIK"))
+                tmp_price = row["tmp_price"]
+                end_qty = row["end_qty"]
                 unit_price = tmp_price / end_qty if end_qty != 0 else 0
             else:
                 price = price / init_qty
@@ -179,7 +194,7 @@ class OpeningBalanceImportService(BaseImportService):
         return APIResponse.ok(
             data={
                 "summary": {
-                    "total_rows": len(df),
+                    "total_rows": sheet_rows,
                     "valid_products": added,
                     "skipped_products": len(skipped_products),
                 },
@@ -14,22 +14,47 @@ from app.models import (
 
 from app.models.ledger import LedgerLocation, LedgerRef
 
-from app.utils.normalise import normalise_product_name
-from app.utils.safe_parse import safe_str, safe_date, safe_number
+from app.utils.normalise import normalise_product_names
+from app.utils.safe_parse import str_column, number_column, parse_columns
 from app.utils.response import APIResponse
 
+SHEET_COLUMNS = {
+    "saldo_awal": ("SALDO AWAL", number_column),
+    "mutasi_masuk": ("MUTASI MASUK", number_column),
+    "mutasi_keluar": ("MUTASI KELUAR", number_column),
+    "physical_qty": ("FISIK", number_column),
+}
+
 class StockOpnameChemicalImportService(BaseImportService):
     def __init__(self, db: DB):
         super().__init__(db)
 
-    def _run(self, file: UploadFile):
+    def _parse_sheet(self, df: pd.DataFrame) -> list:
+        """Clean the sheet column by column, one record per row that names a product."""
+        rows = parse_columns(df, SHEET_COLUMNS)
+        rows["prod_name"] = str_column(normalise_product_names(df["NAMA BARANG"]))
+        return rows[rows["prod_name"].notna()].to_dict("records")
+
+    def _load_product_lookup(self, rows: list):
+        """Preload every product named in the sheet with one query."""
+        self.load_lookup(Product, "name", (r["prod_name"] for r in rows))
+
+    def _parse_file(self, file: UploadFile):
+        """Read and clean the GUDANG BESAR sheet: (records, sheet rows numbered in NO)."""
         contents: bytes = file.file.read()
 
         xls = pd.ExcelFile(BytesIO(contents))
-        start_date = datetime(2025,7,31)
-        
         df = pd.read_excel(xls, sheet_name="GUDANG BESAR", header=4)
         df = df[df["NO"].notna()]
+        return self._parse_sheet(df), len(df)
+
+    def _run(self, file: UploadFile):
+        start_date = datetime(2025,7,31)
+
+        # parsed by the preview of the same file already, if there was one
+        rows, _ = self.cached_parse(file, self._parse_file)
+        self.report_progress("importing", rows_total=len(rows), rows_parsed=len(rows))
+        self._load_product_lookup(rows)
 
         so_code = "SO-" + start_date.strftime("%Y%m%d")
         
@@ -44,15 +69,13 @@ class StockOpnameChemicalImportService(BaseImportService):
         skipped_products = []
         added = 0
         
-        for _, row in df.iterrows():
-            prod_name = safe_str(normalise_product_name(row.get("NAMA BARANG")))
-            if prod_name is None:
-                continue
+        for row in rows:
+            prod_name = row["prod_name"]
 
-            system_qty = safe_number(row.get("SALDO AWAL")) + safe_number(row.get("MUTASI MASUK")) - safe_number(row.get("MUTASI KELUAR"))
-            physical_qty = safe_number(row.get("FISIK"))
+            system_qty = row["saldo_awal"] + row["mutasi_masuk"] - row["mutasi_keluar"]
+            physical_qty = row["physical_qty"]
 
-            product = self.db.query(Product).filter_by(name=prod_name).first()
+            product = self.lookup(Product, "name", prod_name)
             if not product:
                 print(f"⚠️ Product not found: {prod_name}, skipping")
                 skipped += 1
@@ -108,6 +131,7 @@ class StockOpnameChemicalImportService(BaseImportService):
                 self.db.add(ledger_entry)
             added += 1
 
+        self.report_progress("committing", rows_inserted=added, rows_skipped=skipped)
         self.db.commit()
 
         return {
@@ -117,27 +141,24 @@ class StockOpnameChemicalImportService(BaseImportService):
         }
     
     def preview(self, file: UploadFile):
-        contents: bytes = file.file.read()
-        xls = pd.ExcelFile(BytesIO(contents))
         start_date = datetime(2025, 7, 31)
 
-        df = pd.read_excel(xls, sheet_name="GUDANG BESAR", header=4)
-        df = df[df["NO"].notna()]
+        # the parsed sheet is cached for the import of the same file
+        rows, sheet_rows = self.cached_parse(file, self._parse_file)
+        self._load_product_lookup(rows)
 
         preview_rows = []
         skipped_products = []
         added = 0
 
-        for _, row in df.iterrows():
-            prod_name = safe_str(normalise_product_name(row.get("NAMA BARANG")))
-            if not prod_name:
-                continue
+        for row in rows:
+            prod_name = row["prod_name"]
 
-            system_qty = safe_number(row.get("SALDO AWAL")) + safe_number(row.get("MUTASI MASUK")) - safe_number(row.get("MUTASI KELUAR"))
-            physical_qty = safe_number(row.get("FISIK"))
+            system_qty = row["saldo_awal"] + row["mutasi_masuk"] - row["mutasi_keluar"]
+            physical_qty = row["physical_qty"]
             difference = (system_qty or 0) - (physical_qty or 0)
 
-            product = self.db.query(Product).filter_by(name=prod_name).first()
+            product = self.lookup(Product, "name", prod_name)
             if not product:
                 skipped_products.append({"name": prod_name, "reason": "Product not found"})
                 continue
@@ -163,7 +184,7 @@ class StockOpnameChemicalImportService(BaseImportService):
         return APIResponse.ok(
             data={
                 "summary": {
-                    "total_rows": len(df),
+                    "total_rows": sheet_rows,
                     "valid_products": added,
                     "skipped_products": len(skipped_products),
                 },
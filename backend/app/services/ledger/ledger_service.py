@@ -7,28 +7,49 @@ from sqlalchemy import or_
 from app.schemas.input_models.ledger_input_models import LedgerCreate, LedgerUpdate
 from app.services.common.audit_logger import AuditLoggerService
 from app.core.database import Session, get_db
-from app.models import Ledger
+from app.models import Ledger, Product
+from app.utils.datatable.export import ExportFormat, stream_export
 from app.utils.datatable.request import ListRequest
 from app.utils.deps import DB
 from app.utils.response import APIResponse
 
 
+# Columns of the ledger list, read without loading Ledger.product (selectin) and its account
+LEDGER_LIST_COLUMNS = (
+    Ledger.id, Ledger.date, Ledger.ref, Ledger.ref_code, Ledger.location,
+    Ledger.quantity_in, Ledger.quantity_out, Ledger.product_id,
+)
+
+LEDGER_EXPORT_COLUMNS = LEDGER_LIST_COLUMNS + (Product.name.label("product_name"),)
+
+
 class LedgerService:
     def __init__(self, db = Depends(get_db)):
         self.db = db
 
-    def list_ledger(self, request: ListRequest):
-        ledger = self.db.query(Ledger)
-
+    def _search(self, query, request: ListRequest):
         if request.q:
             like = f"%{request.q}%"
-            ledger = ledger.filter(
+            query = query.filter(
                 or_(
                     Ledger.ref_code.ilike(like),
                 )
-            ).order_by(Ledger.id.desc())
+            )
+        return query
+
+    def list_ledger(self, request: ListRequest):
+        ledger = self.db.query(Ledger)
+
+        if request.q:
+            ledger = self._search(ledger, request).order_by(Ledger.id.desc())
+
+        return APIResponse.paginated(ledger, request, columns=LEDGER_LIST_COLUMNS)
 
-        return APIResponse.paginated(ledger, request)
+    def export_ledger(self, request: ListRequest, export_format: ExportFormat):
+        """Every ledger row matching the list filter, streamed (see stream_export)."""
+        ledger = self._search(self.db.query(Ledger).outerjoin(Ledger.product), request).order_by(Ledger.id)
+
+        return stream_export(ledger, LEDGER_EXPORT_COLUMNS, export_format, "ledger")
 
     def get_ledger(self, ledger_id: int):
         ledger = self.db.query(Ledger).filter(Ledger.id == ledger_id).first()
@@ -65,14 +86,10 @@ class LedgerService:
 
         old_data = {k: getattr(ledger, k) for k in update_data.keys()}
 
-        result = (
-            self.db.query(Ledger)
-                .filter(Ledger.id == ledger_id)
-                .update(update_data, synchronize_session=False)
-        )
-
-        if result == 0:
-            raise HTTPException(status_code=404, detail=f"Ledger ID '{ledger_id}' not found.")
+        # update through the ORM (not query.update) so stock_balances follows the change
+        for key, value in update_data.items():
+            setattr(ledger, key, value)
+        self.db.flush()
         
         AuditLoggerService(self.db).log_update(
             table_name=Ledger.__tablename__,
@@ -12,7 +12,7 @@ from app.core.database import Session, get_db
 from app.models import (
     Product, PurchasingDetail, StockMovementDetail, 
     ColorKitchenEntryDetail, Ledger, StockOpnameDetail,
-    Account
+    Account, StockBalance
 )
 from app.models.enum.ledger_enum import LedgerLocation
 from app.utils.datatable.request import ListRequest
@@ -53,22 +53,15 @@ class ProductService:
         else:
             product = product.order_by(Product.id)
 
-        # === Subquery: aggregate ledger per product per location ===
-        ledger_subq = (
-            self.db.query(
-                Ledger.product_id.label("product_id"),
-                func.sum(Ledger.quantity_in - Ledger.quantity_out).label("stock_qty"),
-            )
-            .filter(Ledger.location == LedgerLocation.Gudang)
-            .group_by(Ledger.product_id)
-            .subquery()
-        )
-
-        # === Join aggregated ledger to product ===
+        # === Join stock on hand (Gudang), kept in sync with the ledger ===
         product = (
-            product.outerjoin(ledger_subq, ledger_subq.c.product_id == Product.id)
+            product.outerjoin(
+                StockBalance,
+                (StockBalance.product_id == Product.id)
+                & (StockBalance.location == LedgerLocation.Gudang),
+            )
             .add_columns(
-                ledger_subq.c.stock_qty.label("stock_qty"),
+                StockBalance.qty.label("stock_qty"),
             )
         )
 
@@ -13,6 +13,10 @@ from app.utils.deps import DB
 from app.utils.response import APIResponse
 
 
+# Columns of the supplier list
+SUPPLIER_LIST_COLUMNS = (Supplier.id, Supplier.code, Supplier.name, Supplier.contact_info)
+
+
 class SupplierService:
     def __init__(self, db = Depends(get_db)):
         self.db = db
@@ -36,7 +40,7 @@ class SupplierService:
                 sort_col = sort_col.desc()
             supplier = supplier.order_by(sort_col)
 
-        return APIResponse.paginated(supplier, request)
+        return APIResponse.paginated(supplier, request, columns=SUPPLIER_LIST_COLUMNS)
 
     def get_supplier(self, supplier_id: int):
         supplier = self.db.query(Supplier).filter(Supplier.id == supplier_id).first()
@@ -7,33 +7,29 @@ from sqlalchemy.orm import joinedload
 
 from app.schemas.input_models.purchasing_input_models import PurchasingCreate, PurchasingUpdate
 from app.core.database import Session, get_db
-from app.models import Purchasing, PurchasingDetail
+from app.models import Purchasing, PurchasingDetail, Product, Supplier
+from app.utils.datatable.export import ExportFormat, stream_export
 from app.utils.datatable.request import ListRequest
 from app.utils.response import APIResponse
 
+# One row per purchasing detail, with its header, supplier and product
+PURCHASING_DETAIL_EXPORT_COLUMNS = (
+    Purchasing.id.label("purchasing_id"), Purchasing.date, Purchasing.code, Purchasing.purchase_order,
+    Supplier.code.label("supplier_code"), Supplier.name.label("supplier_name"),
+    PurchasingDetail.id.label("detail_id"), Product.name.label("product_name"),
+    PurchasingDetail.quantity, PurchasingDetail.price, PurchasingDetail.discount, PurchasingDetail.ppn,
+    PurchasingDetail.pph, PurchasingDetail.dpp, PurchasingDetail.tax_no, PurchasingDetail.exchange_rate,
+)
+
 class PurchasingService:
     def __init__(self, db = Depends(get_db)):
         self.db = db
 
-    def list_purchasing(self, request: ListRequest):
-        purchasing = self.db.query(
-            Purchasing,
-            func.count(PurchasingDetail.id).label('item_count'),
-            func.sum(
-                cast(
-                    (func.coalesce(PurchasingDetail.quantity, 0) * func.coalesce(PurchasingDetail.price, 0))
-                    + func.coalesce(PurchasingDetail.ppn, 0)
-                    + func.coalesce(PurchasingDetail.pph, 0),
-                    Numeric(18, 2)
-                )
-            ).label("total_amount")
-        ).outerjoin(Purchasing.details)\
-         .outerjoin(Purchasing.supplier)\
-         .group_by(Purchasing.id)
-
+    def _filter(self, query, request: ListRequest):
+        """Search (no bukti / PO) and date range of the purchasing list."""
         if request.q:
             like = f"%{request.q}%"
-            purchasing = purchasing.filter(
+            query = query.filter(
                 or_(
                     Purchasing.code.ilike(like),
                     Purchasing.purchase_order.ilike(like),
@@ -45,12 +41,31 @@ class PurchasingService:
             start = datetime.strptime(request.start_date, '%Y-%m-%d').date()
             end = datetime.strptime(request.end_date, '%Y-%m-%d').date()
             
-            purchasing = purchasing.filter(
+            query = query.filter(
                 and_(
                     Purchasing.date >= start,
                     Purchasing.date <= end
                 )
             )
+        return query
+
+    def list_purchasing(self, request: ListRequest):
+        purchasing = self.db.query(
+            Purchasing,
+            func.count(PurchasingDetail.id).label('item_count'),
+            func.sum(
+                cast(
+                    (func.coalesce(PurchasingDetail.quantity, 0) * func.coalesce(PurchasingDetail.price, 0))
+                    + func.coalesce(PurchasingDetail.ppn, 0)
+                    + func.coalesce(PurchasingDetail.pph, 0),
+                    Numeric(18, 2)
+                )
+            ).label("total_amount")
+        ).outerjoin(Purchasing.details)\
+         .outerjoin(Purchasing.supplier)\
+         .group_by(Purchasing.id)
+
+        purchasing = self._filter(purchasing, request)
             
         if request.sort_by and request.sort_dir:
             sort_col = getattr(Purchasing, request.sort_by)
@@ -75,6 +90,16 @@ class PurchasingService:
             "total_amount": float(row.total_amount) if row.total_amount else 0,
         })
 
+    def export_purchasing_details(self, request: ListRequest, export_format: ExportFormat):
+        """Every purchasing detail of the purchasings matching the list filter, streamed (see stream_export)."""
+        details = self.db.query(PurchasingDetail)\
+            .join(PurchasingDetail.purchasing)\
+            .join(Purchasing.supplier)\
+            .join(PurchasingDetail.product)
+        details = self._filter(details, request).order_by(Purchasing.date, Purchasing.id, PurchasingDetail.id)
+
+        return stream_export(details, PURCHASING_DETAIL_EXPORT_COLUMNS, export_format, "purchasing_details")
+
     def get_purchasing(self, purchasing_id: int):
         purchasing = self.db.query(Purchasing).options(
             joinedload(Purchasing.supplier),
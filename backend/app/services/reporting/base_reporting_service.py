@@ -4,6 +4,8 @@ from typing import Dict, Any, Union
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
+from app.utils.rollup_helper import rollup_day
+
 class BaseReportService:
     def __init__(self, db: Session):
         self.db = db
@@ -34,5 +36,15 @@ class BaseReportService:
             "account_type": acc_type,
         }
 
+    def filter_rollup_dates(self, query, date_column, filters: Dict[str, Any]):
+        """Apply start/end date filters to a daily rollup date column (whole days)."""
+        start = rollup_day(filters.get("start_date"))
+        end = rollup_day(filters.get("end_date"))
+        if start:
+            query = query.filter(date_column >= start)
+        if end:
+            query = query.filter(date_column <= end)
+        return query
+
     def run(self, filters: Dict[str, Any]):
         raise NotImplementedError
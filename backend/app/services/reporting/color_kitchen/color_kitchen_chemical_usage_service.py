@@ -1,13 +1,7 @@
 # app/services/reporting/color_kitchen/color_kitchen_chemical_usage_service.py
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models import (
-    ColorKitchenBatch,
-    ColorKitchenBatchDetail,
-    ColorKitchenEntry,
-    ColorKitchenEntryDetail,
-    Product,
-)
+from app.models import ColorKitchenDailyRollup, Product
 from app.services.reporting.base_reporting_service import BaseReportService
 
 from app.utils.response import APIResponse
@@ -39,34 +33,19 @@ class ColorKitchenChemicalUsageService(BaseReportService):
     # ------------------------------------------------------------------
     def _get_summary(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
-        # --- Dyes (from BatchDetail)
-        q_dyes = (
+        # Dyes from batch details, auxiliaries from entry details
+        q = (
             db.query(
-                func.sum(ColorKitchenBatchDetail.quantity * ColorKitchenBatchDetail.unit_cost_used).label("value")
+                ColorKitchenDailyRollup.chemical_type,
+                func.sum(ColorKitchenDailyRollup.total_cost).label("value"),
             )
-            .join(ColorKitchenBatch, ColorKitchenBatch.id == ColorKitchenBatchDetail.batch_id)
+            .group_by(ColorKitchenDailyRollup.chemical_type)
         )
-        if start_date:
-            q_dyes = q_dyes.filter(ColorKitchenBatch.date >= start_date)
-        if end_date:
-            q_dyes = q_dyes.filter(ColorKitchenBatch.date <= end_date)
-        dyes_total = float(q_dyes.scalar() or 0)
-
-        # --- Auxiliaries (from EntryDetail)
-        q_aux = (
-            db.query(
-                func.sum(ColorKitchenEntryDetail.quantity * ColorKitchenEntryDetail.unit_cost_used).label("value")
-            )
-            .join(ColorKitchenEntry, ColorKitchenEntry.id == ColorKitchenEntryDetail.color_kitchen_entry_id)
-        )
-        if start_date:
-            q_aux = q_aux.filter(ColorKitchenEntry.date >= start_date)
-        if end_date:
-            q_aux = q_aux.filter(ColorKitchenEntry.date <= end_date)
-        aux_total = float(q_aux.scalar() or 0)
+        q = self.filter_rollup_dates(q, ColorKitchenDailyRollup.date, filters)
+        totals = {r.chemical_type: float(r.value or 0) for r in q.all()}
+        dyes_total = totals.get("DYE", 0.0)
+        aux_total = totals.get("AUX", 0.0)
 
         # --- Combine results for Pie Chart
         data = [
@@ -91,54 +70,24 @@ class ColorKitchenChemicalUsageService(BaseReportService):
         Returns top 5 products by total cost within that type.
         """
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
-
-        if parent_type.upper() == "DYE":
-            q = (
-                db.query(
-                    Product.name.label("product"),
-                    func.sum(ColorKitchenBatchDetail.quantity).label("total_qty"),
-                    func.sum(ColorKitchenBatchDetail.quantity * ColorKitchenBatchDetail.unit_cost_used).label(
-                        "total_value"
-                    ),
-                )
-                .join(Product, Product.id == ColorKitchenBatchDetail.product_id)
-                .join(ColorKitchenBatch, ColorKitchenBatch.id == ColorKitchenBatchDetail.batch_id)
-            )
-            if start_date:
-                q = q.filter(ColorKitchenBatch.date >= start_date)
-            if end_date:
-                q = q.filter(ColorKitchenBatch.date <= end_date)
-
-            q = (
-                q.group_by(Product.name)
-                .order_by(func.sum(ColorKitchenBatchDetail.quantity * ColorKitchenBatchDetail.unit_cost_used).desc())
-            )
 
-        elif parent_type.upper() == "AUX":
-            q = (
-                db.query(
-                    Product.name.label("product"),
-                    func.sum(ColorKitchenEntryDetail.quantity).label("total_qty"),
-                    func.sum(ColorKitchenEntryDetail.quantity * ColorKitchenEntryDetail.unit_cost_used).label(
-                        "total_value"
-                    ),
-                )
-                .join(Product, Product.id == ColorKitchenEntryDetail.product_id)
-                .join(ColorKitchenEntry, ColorKitchenEntry.id == ColorKitchenEntryDetail.color_kitchen_entry_id)
-            )
-            if start_date:
-                q = q.filter(ColorKitchenEntry.date >= start_date)
-            if end_date:
-                q = q.filter(ColorKitchenEntry.date <= end_date)
+        if parent_type.upper() not in ("DYE", "AUX"):
+            raise ValueError("Invalid parent_type: must be 'DYE' or 'AUX'.")
 
-            q = (
-                q.group_by(Product.name)
-                .order_by(func.sum(ColorKitchenEntryDetail.quantity * ColorKitchenEntryDetail.unit_cost_used).desc())
+        q = (
+            db.query(
+                Product.name.label("product"),
+                func.sum(ColorKitchenDailyRollup.quantity).label("total_qty"),
+                func.sum(ColorKitchenDailyRollup.total_cost).label("total_value"),
             )
-        else:
-            raise ValueError("Invalid parent_type: must be 'DYE' or 'AUX'.")
+            .join(Product, Product.id == ColorKitchenDailyRollup.product_id)
+            .filter(ColorKitchenDailyRollup.chemical_type == parent_type.upper())
+        )
+        q = self.filter_rollup_dates(q, ColorKitchenDailyRollup.date, filters)
+        q = (
+            q.group_by(Product.name)
+            .order_by(func.sum(ColorKitchenDailyRollup.total_cost).desc())
+        )
 
         rows = q.all()
         data = [
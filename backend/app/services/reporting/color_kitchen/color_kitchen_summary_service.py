@@ -6,7 +6,7 @@ from decimal import Decimal
 from app.models import (
     ColorKitchenBatch as CKBatch,
     ColorKitchenEntry as CKEntry,
-    ColorKitchenEntryDetail as CKEntryDetail,
+    ColorKitchenDailyRollup as CKRollup,
 )
 from app.services.reporting.base_reporting_service import BaseReportService
 
@@ -67,21 +67,12 @@ class ColorKitchenSummaryService(BaseReportService):
         # ----------------------------------------------
         # Total cost
         # ----------------------------------------------
+        # auxiliaries (entry details), dated by the entry
         q_cost = (
-            db.query(
-                func.coalesce(
-                    func.sum(CKEntryDetail.quantity * func.coalesce(CKEntryDetail.unit_cost_used, 0.0)),
-                    0.0,
-                ).label("total_cost")
-            )
-            .select_from(CKEntryDetail)
-            .join(CKEntry, CKEntry.id == CKEntryDetail.color_kitchen_entry_id)
-            .join(CKBatch, CKBatch.id == CKEntry.batch_id)
+            db.query(func.coalesce(func.sum(CKRollup.total_cost), 0.0).label("total_cost"))
+            .filter(CKRollup.chemical_type == "AUX")
         )
-        if start_date:
-            q_cost = q_cost.filter(CKBatch.date >= start_date)
-        if end_date:
-            q_cost = q_cost.filter(CKBatch.date <= end_date)
+        q_cost = self.filter_rollup_dates(q_cost, CKRollup.date, filters)
         total_cost = q_cost.scalar() or 0.0
         if isinstance(total_cost, Decimal):
             total_cost = float(total_cost)
@@ -1,12 +1,7 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, cast, DateTime
 from datetime import timedelta
-from app.models import (
-    ColorKitchenBatch as CKBatch,
-    ColorKitchenBatchDetail as CKBatchDetail,
-    ColorKitchenEntry as CKEntry,
-    ColorKitchenEntryDetail as CKEntryDetail,
-)
+from app.models import ColorKitchenDailyRollup as CKRollup
 from app.services.reporting.base_reporting_service import BaseReportService
 from app.utils.response import APIResponse
 
@@ -27,8 +22,6 @@ class ColorKitchenTrendService(BaseReportService):
     # ------------------------------------------------------
     def _get_trend(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
         granularity = (filters.get("granularity") or "monthly").lower()
 
         # Determine SQL trunc unit & label format
@@ -45,51 +38,24 @@ class ColorKitchenTrendService(BaseReportService):
             trunc_unit = "month"
             fmt = "%Y-%m"
 
-        period_expr = func.date_trunc(trunc_unit, CKBatch.date).label("period")
+        period_expr = func.date_trunc(trunc_unit, cast(CKRollup.date, DateTime)).label("period")
 
-        # -----------------------------
-        # DYES — from BatchDetail
-        # -----------------------------
-        q_dyes = (
+        # DYES from BatchDetail, AUXILIARIES from EntryDetail
+        q = (
             db.query(
                 period_expr,
-                func.coalesce(
-                    func.sum(CKBatchDetail.quantity * func.coalesce(CKBatchDetail.unit_cost_used, 0.0)), 0.0
-                ).label("dyes_value"),
+                CKRollup.chemical_type,
+                func.coalesce(func.sum(CKRollup.total_cost), 0.0).label("value"),
             )
-            .join(CKBatch, CKBatch.id == CKBatchDetail.batch_id)
-            .group_by(period_expr)
-            .order_by(period_expr)
+            .group_by(period_expr, CKRollup.chemical_type)
         )
+        q = self.filter_rollup_dates(q, CKRollup.date, filters)
 
-        if start_date:
-            q_dyes = q_dyes.filter(CKBatch.date >= start_date)
-        if end_date:
-            q_dyes = q_dyes.filter(CKBatch.date <= end_date)
-
-        dyes_rows = {r.period: float(r.dyes_value or 0) for r in q_dyes.all()}
-
-        # -----------------------------
-        # AUXILIARIES — from EntryDetail
-        # -----------------------------
-        q_aux = (
-            db.query(
-                func.date_trunc(trunc_unit, CKEntry.date).label("period"),
-                func.coalesce(
-                    func.sum(CKEntryDetail.quantity * func.coalesce(CKEntryDetail.unit_cost_used, 0.0)), 0.0
-                ).label("aux_value"),
-            )
-            .join(CKEntry, CKEntry.id == CKEntryDetail.color_kitchen_entry_id)
-            .group_by(func.date_trunc(trunc_unit, CKEntry.date))
-            .order_by(func.date_trunc(trunc_unit, CKEntry.date))
-        )
-
-        if start_date:
-            q_aux = q_aux.filter(CKEntry.date >= start_date)
-        if end_date:
-            q_aux = q_aux.filter(CKEntry.date <= end_date)
-
-        aux_rows = {r.period: float(r.aux_value or 0) for r in q_aux.all()}
+        dyes_rows = {}
+        aux_rows = {}
+        for r in q.all():
+            rows = dyes_rows if r.chemical_type == "DYE" else aux_rows
+            rows[r.period] = float(r.value or 0)
 
         # -----------------------------
         # Merge results by period
@@ -5,7 +5,7 @@ from sqlalchemy import func
 from app.utils.response import APIResponse
 from app.utils.filters import apply_common_report_filters
 
-from app.models import Purchasing, PurchasingDetail, Product, Account, AccountParent
+from app.models import PurchasingDailyRollup, Product, Account, AccountParent
 from app.services.reporting.base_reporting_service import BaseReportService
 
 
@@ -30,27 +30,20 @@ class PurchasingBreakdownService(BaseReportService):
     # --------------------------------------------------
     def _get_summary(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         q = (
             db.query(
                 AccountParent.account_type,
-                func.coalesce(func.sum(PurchasingDetail.quantity * PurchasingDetail.price), 0).label("total_value")
+                func.coalesce(func.sum(PurchasingDailyRollup.total_value), 0).label("total_value")
             )
-            .select_from(PurchasingDetail)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
         )
 
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
-
-        q = apply_common_report_filters(q, filters)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         rows = q.group_by(AccountParent.account_type).all()
 
@@ -75,8 +68,6 @@ class PurchasingBreakdownService(BaseReportService):
     # --------------------------------------------------
     def _get_detailed(self, filters, level: str, parent_type: str = None, parent_account_id: int = None):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         if level == "account_type":
             # Drilldown: account_type → account_name
@@ -85,15 +76,15 @@ class PurchasingBreakdownService(BaseReportService):
                     AccountParent.account_no.label("account_no"),
                     Account.id.label("account_id"),
                     Account.name.label("account_name"),
-                    func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
+                    func.sum(PurchasingDailyRollup.total_value).label("total_value"),
                 )
-                .join(Product, Product.id == PurchasingDetail.product_id)
+                .select_from(PurchasingDailyRollup)
+                .join(Product, Product.id == PurchasingDailyRollup.product_id)
                 .join(Account, Account.id == Product.account_id)
                 .join(AccountParent, AccountParent.id == Account.parent_id)
-                .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
                 .filter(AccountParent.account_type == parent_type)
                 .group_by(AccountParent.account_no, Account.id, Account.name)
-                .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+                .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             )
 
         elif level == "account":
@@ -101,25 +92,21 @@ class PurchasingBreakdownService(BaseReportService):
             q = (
                 db.query(
                     Product.name.label("product"),
-                    func.sum(PurchasingDetail.quantity).label("total_qty"),
-                    func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
+                    func.sum(PurchasingDailyRollup.quantity).label("total_qty"),
+                    func.sum(PurchasingDailyRollup.total_value).label("total_value"),
                 )
-                .join(Product, Product.id == PurchasingDetail.product_id)
+                .select_from(PurchasingDailyRollup)
+                .join(Product, Product.id == PurchasingDailyRollup.product_id)
                 .join(Account, Account.id == Product.account_id)
-                .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
                 .filter(Account.id == parent_account_id)
                 .group_by(Product.name)
-                .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+                .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             )
         else:
             raise ValueError("Invalid level. Must be 'account_type' or 'account'.")
 
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
-
-        q = apply_common_report_filters(q, filters)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         rows = q.all()
         data = []
@@ -9,6 +9,7 @@ from app.models import (
     Product,
     Purchasing,
     PurchasingDetail,
+    PurchasingDailyRollup,
     StockMovementDetail,
     ProductAvgCostCache,
     Account,
@@ -48,32 +49,26 @@ class PurchasingProductInsightsService(BaseReportService):
     # ------------------------------------------------------
     def _get_most_purchased(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         q = (
             db.query(
                 Product.name.label("product"),
-                func.sum(PurchasingDetail.quantity).label("total_qty"),
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
+                func.sum(PurchasingDailyRollup.quantity).label("total_qty"),
+                func.sum(PurchasingDailyRollup.total_value).label("total_value"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
-            .join(Supplier, Supplier.id == Purchasing.supplier_id)
+            .join(Supplier, Supplier.id == PurchasingDailyRollup.supplier_id)
         )
 
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
-
-        q = apply_common_report_filters(q, filters)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         q = (
             q.group_by(Product.name)
-            .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+            .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             .limit(5)
         )
 
@@ -203,13 +198,13 @@ class PurchasingProductInsightsService(BaseReportService):
             db.query(
                 Product.id.label("product_id"),
                 Product.name.label("product"),
-                func.sum(PurchasingDetail.quantity).label("total_purchased"),
+                func.sum(PurchasingDailyRollup.quantity).label("total_purchased"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
-            .join(Supplier, Supplier.id == Purchasing.supplier_id)
+            .join(Supplier, Supplier.id == PurchasingDailyRollup.supplier_id)
             .group_by(Product.id, Product.name)
         ).subquery()
 
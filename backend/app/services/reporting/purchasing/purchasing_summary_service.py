@@ -1,7 +1,7 @@
 # app/services/reporting/purchasing/purchasing_summary_service.py
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models import Product, Account, Purchasing, PurchasingDetail, ProductAvgCostCache, AccountParent
+from app.models import Product, Account, Purchasing, PurchasingDetail, PurchasingDailyRollup, ProductAvgCostCache, AccountParent
 from app.services.reporting.base_reporting_service import BaseReportService
 
 from app.utils.response import APIResponse
@@ -30,62 +30,35 @@ class PurchasingSummaryService(BaseReportService):
         end_date = filters.get("end_date")
         account_type = filters.get("account_type")
 
+        value = PurchasingDailyRollup.total_value
         q = (
             db.query(
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
-                func.sum(PurchasingDetail.quantity).label("total_qty"),
+                func.sum(value).label("total_value"),
+                func.sum(PurchasingDailyRollup.quantity).label("total_qty"),
+                # Goods / Service split
+                func.sum(value).filter(AccountParent.account_type == "chemical").label("total_chemical"),
+                func.sum(value).filter(AccountParent.account_type == "sparepart").label("total_sparepart"),
             )
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
+            .outerjoin(AccountParent, AccountParent.id == Account.parent_id)
         )
 
         # Filters
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
         # if account_type and isinstance(account_type, AccountType):
         #     q = q.filter(Account.account_type == account_type.value)
        
-        q = apply_common_report_filters(q, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         total_row = q.one_or_none()
         total_value = float(total_row.total_value or 0) if total_row else 0
         total_qty = float(total_row.total_qty or 0) if total_row else 0
         avg_unit_cost = total_value / total_qty if total_qty else 0
 
-        # --------------------------------------------------
-        # Goods / Service split
-        # --------------------------------------------------
-        chemical_total = (
-            db.query(func.sum(PurchasingDetail.quantity * PurchasingDetail.price))
-            .join(Product, Product.id == PurchasingDetail.product_id)
-            .join(Account, Account.id == Product.account_id)
-            .join(AccountParent, AccountParent.id == Account.parent_id)
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .filter(AccountParent.account_type == "chemical")
-        )
-        sparepart_total = (
-            db.query(func.sum(PurchasingDetail.quantity * PurchasingDetail.price))
-            .join(Product, Product.id == PurchasingDetail.product_id)
-            .join(Account, Account.id == Product.account_id)
-            .join(AccountParent, AccountParent.id == Account.parent_id)
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .filter(AccountParent.account_type == "sparepart")
-        )
-        if start_date:
-            chemical_total = chemical_total.filter(Purchasing.date >= start_date)
-            sparepart_total = sparepart_total.filter(Purchasing.date >= start_date)
-        if end_date:
-            chemical_total = chemical_total.filter(Purchasing.date <= end_date)
-            sparepart_total = sparepart_total.filter(Purchasing.date <= end_date)
-
-        chemical_total = apply_common_report_filters(chemical_total, filters)
-        sparepart_total = apply_common_report_filters(sparepart_total, filters)
-
-        total_chemical = float(chemical_total.scalar() or 0)
-        total_sparepart = float(sparepart_total.scalar() or 0)
+        total_chemical = float(total_row.total_chemical or 0) if total_row else 0
+        total_sparepart = float(total_row.total_sparepart or 0) if total_row else 0
 
         # --------------------------------------------------
         # Highest Purchase (by invoice total)
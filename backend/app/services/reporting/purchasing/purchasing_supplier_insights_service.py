@@ -1,7 +1,7 @@
 # app/services/reporting/purchasing/purchasing_supplier_insights_service.py
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models import Purchasing, PurchasingDetail, Product, Supplier, Account, AccountParent
+from app.models import Purchasing, PurchasingDailyRollup, Product, Supplier, Account, AccountParent
 from app.services.reporting.base_reporting_service import BaseReportService
 
 from app.utils.response import APIResponse
@@ -34,31 +34,26 @@ class PurchasingSupplierInsightsService(BaseReportService):
     # ------------------------------------------------------
     def _get_top_suppliers(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         q = (
             db.query(
                 Supplier.name.label("supplier"),
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_spent"),
+                func.sum(PurchasingDailyRollup.total_value).label("total_spent"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Supplier, Supplier.id == Purchasing.supplier_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Supplier, Supplier.id == PurchasingDailyRollup.supplier_id)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
         )
 
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
         
-        q = apply_common_report_filters(q, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         q = (
             q.group_by(Supplier.id, Supplier.name)
-            .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+            .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             .limit(5)
         )
 
@@ -79,30 +74,25 @@ class PurchasingSupplierInsightsService(BaseReportService):
     # ------------------------------------------------------
     def _get_highest_spend_combo(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         q = (
             db.query(
                 Supplier.name.label("supplier"),
                 Product.name.label("product"),
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
+                func.sum(PurchasingDailyRollup.total_value).label("total_value"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Supplier, Supplier.id == Purchasing.supplier_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Supplier, Supplier.id == PurchasingDailyRollup.supplier_id)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
         )
 
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
 
         q = (
             q.group_by(Supplier.name, Product.name)
-            .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+            .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             .limit(5)
             .all()
         
@@ -139,28 +129,23 @@ class PurchasingSupplierInsightsService(BaseReportService):
     # ------------------------------------------------------
     def _get_supplier_concentration(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
 
         base_q = (
             db.query(
                 Supplier.name.label("supplier"),
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_spent"),
+                func.sum(PurchasingDailyRollup.total_value).label("total_spent"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Supplier, Supplier.id == Purchasing.supplier_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Supplier, Supplier.id == PurchasingDailyRollup.supplier_id)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
             .group_by(Supplier.id, Supplier.name)
-            .order_by(func.sum(PurchasingDetail.quantity * PurchasingDetail.price).desc())
+            .order_by(func.sum(PurchasingDailyRollup.total_value).desc())
             .filter(Supplier.name != "System Opening Balance")
         )
 
-        if start_date:
-            base_q = base_q.filter(Purchasing.date >= start_date)
-        if end_date:
-            base_q = base_q.filter(Purchasing.date <= end_date)
+        base_q = self.filter_rollup_dates(base_q, PurchasingDailyRollup.date, filters)
 
         results = base_q.all()
         if not results:
@@ -1,8 +1,8 @@
 # app/services/reporting/purchasing/purchasing_trend_service.py
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
+from sqlalchemy import func, case, cast, DateTime
 from datetime import timedelta
-from app.models import Purchasing, PurchasingDetail, Product, Account, AccountParent
+from app.models import PurchasingDailyRollup, Product, Account, AccountParent
 from app.services.reporting.base_reporting_service import BaseReportService
 
 from app.utils.response import APIResponse
@@ -27,8 +27,6 @@ class PurchasingTrendService(BaseReportService):
     # ------------------------------------------------------
     def _get_trend(self, filters):
         db: Session = self.db
-        start_date = filters.get("start_date")
-        end_date = filters.get("end_date")
         account_name = filters.get("account_name")
         granularity = (filters.get("granularity") or "monthly").lower()
 
@@ -46,20 +44,18 @@ class PurchasingTrendService(BaseReportService):
             trunc_unit = "month"
             fmt = "%Y-%m"
 
-        period_expr = func.date_trunc(trunc_unit, Purchasing.date).label("period")
-
         # Compute category-based sums
-        period_expr = func.date_trunc(trunc_unit, Purchasing.date).label("period")
+        period_expr = func.date_trunc(trunc_unit, cast(PurchasingDailyRollup.date, DateTime)).label("period")
 
         # Base query: sum by period + account name
         q = (
             db.query(
                 period_expr.label("period"),
                 AccountParent.account_type.label("account_type"),
-                func.sum(PurchasingDetail.quantity * PurchasingDetail.price).label("total_value"),
+                func.sum(PurchasingDailyRollup.total_value).label("total_value"),
             )
-            .join(Purchasing, Purchasing.id == PurchasingDetail.purchasing_id)
-            .join(Product, Product.id == PurchasingDetail.product_id)
+            .select_from(PurchasingDailyRollup)
+            .join(Product, Product.id == PurchasingDailyRollup.product_id)
             .join(Account, Account.id == Product.account_id)
             .join(AccountParent, AccountParent.id == Account.parent_id)
             .group_by(period_expr, AccountParent.account_type)
@@ -67,14 +63,11 @@ class PurchasingTrendService(BaseReportService):
         )
 
         # Filters
-        if start_date:
-            q = q.filter(Purchasing.date >= start_date)
-        if end_date:
-            q = q.filter(Purchasing.date <= end_date)
+        q = self.filter_rollup_dates(q, PurchasingDailyRollup.date, filters)
         if account_name:
             q = q.filter(Account.name == account_name)
 
-        q = apply_common_report_filters(q, filters)
+        q = apply_common_report_filters(q, filters, supplier_column=PurchasingDailyRollup.supplier_id)
 
         rows = q.all()
 
@@ -12,6 +12,7 @@ from app.models import StockMovement, StockMovementDetail
 from app.utils.datatable.request import ListRequest
 from app.utils.deps import DB
 from app.utils.response import APIResponse
+from app.utils.cost_helper import get_costs_as_of
 
 
 class StockMovementService:
@@ -99,11 +100,15 @@ class StockMovementService:
         self.db.flush()
 
         if request.details:
+            # stamp the avg cost as of the movement date (0 when the product has no cost yet)
+            costs = get_costs_as_of(self.db, [(d.product_id, stock_movement.date) for d in request.details])
+
             for detail_data in request.details:
                 detail = StockMovementDetail(
                     stock_movement_id=stock_movement.id,
                     product_id=detail_data.product_id,
-                    quantity=detail_data.quantity
+                    quantity=detail_data.quantity,
+                    unit_cost_used=costs.get((detail_data.product_id, stock_movement.date)) or 0
                 )
                 self.db.add(detail)
 
@@ -124,11 +129,14 @@ class StockMovementService:
                 StockMovementDetail.stock_movement_id == stock_movement_id
             ).delete(synchronize_session=False)
 
+            costs = get_costs_as_of(self.db, [(d.product_id, stock_movement.date) for d in request.details])
+
             for detail_data in request.details:
                 detail = StockMovementDetail(
                     stock_movement_id=stock_movement_id,
                     product_id=detail_data.product_id,
-                    quantity=detail_data.quantity
+                    quantity=detail_data.quantity,
+                    unit_cost_used=costs.get((detail_data.product_id, stock_movement.date)) or 0
                 )
                 self.db.add(detail)
 
@@ -11,7 +11,6 @@ from app.utils.datatable.request import ListRequest
 from app.utils.deps import DB
 from app.utils.response import APIResponse
 
-from app.utils.safe_parse import sanitize
 
 class AccountParentService:
     def __init__(self, db = Depends(get_db)):
@@ -30,7 +29,7 @@ class AccountParentService:
 
         return APIResponse.paginated(
             account_parent, request,
-            lambda ap: sanitize({
+            lambda ap: {
                 "id": ap.id,
                 "name": ap.name,
                 "account_no": ap.account_no,
@@ -39,7 +38,7 @@ class AccountParentService:
                     "id": a.id,
                     "name": a.name,
                 } for a in ap.accounts] if ap.accounts else []
-            })
+            }
         )
 
     def get_account_parent(self, account_id: int):
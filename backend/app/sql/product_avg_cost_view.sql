@@ -52,3 +52,6 @@ SELECT
 FROM cumulative c
 LEFT JOIN movements m ON m.product_id = c.product_id
 LEFT JOIN opnames o ON o.product_id = c.product_id;
+
+-- Unique index required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS ux_product_avg_cost_product_id ON product_avg_cost (product_id);
@@ -0,0 +1,57 @@
+import io
+
+from sqlalchemy.orm import Session
+
+from app.utils.datatable.count import note_written_tables
+
+# rows sent per COPY ... FROM STDIN round trip
+COPY_BATCH_SIZE = 5000
+
+def _copy_value(value) -> str:
+    """One field in COPY text format (tab separated, \\N for NULL)."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+class CopyWriter:
+    """
+    Buffer rows for `table` and stream them with PostgreSQL COPY FROM STDIN
+    every `batch_size` rows, inside the session's current transaction.
+    Values must already be in their final text form (JSON serialized, ...).
+    Call flush() once at the end for the last partial batch.
+    """
+
+    def __init__(self, db: Session, table: str, columns: list, batch_size: int = COPY_BATCH_SIZE):
+        self.db = db
+        self.table = table
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        self.batch_size = batch_size
+        self.rows = []
+        self.copied = 0
+
+    def add(self, row: tuple):
+        self.rows.append("\t".join(_copy_value(v) for v in row))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        buffer = io.StringIO("\n".join(self.rows) + "\n")
+        conn = self.db.connection()
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(self.sql, buffer)
+        finally:
+            cursor.close()
+        note_written_tables(conn, [self.table])  # COPY on the raw cursor is not seen by the engine events
+
+        self.copied += len(self.rows)
+        self.rows = []
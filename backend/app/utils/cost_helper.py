@@ -1,17 +1,41 @@
-from sqlalchemy import func, select, text
+from datetime import datetime
+
+from sqlalchemy import func, select, text, values, column, case, cast, Integer, Float, Date
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Connection, Engine
 
-from app.models import ProductAvgCost, PurchasingDetail, Purchasing, ProductAvgCostCache
+from app.models import ProductAvgCost, PurchasingDetail, Purchasing, ProductAvgCostCache, ProductCostHistory
+
+# session.info key holding the pending cache deltas of the current transaction:
+# {product_id: [qty, value, value_ppn, {purchasing date}, {purchasing id}]}
+# (the purchasings touched, by date or, when the date was not at hand, by id)
+AVG_COST_DELTA_KEY = "avg_cost_delta"
+
+# deltas of transactions committed inside skip_cost_cache_updates(), same shape;
+# a rollback keeps them, they are applied by the next flush_avg_cost_updates
+AVG_COST_DEFERRED_KEY = "avg_cost_deferred"
+
+# the deferred deltas being applied by the current transaction, put back if it rolls back
+AVG_COST_APPLYING_KEY = "avg_cost_applying"
 
-def refresh_product_avg_cost(db: Session):
+def refresh_product_avg_cost(db: Session, concurrently: bool = True):
     """
-    Refresh the materialized view 'product_avg_cost' (blocking version).
-    Use this when you do NOT have a unique index on the view.
+    Refresh the materialized view 'product_avg_cost'.
+    CONCURRENTLY (needs the unique index on product_id) keeps the view readable
+    during the refresh; a view that was never populated falls back to the blocking refresh.
     """
     try:
-        db.execute(text("REFRESH MATERIALIZED VIEW product_avg_cost;"))
+        if concurrently:
+            populated = db.execute(
+                text("SELECT relispopulated FROM pg_class WHERE relname = 'product_avg_cost'")
+            ).scalar()
+            concurrently = bool(populated)
+
+        if concurrently:
+            db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY product_avg_cost;"))
+        else:
+            db.execute(text("REFRESH MATERIALIZED VIEW product_avg_cost;"))
         db.commit()
     except Exception as e:
         db.rollback()
@@ -41,6 +65,7 @@ def update_avg_cost_for_products(conn_or_engine, product_ids: list[int]):
             product_id,
             total_qty_in,
             total_value_in,
+            total_value_ppn_in,
             avg_cost,
             avg_cost_ppn,
             last_updated
@@ -49,6 +74,7 @@ def update_avg_cost_for_products(conn_or_engine, product_ids: list[int]):
             pd.product_id,
             SUM(pd.quantity) AS total_qty_in,
             SUM(pd.quantity * pd.price) AS total_value_in,
+            SUM(pd.quantity * (pd.price + COALESCE(pd.ppn, 0) - COALESCE(pd.pph, 0))) AS total_value_ppn_in,
 
             -- Pure average cost (no tax)
             CASE WHEN SUM(pd.quantity) > 0 THEN
@@ -68,6 +94,7 @@ def update_avg_cost_for_products(conn_or_engine, product_ids: list[int]):
         SET
             total_qty_in = EXCLUDED.total_qty_in,
             total_value_in = EXCLUDED.total_value_in,
+            total_value_ppn_in = EXCLUDED.total_value_ppn_in,
             avg_cost = EXCLUDED.avg_cost,
             avg_cost_ppn = EXCLUDED.avg_cost_ppn,
             last_updated = NOW();
@@ -81,4 +108,376 @@ def update_avg_cost_for_products(conn_or_engine, product_ids: list[int]):
     else:
         raise TypeError("update_avg_cost_for_products expects a Connection or Engine")
 
-    
\ No newline at end of file
+def add_avg_cost_delta(db: Session, product_id: int, qty, value, value_ppn, purchasing_date=None, purchasing_id=None):
+    """
+    Queue a change of the running totals, applied once when the transaction commits.
+    purchasing_date (or purchasing_id, resolved at commit) is the purchase the
+    change belongs to: product_cost_history is rebuilt from the earliest one on.
+    """
+    if product_id is None:
+        return
+
+    totals = db.info.setdefault(AVG_COST_DELTA_KEY, {}).setdefault(product_id, [0.0, 0.0, 0.0, set(), set()])
+    totals[0] += qty
+    totals[1] += value
+    totals[2] += value_ppn
+    if purchasing_date is not None:
+        totals[3].add(_as_date(purchasing_date))
+    elif purchasing_id is not None:
+        totals[4].add(purchasing_id)
+
+def apply_avg_cost_deltas(conn: Connection, deltas: dict):
+    """
+    Add the deltas to the running totals and derive avg cost from them,
+    without re-reading purchase history.
+    Products that have no cache row yet are seeded with a full recompute.
+    """
+    product_ids = sorted(deltas)
+    cached = set(
+        conn.execute(
+            select(ProductAvgCostCache.product_id)
+            .where(ProductAvgCostCache.product_id.in_(product_ids))
+        ).scalars()
+    )
+
+    # Seed from purchasing_details, which already includes this transaction's rows
+    update_avg_cost_for_products(conn, [pid for pid in product_ids if pid not in cached])
+
+    rows = [(pid, *deltas[pid][:3]) for pid in product_ids if pid in cached]
+    if not rows:
+        return
+
+    v = values(
+        column("product_id", Integer),
+        column("qty", Float),
+        column("value", Float),
+        column("value_ppn", Float),
+        name="d",
+    ).data(rows)
+
+    cache = ProductAvgCostCache.__table__
+    total_qty = func.coalesce(cache.c.total_qty_in, 0) + v.c.qty
+    total_value = func.coalesce(cache.c.total_value_in, 0) + v.c.value
+    total_value_ppn = func.coalesce(cache.c.total_value_ppn_in, 0) + v.c.value_ppn
+
+    conn.execute(
+        cache.update()
+        .where(cache.c.product_id == v.c.product_id)
+        .values(
+            total_qty_in=total_qty,
+            total_value_in=total_value,
+            total_value_ppn_in=total_value_ppn,
+            avg_cost=case((total_qty > 0, total_value / total_qty), else_=0),
+            avg_cost_ppn=case((total_qty > 0, total_value_ppn / total_qty), else_=0),
+            last_updated=func.now(),
+        )
+    )
+
+def _merge_deltas(into: dict, deltas: dict) -> dict:
+    for product_id, (qty, value, value_ppn, dates, purchasing_ids) in deltas.items():
+        totals = into.setdefault(product_id, [0.0, 0.0, 0.0, set(), set()])
+        totals[0] += qty
+        totals[1] += value
+        totals[2] += value_ppn
+        totals[3] |= dates
+        totals[4] |= purchasing_ids
+    return into
+
+def defer_avg_cost_updates(db: Session):
+    """
+    The transaction committed (after_commit): deltas still pending were skipped
+    by skip_cost_cache_updates() and move to the deferred queue; deferred deltas
+    it applied are done.
+    """
+    db.info.pop(AVG_COST_APPLYING_KEY, None)
+    pending = db.info.pop(AVG_COST_DELTA_KEY, None)
+    if pending:
+        _merge_deltas(db.info.setdefault(AVG_COST_DEFERRED_KEY, {}), pending)
+
+def discard_avg_cost_updates(db: Session):
+    """
+    The transaction rolled back (after_rollback): its own deltas are dropped with
+    its rows, deltas of committed transactions it was applying are queued again.
+    """
+    db.info.pop(AVG_COST_DELTA_KEY, None)
+    applying = db.info.pop(AVG_COST_APPLYING_KEY, None)
+    if applying:
+        _merge_deltas(db.info.setdefault(AVG_COST_DEFERRED_KEY, {}), applying)
+
+def flush_avg_cost_updates(db: Session):
+    """
+    Apply every queued delta to the cost cache: those of the current transaction
+    and those deferred from transactions committed inside skip_cost_cache_updates().
+    Called automatically on commit; call it directly after work done
+    inside skip_cost_cache_updates() to run the deferred update.
+    """
+    deferred = db.info.pop(AVG_COST_DEFERRED_KEY, None)
+    if deferred:
+        _merge_deltas(db.info.setdefault(AVG_COST_APPLYING_KEY, {}), deferred)
+
+    deltas = _merge_deltas({}, deferred or {})
+    _merge_deltas(deltas, db.info.pop(AVG_COST_DELTA_KEY, None) or {})
+    if not deltas:
+        return
+
+    conn = db.connection()
+    apply_avg_cost_deltas(conn, deltas)
+
+    purchases = {pid: (delta[3], delta[4]) for pid, delta in deltas.items()}
+    rebuild_product_cost_history(conn, *cost_history_since(conn, purchases))
+
+def cost_history_since(conn: Connection, purchases: dict):
+    """
+    (product ids, {product_id: earliest purchasing date}) of the history to
+    rebuild, for purchases = {product_id: ({purchasing date}, {purchasing id})}.
+    Products with a purchasing that is gone (deleted with its details) get no
+    date and are rebuilt as a whole; products that only touched purchasings
+    without a date keep their history.
+    """
+    purchasing_ids = set().union(*(ids for _, ids in purchases.values()))
+    dates = {}
+    if purchasing_ids:
+        dates = dict(conn.execute(
+            select(Purchasing.id, cast(Purchasing.date, Date)).where(Purchasing.id.in_(purchasing_ids))
+        ).all())
+
+    product_ids, since = [], {}
+    for pid, (days, ids) in sorted(purchases.items()):
+        if any(hid not in dates for hid in ids):
+            product_ids.append(pid)  # date unknown, full rebuild
+            continue
+        days = days | {dates[hid] for hid in ids if dates[hid] is not None}
+        if days:
+            product_ids.append(pid)
+            since[pid] = min(days)
+    return product_ids, since
+
+def rebuild_avg_cost_cache(conn_or_engine, tolerance: float = 1e-6) -> list[int]:
+    """
+    Full rebuild of product_avg_cost_cache from purchasing_details.
+    Only rows that drifted from the real totals (or are missing) are rewritten.
+    Returns the repaired product ids.
+    """
+    sql = text("""
+        WITH actual AS (
+            SELECT
+                pd.product_id,
+                SUM(pd.quantity) AS total_qty_in,
+                SUM(pd.quantity * pd.price) AS total_value_in,
+                SUM(pd.quantity * (pd.price + COALESCE(pd.ppn, 0) - COALESCE(pd.pph, 0))) AS total_value_ppn_in
+            FROM purchasing_details pd
+            GROUP BY pd.product_id
+        ),
+        drifted AS (
+            SELECT
+                COALESCE(a.product_id, c.product_id) AS product_id,
+                COALESCE(a.total_qty_in, 0) AS total_qty_in,
+                COALESCE(a.total_value_in, 0) AS total_value_in,
+                COALESCE(a.total_value_ppn_in, 0) AS total_value_ppn_in
+            FROM actual a
+            FULL OUTER JOIN product_avg_cost_cache c ON c.product_id = a.product_id
+            WHERE c.product_id IS NULL
+               OR ABS(COALESCE(c.total_qty_in, 0) - COALESCE(a.total_qty_in, 0)) > :tol * GREATEST(1, ABS(COALESCE(a.total_qty_in, 0)))
+               OR ABS(COALESCE(c.total_value_in, 0) - COALESCE(a.total_value_in, 0)) > :tol * GREATEST(1, ABS(COALESCE(a.total_value_in, 0)))
+               OR ABS(COALESCE(c.total_value_ppn_in, 0) - COALESCE(a.total_value_ppn_in, 0)) > :tol * GREATEST(1, ABS(COALESCE(a.total_value_ppn_in, 0)))
+        )
+        INSERT INTO product_avg_cost_cache (
+            product_id,
+            total_qty_in,
+            total_value_in,
+            total_value_ppn_in,
+            avg_cost,
+            avg_cost_ppn,
+            last_updated
+        )
+        SELECT
+            product_id,
+            total_qty_in,
+            total_value_in,
+            total_value_ppn_in,
+            CASE WHEN total_qty_in > 0 THEN total_value_in / total_qty_in ELSE 0 END,
+            CASE WHEN total_qty_in > 0 THEN total_value_ppn_in / total_qty_in ELSE 0 END,
+            NOW()
+        FROM drifted
+        ON CONFLICT (product_id) DO UPDATE
+        SET
+            total_qty_in = EXCLUDED.total_qty_in,
+            total_value_in = EXCLUDED.total_value_in,
+            total_value_ppn_in = EXCLUDED.total_value_ppn_in,
+            avg_cost = EXCLUDED.avg_cost,
+            avg_cost_ppn = EXCLUDED.avg_cost_ppn,
+            last_updated = NOW()
+        RETURNING product_id;
+    """)
+
+    if isinstance(conn_or_engine, Engine):
+        with conn_or_engine.begin() as conn:
+            repaired = list(conn.execute(sql, {"tol": tolerance}).scalars())
+    elif isinstance(conn_or_engine, Connection):
+        repaired = list(conn_or_engine.execute(sql, {"tol": tolerance}).scalars())
+    else:
+        raise TypeError("rebuild_avg_cost_cache expects a Connection or Engine")
+
+    if repaired:
+        print(f"⚠️ Avg cost cache drift repaired for {len(repaired)} product(s): {repaired}")
+    return repaired
+
+# Running totals of the purchases per (product, day). {scope} restricts it to the
+# products being rebuilt (and their days from `since` on) and joins their seed `s`:
+# the totals of the last history row before `since`, zero for a full rebuild.
+_COST_HISTORY_INSERT = """
+    INSERT INTO product_cost_history (
+        product_id,
+        effective_date,
+        total_qty,
+        total_value,
+        avg_cost,
+        avg_cost_ppn
+    )
+    SELECT
+        product_id,
+        effective_date,
+        total_qty,
+        total_value,
+        CASE WHEN total_qty > 0 THEN total_value / total_qty ELSE 0 END,
+        CASE WHEN total_qty > 0 THEN total_value_ppn / total_qty ELSE 0 END
+    FROM (
+        -- running totals up to each purchasing date
+        SELECT
+            d.product_id,
+            d.effective_date,
+            d.qty0 + SUM(d.qty) OVER w AS total_qty,
+            d.value0 + SUM(d.value) OVER w AS total_value,
+            d.value_ppn0 + SUM(d.value_ppn) OVER w AS total_value_ppn
+        FROM (
+            SELECT
+                pd.product_id,
+                p.date::date AS effective_date,
+                {seed} AS qty0, {seed_value} AS value0, {seed_value_ppn} AS value_ppn0,
+                SUM(pd.quantity) AS qty,
+                SUM(pd.quantity * pd.price) AS value,
+                SUM(pd.quantity * (pd.price + COALESCE(pd.ppn, 0) - COALESCE(pd.pph, 0))) AS value_ppn
+            FROM purchasing_details pd
+            JOIN purchasings p ON p.id = pd.purchasing_id
+            {scope}
+            WHERE p.date IS NOT NULL {scope_filter}
+            GROUP BY pd.product_id, p.date::date, qty0, value0, value_ppn0
+        ) d
+        WINDOW w AS (PARTITION BY d.product_id ORDER BY d.effective_date)
+    ) t;
+"""
+
+_COST_HISTORY_SCOPE = """
+    JOIN unnest(
+        CAST(:pids AS integer[]), CAST(:since AS date[]),
+        CAST(:qty0 AS float8[]), CAST(:value0 AS float8[]), CAST(:value_ppn0 AS float8[])
+    ) AS s(product_id, since, qty0, value0, value_ppn0) ON s.product_id = pd.product_id
+"""
+
+def _cost_history_seeds(conn: Connection, since: dict) -> dict:
+    """{product_id: (qty, value, value_ppn)} of the last history row before since[product_id]."""
+    pids = sorted(since)
+    rows = conn.execute(text("""
+        SELECT s.product_id, h.total_qty, h.total_value, h.avg_cost_ppn
+        FROM unnest(CAST(:pids AS integer[]), CAST(:since AS date[])) AS s(product_id, since)
+        CROSS JOIN LATERAL (
+            SELECT total_qty, total_value, avg_cost_ppn
+            FROM product_cost_history h
+            WHERE h.product_id = s.product_id AND h.effective_date < s.since
+            ORDER BY h.effective_date DESC
+            LIMIT 1
+        ) h
+    """), {"pids": pids, "since": [since[pid] for pid in pids]})
+    # the ppn value is not stored, avg_cost_ppn * total_qty gives it back
+    return {r.product_id: (r.total_qty, r.total_value, r.avg_cost_ppn * r.total_qty) for r in rows}
+
+def _rebuild_cost_history(conn: Connection, product_ids, since: dict):
+    if product_ids is None:
+        conn.execute(text("DELETE FROM product_cost_history"))
+        conn.execute(text(_COST_HISTORY_INSERT.format(
+            seed="0", seed_value="0", seed_value_ppn="0", scope="", scope_filter="",
+        )))
+        return
+
+    pids = sorted(set(product_ids))
+    since = {pid: since[pid] for pid in pids if since.get(pid) is not None}
+    seeds = _cost_history_seeds(conn, since) if since else {}
+    for pid, (qty, value, value_ppn) in seeds.items():
+        if not qty:
+            del since[pid]  # the ppn value cannot be derived from this row, rebuild the whole history
+
+    params = {
+        "pids": pids,
+        "since": [since.get(pid) for pid in pids],
+        "qty0": [seeds[pid][0] if pid in since and pid in seeds else 0.0 for pid in pids],
+        "value0": [seeds[pid][1] if pid in since and pid in seeds else 0.0 for pid in pids],
+        "value_ppn0": [seeds[pid][2] if pid in since and pid in seeds else 0.0 for pid in pids],
+    }
+    conn.execute(text("""
+        DELETE FROM product_cost_history h
+        USING unnest(CAST(:pids AS integer[]), CAST(:since AS date[])) AS s(product_id, since)
+        WHERE h.product_id = s.product_id
+        AND (s.since IS NULL OR h.effective_date >= s.since)
+    """), params)
+    conn.execute(text(_COST_HISTORY_INSERT.format(
+        seed="s.qty0", seed_value="s.value0", seed_value_ppn="s.value_ppn0",
+        scope=_COST_HISTORY_SCOPE,
+        scope_filter="AND (s.since IS NULL OR p.date >= s.since)",
+    )), params)
+
+def rebuild_product_cost_history(conn_or_engine, product_ids: list[int] | None = None, since: dict | None = None):
+    """
+    Rebuild product_cost_history from purchasing_details.
+    A back-dated purchase changes every later row of its product, so each given
+    product is rebuilt from since[product_id] (the earliest purchasing date that
+    changed) on, its running totals carried over from its last row before that
+    date. Products without a since date are rebuilt as a whole, every product
+    when product_ids is None.
+    """
+    if product_ids is not None and not product_ids:
+        return
+
+    if isinstance(conn_or_engine, Engine):
+        with conn_or_engine.begin() as conn:
+            _rebuild_cost_history(conn, product_ids, since or {})
+    elif isinstance(conn_or_engine, Connection):
+        _rebuild_cost_history(conn_or_engine, product_ids, since or {})
+    else:
+        raise TypeError("rebuild_product_cost_history expects a Connection or Engine")
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def get_costs_as_of(db, pairs) -> dict:
+    """
+    Bulk "avg cost as of date" lookup, one query for any number of (product_id, date) pairs.
+    Returns {(product_id, date): avg_cost}, keyed by the pairs as given (date or datetime).
+    Falls back to the current cached avg cost when the product has no purchase on/before
+    the date, and None when the product has no cost at all.
+    """
+    pairs = [(pid, d) for pid, d in pairs if pid is not None and d is not None]
+    keys = sorted({(pid, _as_date(d)) for pid, d in pairs})
+    if not keys:
+        return {}
+
+    q = values(column("product_id", Integer), column("as_of", Date), name="q").data(keys)
+    history = ProductCostHistory.__table__
+    cache = ProductAvgCostCache.__table__
+
+    # latest history row on/before the date, served by the (product_id, effective_date) PK
+    cost_as_of = (
+        select(history.c.avg_cost)
+        .where(history.c.product_id == q.c.product_id)
+        .where(history.c.effective_date <= q.c.as_of)
+        .order_by(history.c.effective_date.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    rows = db.execute(
+        select(q.c.product_id, q.c.as_of, func.coalesce(cost_as_of, cache.c.avg_cost).label("avg_cost"))
+        .select_from(q.outerjoin(cache, cache.c.product_id == q.c.product_id))
+    ).fetchall()
+
+    costs = {(r.product_id, r.as_of): r.avg_cost for r in rows}
+    return {(pid, d): costs.get((pid, _as_date(d))) for pid, d in pairs}
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from typing import Tuple
+
+from sqlalchemy import Table
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.sql.util import find_tables
+
+from app.utils.datatable.request import ListRequest
+
+# Seconds a list total is reused for the same filtered query (writes of other processes show up after this)
+LIST_COUNT_TTL = float(os.getenv("LIST_COUNT_TTL", "30"))
+
+# Unfiltered lists estimated above this many rows report the planner's estimate instead of counting
+LIST_COUNT_ESTIMATE_THRESHOLD = int(os.getenv("LIST_COUNT_ESTIMATE_THRESHOLD", "100000"))
+
+LIST_COUNT_MAX_ENTRIES = 1000
+
+# Connection.info key of the tables written by the connection's current transaction
+WRITTEN_TABLES_KEY = "written_tables"
+
+
+class ListCountCache:
+    """
+    Totals of list queries, keyed by their compiled SQL and parameters.
+    An entry is dropped after the TTL, or as soon as one of the tables it reads
+    is written by a committed transaction of this process (see invalidate,
+    called from app.core.events).
+    """
+
+    def __init__(self, ttl=LIST_COUNT_TTL, max_entries=LIST_COUNT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires at, {table: version}, (total, is_estimate))
+        self._versions = {}  # table name -> committed writes seen
+        self._lock = threading.Lock()
+
+    def versions(self, tables) -> dict:
+        """Current version of the tables, taken before counting so a write committed meanwhile voids the entry."""
+        with self._lock:
+            return {table: self._versions.get(table, 0) for table in tables}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, versions, value = entry
+            if expires_at < time.monotonic() or any(self._versions.get(t, 0) != v for t, v in versions.items()):
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, versions: dict, value):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: e for k, e in self._entries.items() if e[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))  # oldest
+            self._entries[key] = (now + self.ttl, versions, value)
+
+    def invalidate(self, tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+list_count_cache = ListCountCache()
+
+
+def note_written_tables(conn, tables):
+    """
+    Record tables written by the transaction of `conn` (a Connection), their
+    cached totals are dropped when it commits (see app.core.events). Core and ORM
+    writes are recorded automatically; raw SQL (text(), COPY) has to call this.
+    """
+    if tables:
+        conn.info.setdefault(WRITTEN_TABLES_KEY, set()).update(tables)
+
+
+class _Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a select, its parameters bound the usual way."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def _estimate_rows(query: Query, statement) -> int:
+    """Row estimate of the planner for the query (nothing is executed)."""
+    plan = query.session.execute(_Explain(statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_total(query: Query, request: ListRequest) -> Tuple[int, bool]:
+    """
+    (total, is_estimate) of a list query. Totals are cached (see ListCountCache),
+    so flipping pages with the same filter counts once. Lists without any
+    filter (no WHERE / HAVING) whose planner estimate is above
+    LIST_COUNT_ESTIMATE_THRESHOLD report that estimate, unless
+    request.exact_total is set.
+    """
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=query.session.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    estimate = not request.exact_total and statement.whereclause is None and not statement._having_criteria
+    key = (str(compiled), repr(compiled.params), estimate)
+
+    cached = list_count_cache.get(key)
+    if cached is not None:
+        return cached
+
+    versions = list_count_cache.versions(
+        {t.name for t in find_tables(statement, check_columns=True) if isinstance(t, Table)}
+    )
+    result = None
+    if estimate:
+        rows = _estimate_rows(query, statement)
+        if rows >= LIST_COUNT_ESTIMATE_THRESHOLD:
+            result = (rows, True)
+    if result is None:
+        result = (query.order_by(None).count() or 0, False)
+
+    list_count_cache.put(key, versions, result)
+    return result
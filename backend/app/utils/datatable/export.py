@@ -0,0 +1,82 @@
+import csv
+import io
+import os
+from datetime import date, datetime
+from enum import Enum
+from typing import Literal, Sequence
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query
+
+from app.utils.response import dump_json
+
+# Rows fetched from the server-side cursor per round trip, and written per response chunk
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_chunks(partitions):
+    for rows in partitions:
+        yield b"".join(dump_json(dict(row), orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+def _csv_chunks(keys, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for rows in partitions:
+        writer.writerows([_csv_value(v) for v in row.values()] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # header only, no rows
+        yield buffer.getvalue().encode()
+
+
+def stream_export(query: Query, columns: Sequence, export_format: ExportFormat, filename: str) -> StreamingResponse:
+    """
+    Every row of the query projected on `columns` (named like paginate's
+    projected rows), streamed as NDJSON (one object per line) or CSV (header
+    first). Rows come from a server-side cursor EXPORT_YIELD_PER at a time and
+    each batch is written as it arrives, so memory stays flat whatever the row count.
+
+    The body is produced after the route returns, when the get_db dependency
+    may already have closed the session: it checks out its own connection
+    for the cursor and closes the session once the last row is sent.
+    """
+    session = query.session
+    statement = query.with_entities(*columns).statement
+
+    def generate():
+        try:
+            result = session.execute(statement, execution_options={"yield_per": EXPORT_YIELD_PER}).mappings()
+            partitions = result.partitions()
+            if export_format == "csv":
+                yield from _csv_chunks(list(result.keys()), partitions)
+            else:
+                yield from _ndjson_chunks(partitions)
+        finally:
+            session.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
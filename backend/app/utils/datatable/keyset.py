@@ -0,0 +1,162 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, inspect, or_, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+from app.utils.datatable.request import ListRequest
+
+
+# ------------------------------------------------------
+# Cursor: opaque token holding the sort key values of a row
+# and the direction to seek in from there
+# ------------------------------------------------------
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "n" in value:
+            return Decimal(value["n"])
+    return value
+
+def encode_cursor(values: list, direction: str) -> str:
+    payload = json.dumps({"k": [_encode_value(v) for v in values], "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[list, str]:
+    """(sort key values, "next" / "prev") of a cursor returned by keyset_page."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values, direction = [_decode_value(v) for v in payload["k"]], payload["d"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if direction not in ("next", "prev"):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values, direction
+
+
+# ------------------------------------------------------
+# Sort keys: the ORDER BY of the list query, made unique
+# with the primary key of its first entity
+# ------------------------------------------------------
+def _sort_keys(query: Query) -> List[Tuple[Any, bool]]:
+    """[(model column, descending)] the query is ordered by, ending with the primary key."""
+    keys = []
+    for clause in query._order_by_clauses:
+        descending = False
+        if isinstance(clause, UnaryExpression):
+            if clause.modifier not in (operators.asc_op, operators.desc_op):
+                raise HTTPException(status_code=400, detail="Keyset pagination does not support NULLS FIRST / LAST ordering")
+            descending = clause.modifier is operators.desc_op
+            clause = clause.element
+        if "proxy_key" not in clause._annotations:
+            raise HTTPException(status_code=400, detail="Keyset pagination needs the list sorted by model columns")
+        keys.append((clause, descending))
+
+    entity = query.column_descriptions[0]["entity"]
+    mapper = inspect(entity).mapper
+    for pk in mapper.primary_key:
+        key = mapper.get_property_by_column(pk).key
+        if not any(c._annotations["parententity"].mapper is mapper and c._annotations["proxy_key"] == key for c, _ in keys):
+            keys.append((getattr(entity, key).__clause_element__(), False))
+    return keys
+
+def _key_value(item, column):
+    """Value of a sort column in a result item (model instance, or row holding one)."""
+    cls = column._annotations["parententity"].mapper.class_
+    for obj in (item if isinstance(item, Row) else (item,)):
+        if isinstance(obj, cls):
+            return getattr(obj, column._annotations["proxy_key"])
+    raise HTTPException(status_code=400, detail=f"Keyset pagination cannot sort by {cls.__name__} columns on this list")
+
+def _after(keys: list, values: list):
+    """
+    Condition for the rows sorting after `values` in the order of `keys`.
+    One row value comparison ((a, b) > (x, y), served by a matching index) when
+    every key goes the same way and cannot be NULL; otherwise expanded, with
+    NULLs last in ascending and first in descending order like PostgreSQL.
+    """
+    if len({d for _, d in keys}) == 1 and not any(c.nullable for c, _ in keys) and None not in values:
+        columns, row = tuple_(*(c for c, _ in keys)), tuple_(*values)
+        return columns < row if keys[0][1] else columns > row
+
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        value = values[i]
+        if descending:
+            beyond = column.isnot(None) if value is None else column < value
+        elif value is None:
+            continue  # nothing sorts after NULL
+        else:
+            beyond = or_(column > value, column.is_(None)) if column.nullable else column > value
+
+        same = [c.is_(None) if v is None else c == v for (c, _), v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*same, beyond))
+    return or_(*clauses)
+
+
+def keyset_page(query: Query, request: ListRequest, columns=None) -> Tuple[list, Dict[str, Any]]:
+    """
+    One page of the query in keyset mode: instead of OFFSET, the rows after
+    (or before) the cursor's sort key are sought with a WHERE on the ORDER BY
+    columns, so deep pages cost the same as the first one and no total is counted.
+    With `columns` the page is projected on them (see paginate), the sort keys
+    riding along as hidden _k<n> columns.
+    Returns (items, pagination meta with next_cursor / prev_cursor).
+    """
+    keys = _sort_keys(query)
+    values, direction = None, "next"
+    if request.cursor:
+        values, direction = decode_cursor(request.cursor)
+        if len(values) != len(keys):
+            raise HTTPException(status_code=400, detail="Cursor does not match the list sort")
+
+    # a previous page is the next one in reverse order, read backwards
+    order = [(c, not d) for c, d in keys] if direction == "prev" else keys
+    page = query.order_by(None).order_by(*(c.desc() if d else c.asc() for c, d in order))
+    if values is not None:
+        page = page.filter(_after(order, values))
+
+    if columns:
+        page = page.with_entities(*columns, *(c.label(f"_k{i}") for i, (c, _) in enumerate(keys)))
+        key_values = lambda item: [item._mapping[f"_k{i}"] for i in range(len(keys))]
+    else:
+        key_values = lambda item: [_key_value(item, c) for c, _ in keys]
+
+    items = page.limit(request.page_size + 1).all()
+    more = len(items) > request.page_size
+    items = items[:request.page_size]
+    if direction == "prev":
+        items.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = values is not None, more
+
+    first = key_values(items[0]) if items else None
+    last = key_values(items[-1]) if items else None
+    return items, {
+        "mode": "keyset",
+        "page_size": request.page_size,
+        "has_next": has_next and last is not None,
+        "has_prev": has_prev and first is not None,
+        "next_cursor": encode_cursor(last, "next") if has_next and last is not None else None,
+        "prev_cursor": encode_cursor(first, "prev") if has_prev and first is not None else None,
+    }
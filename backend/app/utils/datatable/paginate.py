@@ -1,14 +1,21 @@
-from typing import Any, Dict, Callable
+from typing import Any, Dict, Callable, Sequence
 
 from sqlalchemy.orm import Query
-from sqlalchemy.sql import func
 
+from app.utils.datatable.count import count_total
+from app.utils.datatable.keyset import keyset_page
 from app.utils.datatable.request import ListRequest
 from app.utils.datatable.response import ListResponse
 
 
+def projected_row(row) -> Dict:
+    """Row dari query yang di-project (paginate columns=...), tanpa kolom private (_k0, ...)."""
+    return {key: value for key, value in row._mapping.items() if not key.startswith('_')}
+
+
 # Helper untuk query pagination
-def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dict] = None) -> ListResponse:
+def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dict] = None,
+             columns: Sequence = None) -> ListResponse:
     """
         Paginate query dengan opsi serializer.
 
@@ -17,6 +24,15 @@ def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dic
         request: ListRequest object dengan pagination info
         serializer: Optional function untuk serialize data.
                    Jika None, akan auto-serialize semua non-private attributes
+        columns: Optional list kolom (model attributes / labeled expressions).
+                 Query di-project dengan with_entities, jadi tanpa load entity
+                 dan relationship; tiap row jadi dict {nama kolom: value}
+                 (atau diberikan ke serializer sebagai Row)
+
+    Dengan request.cursor / request.keyset halaman diambil dalam keyset mode
+    (lihat datatable/keyset.py): total None, plus next_cursor / prev_cursor.
+    Total di-cache per query (lihat datatable/count.py); total_is_estimate True
+    kalau total adalah estimasi planner.
 
     Returns:
         ListResponse dengan data yang sudah di-paginate
@@ -25,6 +41,9 @@ def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dic
         # Auto-serialize (mengembalikan semua fields dari model)
         paginate(query, request)
 
+        # Hanya kolom yang dibutuhkan, tanpa load entity
+        paginate(query, request, columns=(Supplier.id, Supplier.code, Supplier.name))
+
         # Dengan lambda untuk custom formatting
         paginate(query, request, lambda client: {
             "id": client.id,
@@ -50,22 +69,35 @@ def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dic
         paginate(query, request, format_client)
     """
 
-    # Hitung total records
-    total = query.order_by(None).with_entities(func.count()).scalar() or 0
-
-    # Ambil data dengan pagination
-    items = (
-        query
-        .offset(request.offset)
-        .limit(request.page_size)
-        .all()
-    )
+    cursors = {}
+    total_is_estimate = False
+    if request.is_keyset:
+        # Keyset mode: seek dari cursor, tanpa OFFSET dan tanpa COUNT
+        items, pagination = keyset_page(query, request, columns)
+        total = None
+        cursors = {"next_cursor": pagination["next_cursor"], "prev_cursor": pagination["prev_cursor"]}
+    else:
+        # Hitung total records (di-cache, atau estimasi untuk list besar tanpa filter)
+        total, total_is_estimate = count_total(query, request)
+
+        # Ambil data dengan pagination
+        items = (
+            (query.with_entities(*columns) if columns else query)
+            .offset(request.offset)
+            .limit(request.page_size)
+            .all()
+        )
 
     # Serialize data
     if serializer:
         # Gunakan custom serializer (lambda atau function)
         data = [serializer(item) for item in items]
-        return ListResponse(data, total, request.page, request.page_size)
+        return ListResponse(data, total, request.page, request.page_size, total_is_estimate=total_is_estimate, **cursors)
+
+    if columns:
+        # Kolom yang di-project: langsung dari Row._mapping
+        data = [projected_row(item) for item in items]
+        return ListResponse(data, total, request.page, request.page_size, total_is_estimate=total_is_estimate, **cursors)
 
     # Auto-serialize: ambil semua non-private attributes dari model
     data = []
@@ -89,4 +121,4 @@ def paginate(query: Query, request: ListRequest, serializer: Callable[[Any], Dic
 
         data.append(row)
 
-    return ListResponse(data, total, request.page, request.page_size)
+    return ListResponse(data, total, request.page, request.page_size, total_is_estimate=total_is_estimate, **cursors)
@@ -13,6 +13,14 @@ class ListRequest(BaseModel):
     
     sort_by: Optional[str] = None
     sort_dir: Optional[str] = None
+
+    # keyset mode (see datatable/keyset.py): cursor from the previous response's meta,
+    # or keyset=true for the first page
+    cursor: Optional[str] = None
+    keyset: Optional[bool] = False
+
+    # count the total even when the planner estimate of an unfiltered list would do (see datatable/count.py)
+    exact_total: Optional[bool] = False
     
     @field_validator("page")
     @classmethod
@@ -28,6 +36,10 @@ class ListRequest(BaseModel):
     def offset(self) -> int:
         return (self.page - 1) * self.page_size
 
+    @property
+    def is_keyset(self) -> bool:
+        return bool(self.keyset or self.cursor)
+
     @property
     def search_str(self) -> str:
         return (self.q or "").strip()
@@ -1,16 +1,51 @@
+import math
 from typing import Any, Dict, List, TypeVar, Generic
 
 class ListResponse:
-    def __init__(self, data: List[Dict[str, Any]], total: int, page: int, page_size: int):
+    def __init__(self, data: List[Dict[str, Any]], total: int, page: int, page_size: int,
+                 next_cursor: str = None, prev_cursor: str = None, total_is_estimate: bool = False):
         self.data = data
-        self.total = total
+        self.total = total  # None in keyset mode (see datatable/keyset.py)
         self.page = page
         self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total_is_estimate = total_is_estimate  # planner estimate, see datatable/count.py
 
     def dict(self) -> Dict[str, Any]:
-        return {
+        result = {
             "data": self.data,
             "total": self.total,
             "page": self.page,
             "page_size": self.page_size,
+            "total_is_estimate": self.total_is_estimate,
+        }
+        if self.total is None:  # keyset mode
+            result["next_cursor"] = self.next_cursor
+            result["prev_cursor"] = self.prev_cursor
+        return result
+
+    def pagination(self) -> Dict[str, Any]:
+        """Pagination meta of the page (meta.pagination of APIResponse.paginated)."""
+        if self.total is None:  # keyset mode
+            return {
+                "mode": "keyset",
+                "page_size": self.page_size,
+                "has_next": self.next_cursor is not None,
+                "has_prev": self.prev_cursor is not None,
+                "next_cursor": self.next_cursor,
+                "prev_cursor": self.prev_cursor,
+            }
+
+        total_pages = math.ceil(self.total / self.page_size) if self.page_size > 0 else 0
+        return {
+            "page": self.page,
+            "page_size": self.page_size,
+            "total": self.total,
+            "total_is_estimate": self.total_is_estimate,
+            "total_pages": total_pages,
+            "has_next": self.page < total_pages,
+            "has_prev": self.page > 1,
+            "from": (self.page - 1) * self.page_size + 1 if self.data else 0,
+            "to": min(self.page * self.page_size, self.total)
         }
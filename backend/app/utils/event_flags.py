@@ -4,12 +4,16 @@ import contextvars
 _skip_cost_cache_update = contextvars.ContextVar("_skip_cost_cache_update", default=False)
 
 def skip_cost_cache_updates():
-    """Context manager to temporarily disable avg cost cache updates."""
+    """
+    Context manager to defer avg cost cache updates.
+    Commits inside the block keep the affected products queued; they are
+    recomputed on the next commit outside the block (or flush_avg_cost_updates).
+    """
     class _Skip:
         def __enter__(self_inner):
-            _skip_cost_cache_update.set(True)
+            self_inner.token = _skip_cost_cache_update.set(True)
         def __exit__(self_inner, exc_type, exc_val, exc_tb):
-            _skip_cost_cache_update.set(False)
+            _skip_cost_cache_update.reset(self_inner.token)
     return _Skip()
 
 def should_skip_cost_cache_updates():
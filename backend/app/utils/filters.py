@@ -1,8 +1,14 @@
 from sqlalchemy.orm import Query
 from app.models import Product, Purchasing, Account, AccountParent
 
-def apply_common_report_filters(query: Query, filters) -> Query:
-    """Apply generic filters (product, supplier, account, category) to any report query."""
+def apply_common_report_filters(query: Query, filters, supplier_column=None) -> Query:
+    """
+    Apply generic filters (product, supplier, account, category) to any report query.
+    supplier_column: column filtered by supplier_ids (default Purchasing.supplier_id).
+    """
+    if supplier_column is None:
+        supplier_column = Purchasing.supplier_id
+
     def get_field(name):
         return filters.get(name) if isinstance(filters, dict) else getattr(filters, name, None)
     
@@ -16,7 +22,7 @@ def apply_common_report_filters(query: Query, filters) -> Query:
         query = query.filter(Product.id.in_(product_ids))
 
     if supplier_ids:
-        query = query.filter(Purchasing.supplier_id.in_(supplier_ids))
+        query = query.filter(supplier_column.in_(supplier_ids))
 
     if account_parent_codes:
         query = query.filter(AccountParent.account_no.in_(account_parent_codes))
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from app.models.import_checkpoint import ImportCheckpoint
+
+def resumable_checkpoint(db: Session, import_type: str, content_hash: str):
+    """Latest checkpoint of an unfinished chunked import of this upload, None if there is none."""
+    return (
+        db.query(ImportCheckpoint)
+        .filter(
+            ImportCheckpoint.import_type == import_type,
+            ImportCheckpoint.content_hash == content_hash,
+            ImportCheckpoint.status != "done",
+        )
+        .order_by(ImportCheckpoint.id.desc())
+        .first()
+    )
+
+def save_checkpoint(db: Session, checkpoint: ImportCheckpoint, **values):
+    """
+    Update the checkpoint in the current transaction, so it is committed together
+    with the rows it accounts for. A new checkpoint is added to the session.
+    """
+    for name, value in values.items():
+        setattr(checkpoint, name, value)
+    checkpoint.updated_at = datetime.utcnow()
+    db.add(checkpoint)
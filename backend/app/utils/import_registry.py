@@ -0,0 +1,150 @@
+import hashlib
+import posixpath
+import re
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+from sqlalchemy.orm import Session
+
+from app.models.import_registry import ImportRegistry
+from app.utils.parse_cache import file_digest
+
+# <si> entries of the shared strings part, and sheet cells pointing at one of them (t="s")
+_SHARED_STRING = re.compile(rb"<(?:\w+:)?si\b(?:[^>]*/>|.*?</(?:\w+:)?si>)", re.S)
+_SHARED_STRING_CELL = re.compile(rb"(<(?:\w+:)?c\b[^>]*\bt=\"s\"[^>]*>\s*<(?:\w+:)?v>)(\d+)(</(?:\w+:)?v>)")
+# cells without a value and rows without cells, written or dropped depending on the program that saved the file
+_EMPTY_CELL = re.compile(rb"<(?:\w+:)?c\b[^>]*?(?:/>|>\s*</(?:\w+:)?c>)")
+_EMPTY_ROW = re.compile(rb"<(?:\w+:)?row\b[^>]*?(?:/>|>\s*</(?:\w+:)?row>)")
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _relationships(zf: zipfile.ZipFile, part: str) -> dict:
+    """{relationship id: (type, target part)} of a package part."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_path not in zf.namelist():
+        return {}
+
+    rels = {}
+    for rel in ElementTree.fromstring(zf.read(rels_path)):
+        target = rel.get("Target", "")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type", ""), target)
+    return rels
+
+def _worksheets(zf: zipfile.ZipFile):
+    """(workbook relationships, [(sheet name, worksheet part)]) in workbook order."""
+    workbook = next(
+        target for rel_type, target in _relationships(zf, "").values()
+        if rel_type.endswith("/officeDocument")
+    )
+    rels = _relationships(zf, workbook)
+
+    sheets = []
+    for sheet in ElementTree.fromstring(zf.read(workbook)).iter():
+        if _local(sheet.tag) != "sheet":
+            continue
+        rel_id = next((v for k, v in sheet.attrib.items() if _local(k) == "id"), None)
+        rel_type, target = rels.get(rel_id, ("", None))
+        if rel_type.endswith("/worksheet"):  # not chartsheets, ...
+            sheets.append((sheet.get("name"), target))
+    return rels, sheets
+
+def sheet_names(fileobj) -> list:
+    """Worksheet names of an .xlsx upload, without loading it. The file is rewound afterwards."""
+    fileobj.seek(0)
+    with zipfile.ZipFile(fileobj) as zf:
+        names = [name for name, _ in _worksheets(zf)[1]]
+    fileobj.seek(0)
+    return names
+
+def sheet_fingerprints(fileobj) -> dict:
+    """
+    sha256 of every worksheet of an .xlsx upload, read from the zip parts without
+    parsing the cells. Shared string references are replaced by the strings
+    themselves, empty cells and rows are left out and the styles part is included, so a sheet keeps its fingerprint
+    when other sheets change and changes whenever one of its values or number
+    formats does. The file is rewound afterwards.
+    """
+    fileobj.seek(0)
+    with zipfile.ZipFile(fileobj) as zf:
+        rels, sheets = _worksheets(zf)
+        parts = {rel_type.rsplit("/", 1)[-1]: target for rel_type, target in rels.values()}
+
+        strings = []
+        if parts.get("sharedStrings") in zf.namelist():
+            strings = _SHARED_STRING.findall(zf.read(parts["sharedStrings"]))
+        styles = zf.read(parts["styles"]) if parts.get("styles") in zf.namelist() else b""
+
+        def shared_string(m):
+            index = int(m[2])
+            return m[1] + strings[index] + m[3] if index < len(strings) else m[0]
+
+        fingerprints = {}
+        for name, target in sheets:
+            digest = hashlib.sha256(styles)
+            sheet_xml = _EMPTY_ROW.sub(b"", _EMPTY_CELL.sub(b"", zf.read(target)))
+            digest.update(_SHARED_STRING_CELL.sub(shared_string, sheet_xml))
+            fingerprints[name] = digest.hexdigest()
+
+    fileobj.seek(0)
+    return fingerprints
+
+def committed_fingerprints(db: Session, import_type: str, fingerprints: dict) -> set:
+    """
+    Keys of `fingerprints` ({sheet name or None for the whole file: hash}) whose
+    hash was already committed for `import_type` under the same sheet name.
+    """
+    if not fingerprints:
+        return set()
+
+    rows = (
+        db.query(ImportRegistry.sheet_name, ImportRegistry.content_hash)
+        .filter(
+            ImportRegistry.import_type == import_type,
+            ImportRegistry.content_hash.in_(set(fingerprints.values())),
+            ImportRegistry.committed_at.isnot(None),
+        )
+        .all()
+    )
+    committed = set(rows)
+    return {key for key, content_hash in fingerprints.items() if (key, content_hash) in committed}
+
+def check_imported(db: Session, import_type: str, fileobj, force: bool = False):
+    """
+    Returns (fingerprints, imported). fingerprints is {None: file hash, sheet name:
+    sheet hash}, to register once the import is done (see register_import).
+    imported holds the sheets already committed for import_type, plus None when
+    the whole file was: then every sheet counts and sheets are not hashed at all.
+    With force nothing counts as imported.
+    """
+    fingerprints = {None: file_digest(fileobj)}
+    if not force and committed_fingerprints(db, import_type, fingerprints):
+        return fingerprints, {None, *sheet_names(fileobj)}
+
+    fingerprints.update(sheet_fingerprints(fileobj))
+    if force:
+        return fingerprints, set()
+    return fingerprints, committed_fingerprints(db, import_type, fingerprints)
+
+def register_import(db: Session, import_type: str, fingerprints: dict, filename=None, row_counts=None,
+                    session_id=None, committed=True):
+    """
+    Record the fingerprints of an import in the current transaction, so they only
+    count once the imported rows are committed. Staged imports pass their
+    session_id and committed=False, commit_data marks them later.
+    """
+    row_counts = row_counts or {}
+    committed_at = datetime.utcnow() if committed else None
+    for key, content_hash in fingerprints.items():
+        db.add(ImportRegistry(
+            import_type=import_type,
+            sheet_name=key,
+            content_hash=content_hash,
+            filename=filename,
+            row_count=row_counts.get(key),
+            session_id=session_id,
+            committed_at=committed_at,
+        ))
@@ -48,4 +48,28 @@ def normalise_supplier_name(value: str) -> str:
         value = str(value or "")
     value = value.strip()
     value = re.sub(r"\s+", " ", value)
-    return value.upper()
\ No newline at end of file
+    return value.upper()
+
+# ------------------------------------------------------
+# Column versions, applied to a whole sheet column at once
+# ------------------------------------------------------
+def _as_text(series):
+    return series.map(lambda v: v if isinstance(v, str) else str(v or ""))
+
+def normalise_product_names(series):
+    """normalise_product_name for every cell of a pandas Series."""
+    return _as_text(series).str.strip().str.replace(r"\s+", " ", regex=True).str.upper()
+
+def normalise_design_names(series):
+    """normalise_design_name for every cell of a pandas Series."""
+    text = _as_text(series)
+    return text.str.strip().str.replace(r"\s+", " ", regex=True).where(text != "", None)
+
+def normalise_account_names(series):
+    """normalise_account_name for every cell of a pandas Series."""
+    text = _as_text(series).str.replace(".", " ", regex=False)
+    return text.str.strip().str.replace(r"\s+", "_", regex=True).str.upper()
+
+def normalise_supplier_names(series):
+    """normalise_supplier_name for every cell of a pandas Series."""
+    return normalise_product_names(series)
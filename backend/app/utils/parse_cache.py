@@ -0,0 +1,83 @@
+import hashlib
+import importlib
+import os
+import pickle
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from app.utils.upload_dir import get_upload_dir
+
+# Seconds a parsed upload stays reusable (preview, then import of the same file)
+PARSE_CACHE_TTL = int(os.getenv("PARSE_CACHE_TTL", "3600"))
+
+def file_digest(fileobj) -> str:
+    """sha256 of an upload's content, read in blocks; the file is rewound afterwards."""
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def source_version(*modules: str) -> str:
+    """
+    Short hash of the source files of `modules` (dotted names), part of the cache
+    key so that entries written by an older version of the parsing code are not reused.
+    """
+    digest = hashlib.sha256()
+    for name in modules:
+        digest.update(Path(importlib.import_module(name).__file__).read_bytes())
+    return digest.hexdigest()[:12]
+
+def _cache_dir() -> Path:
+    path = get_upload_dir() / "parse_cache"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def _is_fresh(path: Path) -> bool:
+    try:
+        return time.time() - path.stat().st_mtime < PARSE_CACHE_TTL
+    except FileNotFoundError:
+        return False
+
+def evict_expired():
+    """Remove cache entries (and leftover partial writes) older than the TTL."""
+    for path in _cache_dir().iterdir():
+        if not _is_fresh(path):
+            path.unlink(missing_ok=True)
+
+def cached_items(kind: str, digest: str, produce):
+    """
+    Items of produce(), an iterable of picklable values.
+    When the same `kind` of parse ran on an upload with this digest within the
+    TTL, they are read back from the cache file one by one; otherwise they are
+    produced and appended to the cache file while being consumed. The entry is
+    kept only if the consumer reads every item, so a parse interrupted by an
+    error is never reused.
+    """
+    path = _cache_dir() / f"{kind}-{digest}.pkl"
+    if _is_fresh(path):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    evict_expired()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            for item in produce():
+                pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield item
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def cached_value(kind: str, digest: str, produce):
+    """produce() cached like cached_items, for parses returning a single value."""
+    return list(cached_items(kind, digest, lambda: [produce()]))[0]
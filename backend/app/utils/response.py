@@ -1,13 +1,53 @@
-import math
 import os
-from typing import Any, Optional, Dict, List, Callable
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Optional, Dict, List, Callable, Sequence
+
+import orjson
+import pandas as pd
 from fastapi.responses import JSONResponse
 from fastapi import status
 from sqlalchemy import func
 from sqlalchemy.orm import Query
 
+from app.utils.datatable.paginate import paginate
 from app.utils.datatable.request import ListRequest
 
+
+def _orjson_default(obj):
+    """Types orjson does not serialize natively (Decimal, pandas values from parsed sheets)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()  # pd.Timestamp and other subclasses
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dump_json(content: Any, option: int = 0) -> bytes:
+    """
+    content as JSON with orjson: datetime / date / UUID / enum / numpy values
+    are serialized natively, Decimal as number, NaN / inf / NaT as null,
+    pd.Timestamp as ISO string and timedelta as seconds.
+    option: extra orjson.OPT_* flags.
+    """
+    return orjson.dumps(
+        content,
+        default=_orjson_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | option,
+    )
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with dump_json, payloads need no sanitize pass before being returned."""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
 class APIResponse:
     """
     Custom API Response class untuk konsistensi response format
@@ -39,7 +79,7 @@ class APIResponse:
         if meta:
             response_data["meta"] = meta
 
-        self.response = JSONResponse(
+        self.response = ORJSONResponse(
             status_code=status_code,
             content=response_data
         )
@@ -70,7 +110,7 @@ class APIResponse:
         if meta:
             response_data["meta"] = meta
 
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status_code,
             content=response_data
         )
@@ -222,7 +262,7 @@ class APIResponse:
 
     @classmethod
     def paginated(cls, query: Query, request: ListRequest, serializer: Callable[[Any], Dict] = None,
-                  message: str = "Data retrieved successfully"):
+                  message: str = "Data retrieved successfully", columns: Sequence = None):
         """
             Paginate Response.
 
@@ -232,9 +272,17 @@ class APIResponse:
             serializer: Optional function untuk serialize data.
                        Jika None, akan auto-serialize semua non-private attributes
             message: Optional message
+            columns: Optional list kolom (model attributes / labeled expressions).
+                     Query di-project dengan with_entities, jadi tanpa load entity
+                     dan relationship; tiap row jadi dict {nama kolom: value}
+                     (atau diberikan ke serializer sebagai Row)
 
         Returns:
-            JSONResponse dengan struktur standar dan pagination di meta
+            JSONResponse dengan struktur standar dan pagination di meta.
+            Total di-cache per query (lihat datatable/count.py); total_is_estimate
+            True kalau total adalah estimasi planner (request.exact_total untuk hitung pasti).
+            Dengan request.cursor / request.keyset: keyset mode (lihat
+            datatable/keyset.py), meta berisi next_cursor / prev_cursor tanpa total.
 
         Examples:
             # Auto-serialize (mengembalikan semua fields dari model)
@@ -251,62 +299,10 @@ class APIResponse:
             })
         """
 
-        # Hitung total records
-        total = query.order_by(None).count() or 0
-
-        # Ambil data dengan pagination
-        items = (
-            query
-            .offset(request.offset)
-            .limit(request.page_size)
-            .all()
-        )
-
-        # Serialize data
-        if serializer:
-            # Gunakan custom serializer (lambda atau function)
-            data = [serializer(item) for item in items]
-        else:
-            # Auto-serialize: ambil semua non-private attributes dari model
-            data = []
-            for item in items:
-                # Untuk SQLAlchemy model objects
-                if hasattr(item, '__dict__'):
-                    row = {
-                        key: value
-                        for key, value in item.__dict__.items()
-                        if not key.startswith('_')
-                    }
-                else:
-                    # Untuk hasil query dengan specific columns (tuple/named tuple)
-                    if hasattr(item, '_asdict'):
-                        row = item._asdict()
-                    elif hasattr(item, 'keys'):
-                        row = dict(zip(item.keys(), item))
-                    else:
-                        # Fallback: convert tuple to dict dengan index
-                        row = {f"column_{i}": value for i, value in enumerate(item)}
-
-                data.append(row)
-
-        # Calculate pagination meta
-        total_pages = math.ceil(total / request.page_size) if request.page_size > 0 else 0
-
-        meta = {
-            "pagination": {
-                "page": request.page,
-                "page_size": request.page_size,
-                "total": total,
-                "total_pages": total_pages,
-                "has_next": request.page < total_pages,
-                "has_prev": request.page > 1,
-                "from": (request.page - 1) * request.page_size + 1 if data else 0,
-                "to": min(request.page * request.page_size, total)
-            }
-        }
-
+        # Query, count dan serialize lewat paginate (datatable/paginate.py)
+        page = paginate(query, request, serializer, columns)
         return cls.ok(
             message=message,
-            data=data,
-            meta=meta
-        )
\ No newline at end of file
+            data=page.data,
+            meta={"pagination": page.pagination()}
+        )
@@ -0,0 +1,135 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Connection
+
+from app.utils.stock_helper import _execute
+
+# session.info key holding what the current transaction touched:
+# {"days": {rollup: {date}}, "headers": {header_table: {header_id}}}
+ROLLUP_DIRTY_KEY = "rollup_dirty"
+
+# header table -> rollup fed by its details
+ROLLUP_HEADERS = {
+    "purchasings": "purchasing",
+    "color_kitchen_batches": "color_kitchen",
+    "color_kitchen_entries": "color_kitchen",
+}
+
+# (rollup table, INSERT ... SELECT with a {where} placeholder applied to every source header `h`)
+ROLLUP_SQL = {
+    "purchasing": ("purchasing_daily_rollups", """
+        INSERT INTO purchasing_daily_rollups (date, product_id, supplier_id, quantity, total_value, total_value_ppn)
+        SELECT CAST(h.date AS date), pd.product_id, h.supplier_id,
+               SUM(pd.quantity),
+               SUM(pd.quantity * pd.price),
+               SUM(pd.quantity * (pd.price + COALESCE(pd.ppn, 0) - COALESCE(pd.pph, 0)))
+        FROM purchasing_details pd
+        JOIN purchasings h ON h.id = pd.purchasing_id
+        WHERE h.date IS NOT NULL {where}
+        GROUP BY CAST(h.date AS date), pd.product_id, h.supplier_id
+    """),
+    "color_kitchen": ("color_kitchen_daily_rollups", """
+        INSERT INTO color_kitchen_daily_rollups (date, product_id, design_id, chemical_type, quantity, total_cost)
+        SELECT CAST(h.date AS date), bd.product_id, NULL, 'DYE',
+               SUM(bd.quantity), SUM(bd.quantity * COALESCE(bd.unit_cost_used, 0))
+        FROM color_kitchen_batch_details bd
+        JOIN color_kitchen_batches h ON h.id = bd.batch_id
+        WHERE h.date IS NOT NULL {where}
+        GROUP BY CAST(h.date AS date), bd.product_id
+        UNION ALL
+        SELECT CAST(h.date AS date), ed.product_id, h.design_id, 'AUX',
+               SUM(ed.quantity), SUM(ed.quantity * COALESCE(ed.unit_cost_used, 0))
+        FROM color_kitchen_entry_details ed
+        JOIN color_kitchen_entries h ON h.id = ed.color_kitchen_entry_id
+        WHERE h.date IS NOT NULL {where}
+        GROUP BY CAST(h.date AS date), ed.product_id, h.design_id
+    """),
+}
+
+# days touched by the transaction, on top of the range bounds so the header date indexes are used
+_DAYS_FILTER = """
+    AND h.date >= :first_day AND h.date < :after_last_day
+    AND CAST(h.date AS date) = ANY(:days)
+"""
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault(ROLLUP_DIRTY_KEY, {"days": {}, "headers": {}})
+
+def mark_rollup_day(session: Session, rollup: str, value):
+    """Queue a day of `rollup` for recomputation at commit."""
+    if value is None:
+        return
+    if isinstance(value, datetime):
+        value = value.date()
+    _pending(session)["days"].setdefault(rollup, set()).add(value)
+
+def mark_rollup_header(session: Session, header_table: str, header_id):
+    """Queue the day of a header whose details changed (its date is resolved at commit)."""
+    if header_id is None:
+        return
+    _pending(session)["headers"].setdefault(header_table, set()).add(header_id)
+
+def header_days(conn: Connection, header_table: str, header_ids) -> set:
+    """Days of the given header rows (headers without a date are left out)."""
+    header_ids = list(header_ids)
+    if not header_ids:
+        return set()
+    return set(conn.execute(
+        text(f"SELECT DISTINCT CAST(date AS date) FROM {header_table} WHERE id = ANY(:ids) AND date IS NOT NULL"),
+        {"ids": header_ids},
+    ).scalars())
+
+def refresh_daily_rollups(conn: Connection, rollup: str, days):
+    """
+    Recompute the rollup rows of the given days from the detail tables.
+    Days are locked (transaction advisory lock) in sorted order first, so two
+    transactions refreshing the same day run one after the other and the
+    second one rebuilds from the first one's committed rows.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+
+    table, insert_sql = ROLLUP_SQL[rollup]
+    params = {"days": days, "first_day": days[0], "after_last_day": days[-1] + timedelta(days=1), "table": table}
+
+    conn.execute(text("""
+        SELECT pg_advisory_xact_lock(hashtext(:table), d - DATE '2000-01-01')
+        FROM (SELECT d FROM unnest(CAST(:days AS date[])) AS d ORDER BY d) t
+    """), params)
+    conn.execute(text(f"DELETE FROM {table} WHERE date = ANY(:days)"), params)
+    conn.execute(text(insert_sql.format(where=_DAYS_FILTER)), params)
+
+def flush_daily_rollups(db: Session):
+    """Apply the days queued by the current transaction (called from before_commit)."""
+    pending = db.info.pop(ROLLUP_DIRTY_KEY, None)
+    if not pending:
+        return
+
+    conn = db.connection()
+    days = {rollup: set(values) for rollup, values in pending["days"].items()}
+    for header_table, header_ids in pending["headers"].items():
+        days.setdefault(ROLLUP_HEADERS[header_table], set()).update(header_days(conn, header_table, header_ids))
+
+    for rollup, rollup_days in days.items():
+        refresh_daily_rollups(conn, rollup, rollup_days)
+
+def rebuild_daily_rollups(conn_or_engine):
+    """Full rebuild of every daily rollup from the detail tables (repairs drift)."""
+    statements = []
+    for table, insert_sql in ROLLUP_SQL.values():
+        statements.append((text(f"DELETE FROM {table}"), {}))
+        statements.append((text(insert_sql.format(where="")), {}))
+    _execute(conn_or_engine, "rebuild_daily_rollups", statements)
+
+def rollup_day(value) -> date | None:
+    """Report filter value (ISO string / datetime / date) -> day compared against rollup dates."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
@@ -1,6 +1,6 @@
 import pandas as pd
+import numpy as np
 import math
-from decimal import Decimal
 
 def safe_str(value):
     if pd.isna(value):
@@ -34,13 +34,46 @@ def safe_number(value):
         return None
     return f
 
-def sanitize(obj):
-    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-        return None
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, dict):
-        return {k: sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [sanitize(v) for v in obj]
-    return obj
\ No newline at end of file
+# ------------------------------------------------------
+# Column versions: same results as the scalar helpers above,
+# computed once per sheet column instead of once per cell
+# ------------------------------------------------------
+def str_column(series: pd.Series) -> pd.Series:
+    """safe_str for a whole column (object series, None for empty cells)."""
+    text = series.astype(object).astype(str).str.strip()
+    keep = series.notna() & (text != "") & (text.str.lower() != "nan")
+    return text.where(keep, None)
+
+def number_column(series: pd.Series) -> pd.Series:
+    """safe_number for a whole column (object series of floats, None for non-numbers)."""
+    if pd.api.types.is_bool_dtype(series):
+        values = pd.Series(np.nan, index=series.index)
+    elif pd.api.types.is_numeric_dtype(series):
+        values = series.astype(float)
+    else:
+        # Tolerate "46,375" style decimals
+        text = series.astype(object).astype(str).str.strip().str.replace(",", ".", regex=False)
+        text = text.where(~series.map(lambda v: isinstance(v, (bool, np.bool_))), None)
+        values = pd.to_numeric(text, errors="coerce").astype(float)
+    return values.astype(object).where(np.isfinite(values), None)
+
+def date_column(series: pd.Series) -> pd.Series:
+    """safe_date for a whole column (object series of dates, None for non-dates)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        ts = series
+    else:
+        ts = pd.to_datetime(series, errors="coerce", format="mixed")
+    return ts.dt.date.astype(object).where(ts.notna(), None)
+
+def parse_columns(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """
+    Clean the sheet columns once: {"field": ("SHEET COLUMN", str_column / number_column / date_column)}.
+    Keeps the sheet index (for Excel row numbers); columns missing from the sheet come out as None.
+    """
+    parsed = pd.DataFrame(index=df.index)
+    for field, (column, parse) in columns.items():
+        if column in df.columns:
+            parsed[field] = parse(df[column])
+        else:
+            parsed[field] = pd.Series([None] * len(df), index=df.index, dtype=object)
+    return parsed
@@ -0,0 +1,144 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+
+from app.models import StockBalance
+from app.models.enum.ledger_enum import LedgerLocation
+
+# session.info key holding the stock balance deltas of the current flush:
+# {(product_id, location): qty}
+STOCK_DELTA_KEY = "stock_delta"
+
+def add_stock_delta(deltas: dict, product_id, location, qty):
+    """Accumulate a signed quantity change for (product, location)."""
+    if product_id is None or location is None:
+        return
+
+    key = (product_id, LedgerLocation(location))
+    deltas[key] = deltas.get(key, 0.0) + float(qty or 0)
+
+def apply_stock_deltas(conn: Connection, deltas: dict):
+    """Add the deltas to stock_balances in one upsert (sorted, so concurrent writers lock rows in the same order)."""
+    rows = [
+        {"product_id": pid, "location": location, "qty": qty}
+        for (pid, location), qty in sorted(deltas.items(), key=lambda kv: (kv[0][0], kv[0][1].value))
+        if qty
+    ]
+    if not rows:
+        return
+
+    table = StockBalance.__table__
+    stmt = insert(table)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.location],
+            set_={"qty": table.c.qty + stmt.excluded.qty, "last_updated": func.now()},
+        ),
+        rows,
+    )
+
+def _execute(conn_or_engine, name, statements):
+    if isinstance(conn_or_engine, Engine):
+        with conn_or_engine.begin() as conn:
+            return [conn.execute(sql, params) for sql, params in statements]
+    elif isinstance(conn_or_engine, Connection):
+        return [conn_or_engine.execute(sql, params) for sql, params in statements]
+    raise TypeError(f"{name} expects a Connection or Engine")
+
+def rebuild_stock_balances(conn_or_engine):
+    """Full rebuild of stock_balances from the ledger (repairs drift)."""
+    _execute(conn_or_engine, "rebuild_stock_balances", [
+        (text("DELETE FROM stock_balances"), {}),
+        (text("""
+            INSERT INTO stock_balances (product_id, location, qty, last_updated)
+            SELECT product_id, location, SUM(COALESCE(quantity_in, 0) - COALESCE(quantity_out, 0)), NOW()
+            FROM ledgers
+            GROUP BY product_id, location
+        """), {}),
+    ])
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def _next_month(period: date) -> date:
+    return date(period.year + period.month // 12, period.month % 12 + 1, 1)
+
+def close_stock_month(conn_or_engine, period):
+    """
+    Write the closing snapshot of the month containing `period`:
+    previous month's snapshot + ledger movements of this month
+    (the whole ledger up to month end when there is no previous snapshot).
+    Re-running a month overwrites it, later months must then be closed again.
+    """
+    period = _month_start(period)
+    prev_period = _month_start(period - timedelta(days=1))
+    params = {"period": period, "prev": prev_period, "next": _next_month(period)}
+
+    _execute(conn_or_engine, "close_stock_month", [
+        (text("DELETE FROM stock_balance_snapshots WHERE period = :period"), params),
+        (text("""
+            WITH prev AS (
+                SELECT product_id, location, qty
+                FROM stock_balance_snapshots
+                WHERE period = :prev
+            )
+            INSERT INTO stock_balance_snapshots (period, product_id, location, qty)
+            SELECT :period, product_id, location, SUM(qty)
+            FROM (
+                SELECT product_id, location, qty FROM prev
+                UNION ALL
+                SELECT l.product_id, l.location, COALESCE(l.quantity_in, 0) - COALESCE(l.quantity_out, 0)
+                FROM ledgers l
+                WHERE l.date < :next
+                  AND (NOT EXISTS (SELECT 1 FROM prev) OR l.date >= :period)
+            ) t
+            GROUP BY product_id, location
+        """), params),
+    ])
+
+def get_stock_balances_as_of(db: Session, as_of, location: LedgerLocation | None = None, product_ids: list[int] | None = None) -> dict:
+    """
+    Historical stock at the end of day `as_of`: latest closed monthly snapshot
+    before that day + ledger movements since the snapshot.
+    Returns {(product_id, location): qty}.
+    """
+    end = datetime.combine(as_of, time.min) + timedelta(days=1) if not isinstance(as_of, datetime) else as_of
+
+    snapshot = db.execute(
+        text("SELECT MAX(period) FROM stock_balance_snapshots WHERE period < :month"),
+        {"month": _month_start(end - timedelta(microseconds=1))},
+    ).scalar()
+
+    filters = ""
+    params = {"end": end, "snapshot": snapshot}
+    if location is not None:
+        filters += " AND location = :location"
+        params["location"] = LedgerLocation(location).name  # enum is stored by name
+    if product_ids is not None:
+        filters += " AND product_id = ANY(:pids)"
+        params["pids"] = list(product_ids)
+
+    snapshot_part = ""
+    ledger_from = ""
+    if snapshot is not None:
+        params["snapshot_end"] = _next_month(snapshot)
+        snapshot_part = f"""
+            SELECT product_id, location, qty FROM stock_balance_snapshots
+            WHERE period = :snapshot {filters}
+            UNION ALL"""
+        ledger_from = " AND date >= :snapshot_end"
+
+    rows = db.execute(text(f"""
+        SELECT product_id, location, SUM(qty) AS qty
+        FROM ({snapshot_part}
+            SELECT product_id, location, COALESCE(quantity_in, 0) - COALESCE(quantity_out, 0) AS qty
+            FROM ledgers
+            WHERE date < :end{ledger_from} {filters}
+        ) t
+        GROUP BY product_id, location
+    """), params).fetchall()
+
+    return {(r.product_id, LedgerLocation[r.location]): float(r.qty or 0) for r in rows}
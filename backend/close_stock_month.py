@@ -0,0 +1,28 @@
+"""
+Monthly stock closing: writes stock_balance_snapshots for a month.
+Run at the start of every month (e.g. cron on day 1) to close the previous month:
+
+    python close_stock_month.py            # previous month
+    python close_stock_month.py 2025-08    # a given month
+    python close_stock_month.py --rebuild  # also rebuild stock_balances from the ledger
+"""
+import sys
+from datetime import date, datetime, timedelta
+
+from app.core.database import engine
+from app.utils.stock_helper import close_stock_month, rebuild_stock_balances
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+
+    if "--rebuild" in sys.argv:
+        rebuild_stock_balances(engine)
+        print("Stock balances rebuilt from ledger.")
+
+    if args:
+        period = datetime.strptime(args[0], "%Y-%m").date()
+    else:
+        period = date.today().replace(day=1) - timedelta(days=1)
+
+    close_stock_month(engine, period)
+    print(f"Stock closed for {period:%Y-%m}.")
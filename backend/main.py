@@ -1,11 +1,15 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Depends
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from app.utils.response import APIResponse
+from app.utils.response import APIResponse, ORJSONResponse
 
 from app.core import events
+from app.core.scheduler import product_avg_cost_refresher
+from app.core.import_jobs import import_job_queue, fail_stale_jobs
+from app.core.sheet_parser import sheet_parser_pool
 from app.models import *
 
 from app.routers.dashboard.routes import dashboard_router as dashboard_router
@@ -30,7 +34,21 @@ from app.routers.reporting.color_kitchen_report import router as color_kitchen_r
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # background refresh of the product_avg_cost materialized view (only when dirty)
+    product_avg_cost_refresher.start()
+    # worker processes for background imports (POST /import/<type>/jobs), after
+    # failing the jobs of processes that are gone (stale heartbeat)
+    fail_stale_jobs()
+    import_job_queue.start()
+    yield
+    sheet_parser_pool.stop()  # started on first multi-sheet parse
+    import_job_queue.stop()
+    product_avg_cost_refresher.stop()
+
+# routes returning plain dicts / lists are rendered with orjson too
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,16 @@
+"""
+Full rebuild / drift check of product_avg_cost_cache and product_cost_history.
+Both are maintained incrementally from purchasing detail changes, run this
+periodically (e.g. nightly cron) to verify them against purchasing_details and repair drift.
+
+    python rebuild_avg_cost_cache.py
+"""
+from app.core.database import engine
+from app.utils.cost_helper import rebuild_avg_cost_cache, rebuild_product_cost_history
+
+if __name__ == "__main__":
+    repaired = rebuild_avg_cost_cache(engine)
+    print(f"Avg cost cache verified, {len(repaired)} product(s) repaired.")
+
+    rebuild_product_cost_history(engine)
+    print("Product cost history rebuilt.")
@@ -0,0 +1,13 @@
+"""
+Full rebuild of purchasing_daily_rollups and color_kitchen_daily_rollups.
+Both are maintained from ORM writes (the days touched by a transaction are recomputed at commit);
+run this after bulk SQL changes to the purchasing / color kitchen tables, or periodically to repair drift.
+
+    python rebuild_daily_rollups.py
+"""
+from app.core.database import engine
+from app.utils.rollup_helper import rebuild_daily_rollups
+
+if __name__ == "__main__":
+    rebuild_daily_rollups(engine)
+    print("Daily rollups rebuilt.")